@@ -0,0 +1,330 @@
+"""
+Contrôle d'admission : refuser tôt (429 + Retry-After) plutôt que saturer le pool pour tout le monde.
+
+Deux niveaux, vérifiés avant tout travail en base :
+1. Délestage par classe de priorité, local au worker (son pool, sa file) :
+     read  (soldes, relevés, historique) : jusqu'à ADMISSION_MAX_INFLIGHT requêtes en cours
+     write (recharges)                   : ADMISSION_WRITE_SHARE de ce plafond, attente pool <= WRITE_MAX_POOL_WAIT
+     bulk  (sync)                        : ADMISSION_BULK_SHARE de ce plafond, attente pool <= BULK_MAX_POOL_WAIT
+   Quand la charge monte, la sync est refusée la première et les lectures de solde passent toujours.
+   L'attente pool est metrics.POOL_WAIT_RECENT (pools chronométrés : METRICS_ENABLED).
+2. Limites par clé (device_id, merchant_pk, numéro) : seau de jetons (débit + rafale) et nombre
+   de requêtes simultanées. L'état vit dans un AdmissionStore : en mémoire par défaut, partagé
+   entre workers avec ADMISSION_SHARED_URL (Redis, dépendance optionnelle comme pour core/cache.py).
+
+Retry-After : temps d'attente d'un jeton, sinon pression (file / plafond, attente pool / seuil),
+avec une gigue de +/- 25 % pour que des milliers de téléphones ne reviennent pas à la même seconde.
+"""
+import math
+import random
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+CLASS_READ = "read"
+CLASS_WRITE = "write"
+CLASS_BULK = "bulk"
+CLASSES = (CLASS_READ, CLASS_WRITE, CLASS_BULK)
+
+SCOPE_DEVICE = "device"
+SCOPE_MERCHANT = "merchant"
+SCOPE_PHONE = "phone"
+
+RETRY_JITTER = 0.25
+
+ADMITTED = metrics.registry.register(metrics.Counter(
+    "rema_admission_admitted_total", "Requêtes admises par le contrôle d'admission", ("class",),
+))
+SHED = metrics.registry.register(metrics.Counter(
+    "rema_admission_shed_total", "Requêtes refusées (429) par classe et motif", ("class", "reason"),
+))
+
+
+class Rejected(HTTPException):
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        seconds = min(settings.ADMISSION_RETRY_AFTER_MAX, max(1, math.ceil(retry_after)))
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Trop de requêtes, réessayez plus tard",
+            headers={"Retry-After": str(seconds)},
+        )
+
+
+# --- MAGASINS (SEAUX DE JETONS + PLACES DE CONCURRENCE) ---
+class AdmissionStore(ABC):
+    """
+    Point d'extension pour partager les limites par clé entre workers.
+    take      : consomme un jeton, renvoie 0 si admis, sinon les secondes avant le prochain jeton
+    acquire   : prend une place parmi `limit` (bail de `ttl` secondes), renvoie un jeton de place ou None
+    release   : rend la place
+    `local` = False : les appels font des I/O, ils passent par le threadpool.
+    """
+
+    local = True
+
+    @abstractmethod
+    def take(self, key: str, rate: float, burst: int) -> float: ...
+
+    @abstractmethod
+    def acquire(self, key: str, limit: int, ttl: float) -> Optional[str]: ...
+
+    @abstractmethod
+    def release(self, key: str, token: str) -> None: ...
+
+
+class MemoryStore(AdmissionStore):
+    """Par worker. Un seau qui a eu le temps de se remplir expire : absent == plein."""
+
+    def __init__(self, maxsize: int):
+        self.buckets = TTLCache(maxsize, ttl=float("inf"))
+        self.slots: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, at = self.buckets.get(key) or (float(burst), now)
+            tokens = min(float(burst), tokens + (now - at) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if wait == 0.0:
+                tokens -= 1
+            self.buckets.set(key, (tokens, now), ttl=(burst - tokens) / rate)
+        return wait
+
+    def acquire(self, key, limit, ttl):
+        with self._lock:
+            used = self.slots.get(key, 0)
+            if used >= limit:
+                return None
+            self.slots[key] = used + 1
+        return key
+
+    def release(self, key, token):
+        with self._lock:
+            used = self.slots.get(key, 0) - 1
+            if used > 0:
+                self.slots[key] = used
+            else:
+                self.slots.pop(key, None)
+
+
+# Scripts Lua : lecture + écriture atomiques, horloge du serveur Redis (commune à tous les workers)
+_TAKE_LUA = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 't', 'at')
+local tokens = tonumber(state[1]) or burst
+local at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 't', tokens, 'at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+_ACQUIRE_LUA = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then return 0 end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[3])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2])) + 1)
+return 1
+"""
+
+
+class RedisStore(AdmissionStore):
+    """Commun à tous les workers. Une place est un membre de sorted set expirant : un worker tué ne la garde pas."""
+
+    local = False
+
+    def __init__(self, url: str):
+        import redis  # Dépendance optionnelle : uniquement si ADMISSION_SHARED_URL est défini
+
+        self.client = redis.Redis.from_url(url)
+        self._take = self.client.register_script(_TAKE_LUA)
+        self._acquire = self.client.register_script(_ACQUIRE_LUA)
+
+    def take(self, key, rate, burst):
+        return float(self._take(keys=[f"rema:adm:bucket:{key}"], args=[rate, burst]))
+
+    def acquire(self, key, limit, ttl):
+        token = uuid.uuid4().hex
+        admitted = self._acquire(keys=[f"rema:adm:slots:{key}"], args=[limit, ttl, token])
+        return token if admitted else None
+
+    def release(self, key, token):
+        self.client.zrem(f"rema:adm:slots:{key}", token)
+
+
+def build_store() -> AdmissionStore:
+    if settings.ADMISSION_SHARED_URL:
+        return RedisStore(settings.ADMISSION_SHARED_URL)
+    return MemoryStore(settings.ADMISSION_MAX_KEYS)
+
+
+store = build_store()
+
+
+# --- DÉLESTAGE PAR CLASSE ---
+_inflight = {klass: 0 for klass in CLASSES}
+
+
+def _limits(klass: str) -> Tuple[int, float]:
+    """(requêtes en cours max, attente pool max) pour une classe."""
+    total = settings.ADMISSION_MAX_INFLIGHT
+    if klass == CLASS_BULK:
+        return max(1, int(total * settings.ADMISSION_BULK_SHARE)), settings.ADMISSION_BULK_MAX_POOL_WAIT
+    if klass == CLASS_WRITE:
+        return max(1, int(total * settings.ADMISSION_WRITE_SHARE)), settings.ADMISSION_WRITE_MAX_POOL_WAIT
+    return total, math.inf
+
+
+def _jitter(seconds: float) -> float:
+    return seconds * random.uniform(1 - RETRY_JITTER, 1 + RETRY_JITTER)
+
+
+def _reject(klass: str, reason: str, retry_after: float) -> Rejected:
+    SHED.inc(klass or "none", reason)
+    return Rejected(reason, _jitter(retry_after))
+
+
+def check_load(klass: str) -> None:
+    """Refus immédiat si la classe est délestée (appelable avant même de lire le corps de la requête)."""
+    if not settings.ADMISSION_ENABLED:
+        return
+    max_inflight, max_wait = _limits(klass)
+    depth = sum(_inflight.values())
+    if depth >= max_inflight:
+        raise _reject(klass, "queue_depth", depth / max_inflight)
+    wait = metrics.POOL_WAIT_RECENT.value()
+    if wait > max_wait:
+        # La moyenne récente décroît de moitié toutes les `half_life` s : temps pour repasser sous le seuil
+        raise _reject(klass, "pool_wait", metrics.POOL_WAIT_RECENT.half_life * math.log2(wait / max_wait))
+
+
+# --- LIMITES PAR CLÉ ---
+def _key_limits(scope: str) -> Tuple[float, int, int]:
+    return {
+        SCOPE_DEVICE: (settings.ADMISSION_DEVICE_RATE, settings.ADMISSION_DEVICE_BURST, settings.ADMISSION_DEVICE_CONCURRENCY),
+        SCOPE_MERCHANT: (settings.ADMISSION_MERCHANT_RATE, settings.ADMISSION_MERCHANT_BURST, settings.ADMISSION_MERCHANT_CONCURRENCY),
+        SCOPE_PHONE: (settings.ADMISSION_PHONE_RATE, settings.ADMISSION_PHONE_BURST, settings.ADMISSION_PHONE_CONCURRENCY),
+    }[scope]
+
+
+def _admit_keys(klass: Optional[str], keys: Dict[str, Optional[str]]) -> List[Tuple[str, str]]:
+    """Jetons puis places, clé par clé. Renvoie les places prises (à rendre) ; lève Rejected sinon."""
+    held: List[Tuple[str, str]] = []
+    try:
+        for scope, value in keys.items():
+            if not value:
+                continue
+            rate, burst, concurrency = _key_limits(scope)
+            key = f"{scope}:{value}"
+            if rate > 0:
+                wait = store.take(key, rate, burst)
+                if wait > 0:
+                    raise _reject(klass, f"rate_{scope}", wait)
+            if concurrency > 0:
+                token = store.acquire(key, concurrency, settings.ADMISSION_LEASE_SECONDS)
+                if token is None:
+                    raise _reject(klass, f"concurrency_{scope}", 1)
+                held.append((key, token))
+    except Exception:
+        _release_keys(held)
+        raise
+    return held
+
+
+def _release_keys(held: List[Tuple[str, str]]) -> None:
+    for key, token in held:
+        store.release(key, token)
+
+
+class Ticket:
+    """Admission accordée : à rendre avec release() (une seule fois) à la fin du travail."""
+
+    def __init__(self, klass: Optional[str], held: List[Tuple[str, str]]):
+        self.klass = klass
+        self.held = held
+        self.released = False
+
+    async def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        if self.klass is not None:
+            _inflight[self.klass] -= 1
+        if self.held:
+            if store.local:
+                _release_keys(self.held)
+            else:
+                await run_in_threadpool(_release_keys, self.held)
+
+
+async def enter(klass: Optional[str], **keys: Optional[str]) -> Ticket:
+    """
+    klass=None : limites par clé seules (ex: dépôt dans la file de jobs, qui absorbe déjà la charge).
+    keys : device=..., merchant=..., phone=...
+    """
+    if not settings.ADMISSION_ENABLED:
+        return Ticket(None, [])
+    if klass is not None:
+        check_load(klass)
+        # Compté dès maintenant : les requêtes qui attendent le magasin partagé pèsent déjà sur la file
+        _inflight[klass] += 1
+    try:
+        held = []
+        if settings.ADMISSION_KEY_LIMITS and keys:
+            held = _admit_keys(klass, keys) if store.local else await run_in_threadpool(_admit_keys, klass, keys)
+    except Exception:
+        if klass is not None:
+            _inflight[klass] -= 1
+        raise
+    ADMITTED.inc(klass or "none")
+    return Ticket(klass, held)
+
+
+@asynccontextmanager
+async def admit(klass: Optional[str], **keys: Optional[str]):
+    ticket = await enter(klass, **keys)
+    try:
+        yield ticket
+    finally:
+        await ticket.release()
+
+
+def stats() -> dict:
+    return {
+        "enabled": settings.ADMISSION_ENABLED,
+        "store": type(store).__name__,
+        "inflight": dict(_inflight),
+        "pool_wait_recent_s": round(metrics.POOL_WAIT_RECENT.value(), 4),
+        "limits": {
+            klass: {"max_inflight": max_inflight, "max_pool_wait_s": None if max_wait == math.inf else max_wait}
+            for klass, (max_inflight, max_wait) in ((klass, _limits(klass)) for klass in CLASSES)
+        },
+    }
+
+
+metrics.registry.register(metrics.GaugeFunc(
+    "rema_admission_inflight", "Requêtes admises en cours, par classe",
+    lambda: {(klass,): count for klass, count in _inflight.items()}, ("class",),
+))
+metrics.registry.register(metrics.GaugeFunc(
+    "rema_admission_pool_wait_recent_seconds", "Attente récente d'une connexion (signal de délestage)",
+    lambda: {(): metrics.POOL_WAIT_RECENT.value()},
+))
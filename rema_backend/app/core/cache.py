@@ -0,0 +1,173 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+
+
+class TTLCache:
+    """
+    Cache LRU borné avec expiration par entrée (thread-safe).
+    Garde des compteurs hits / misses / evictions pour /sys/cache-stats.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# --- BACKEND PARTAGÉ (OPTIONNEL) ---
+class CacheBackend(ABC):
+    """
+    Point d'extension pour un cache commun à tous les workers uvicorn.
+    Une implémentation doit juste fournir get / set / delete sur des dicts JSON,
+    plus clear(prefix) pour vider tout un espace de noms.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    def set(self, key: str, value: dict, ttl: float): ...
+
+    @abstractmethod
+    def delete(self, key: str): ...
+
+    @abstractmethod
+    def clear(self, prefix: str): ...
+
+
+class RedisBackend(CacheBackend):
+    def __init__(self, url: str):
+        import redis  # Dépendance optionnelle : uniquement si CACHE_SHARED_URL est défini
+
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self.client.get(key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key, value, ttl):
+        self.client.set(key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def clear(self, prefix):
+        # SCAN plutôt que KEYS : ne bloque pas Redis sur un gros espace de clés
+        batch = []
+        for key in self.client.scan_iter(match=f"{prefix}*", count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                self.client.delete(*batch)
+                batch.clear()
+        if batch:
+            self.client.delete(*batch)
+
+
+class TwoLevelCache:
+    """
+    L1 = TTLCache local au worker, L2 = backend partagé (si configuré).
+    Une invalidation supprime la clé dans les deux niveaux : les autres workers
+    la relisent depuis L2 (ou la DB) au plus tard à l'expiration de leur L1.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, backend: Optional[CacheBackend] = None):
+        self.name = name
+        self.local = TTLCache(maxsize, ttl)
+        self.backend = backend
+        self.shared_hits = 0
+
+    def _key(self, key) -> str:
+        return f"rema:{self.name}:{key}"
+
+    def get(self, key) -> Optional[dict]:
+        value = self.local.get(key)
+        if value is not None or self.backend is None:
+            return value
+        value = self.backend.get(self._key(key))
+        if value is not None:
+            self.shared_hits += 1
+            self.local.set(key, value)
+        return value
+
+    def set(self, key, value: dict, ttl: Optional[float] = None):
+        self.local.set(key, value, ttl)
+        if self.backend is not None:
+            self.backend.set(self._key(key), value, self.local.ttl if ttl is None else ttl)
+
+    def invalidate(self, key):
+        self.local.delete(key)
+        if self.backend is not None:
+            self.backend.delete(self._key(key))
+
+    def clear(self):
+        # Vide aussi L2 : sinon les autres workers (et celui-ci) y relisent les anciennes valeurs
+        self.local.clear()
+        if self.backend is not None:
+            self.backend.clear(self._key(""))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.local.stats()
+        stats["shared_backend"] = type(self.backend).__name__ if self.backend else None
+        stats["shared_hits"] = self.shared_hits
+        return stats
+
+
+def build_shared_backend() -> Optional[CacheBackend]:
+    if settings.CACHE_SHARED_URL:
+        return RedisBackend(settings.CACHE_SHARED_URL)
+    return None
@@ -25,6 +25,129 @@ class Settings(BaseSettings):
         "*" # Autorise tout le monde (utile pour tester avec le mobile en dev)
     ]
 
+    # BASE DE DONNÉES (Pool de connexions)
+    # DB_ASYNC=true : AsyncEngine (asyncpg / aiosqlite) pour les routes chaudes
+    DB_ASYNC: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30        # Secondes d'attente max pour obtenir une connexion
+    DB_POOL_RECYCLE: int = 1800      # Render coupe les connexions inactives : on les recycle avant
+    DB_POOL_PRE_PING: bool = True
+
+    # RÉPLICAS EN LECTURE (optionnel) : URLs séparées par des virgules
+    # Seules les routes de lecture déclarées (get_read_db / get_read_db_runner) y vont
+    DATABASE_REPLICA_URLS: str = ""
+    REPLICA_HEALTH_INTERVAL_SECONDS: float = 5.0
+    REPLICA_MAX_LAG_SECONDS: float = 10.0   # Au-delà (PostgreSQL), le réplica est mis de côté
+
+    # CACHE D'IDENTITÉ (get_current_user)
+    # On ne met en cache que l'identité (jamais les soldes) : voir app/oauth2.py
+    IDENTITY_CACHE_SIZE: int = 10000
+    IDENTITY_CACHE_TTL: int = 300     # Secondes
+    TOKEN_CACHE_SIZE: int = 10000     # Les tokens décodés expirent avec leur "exp"
+    CACHE_SHARED_URL: str = ""        # ex: redis://localhost:6379/0 (commun à tous les workers)
+
+    # SOLDES
+    # "direct"  : UPDATE conditionnel sur users (par défaut)
+    # "sharded" : les crédits marchands vont dans balance_shards, repliés toutes les N secondes
+    BALANCE_MODE: str = "direct"
+    BALANCE_SHARD_COUNT: int = 16
+    BALANCE_FOLD_INTERVAL_SECONDS: int = 5
+
+    # JOURNAL (LEDGER) : repli périodique du journal dans ledger_snapshots
+    LEDGER_SNAPSHOT_INTERVAL_SECONDS: int = 60
+    # On ne replie que les entrées plus vieilles que ce délai (la queue récente reste lisible)
+    LEDGER_SNAPSHOT_LAG_SECONDS: int = 60
+    # Postgres : attente max du verrou SHARE qui fige le filigrane (sinon le repli saute un tour)
+    LEDGER_SNAPSHOT_LOCK_TIMEOUT_MS: int = 500
+
+    # SYNC OFFLINE (Vérification Ed25519 des paiements remontés par les marchands)
+    # Désactivé par défaut tant que toutes les apps mobiles ne signent pas le même contrat
+    SYNC_VERIFY_SIGNATURES: bool = False
+    SIGNATURE_VERIFY_WORKERS: int = 4       # Threads du pool (libsodium relâche le GIL)
+    SIGNATURE_VERIFY_CHUNK_SIZE: int = 256  # Nb de signatures par tâche envoyée au pool
+    SIGNATURE_KEY_CACHE_SIZE: int = 10000   # Nb de VerifyKey gardées en mémoire
+
+    # FILTRE ANTI-REJEU (Bloom) devant les lookups uuid / nonce
+    REPLAY_FILTER_ENABLED: bool = True
+    REPLAY_FILTER_CAPACITY: int = 10_000_000      # Nb de clés (1 tx = 2 clés : uuid + nonce)
+    REPLAY_FILTER_FP_RATE: float = 0.001          # Taux de faux positifs visé à pleine capacité
+    REPLAY_FILTER_PATH: str = "./rema_replay.bloom"  # Fichier mmap ("" = mémoire seule)
+
+    # PARTITIONS ET ARCHIVE FROIDE (python -m app.services.partitions archive)
+    ARCHIVE_PATH: str = "./rema_archive"    # Segments en colonnes NumPy (mmap), un sous-dossier par mois
+    ARCHIVE_AFTER_DAYS: int = 90            # Un mois entièrement plus vieux que ça (et réglé) est archivable
+    ARCHIVE_SEGMENT_ROWS: int = 250_000     # Lignes max par segment (= par transaction de suppression)
+
+    # RELEVÉS MARCHANDS (GET /merchants/{pk}/settlement, lus dans settlement_rollups)
+    SETTLEMENT_DEFAULT_DAYS: int = 30       # Période servie sans ?from=
+    SETTLEMENT_MAX_DAYS: int = 366          # Période max d'un relevé
+
+    # FILE DE JOBS DE SYNC (POST /transactions/sync -> 202 + GET /transactions/sync/{batch_id})
+    SYNC_ASYNC_JOBS: bool = False           # True : tous les batches passent par la file
+    SYNC_JOBS_DB_PATH: str = "./rema_jobs.db"  # Broker local SQLite (partagé par les workers uvicorn)
+    SYNC_JOB_WORKERS: int = 2               # Tâches asyncio par processus (0 = pas de worker ici), lancées au 1er job si SYNC_ASYNC_JOBS=False
+    SYNC_JOB_POLL_SECONDS: float = 0.5
+    SYNC_JOB_LEASE_SECONDS: int = 300       # Renouvelé par le worker tous les tiers de bail ; expiré = worker mort, job repris
+    SYNC_JOB_MAX_ATTEMPTS: int = 3
+
+    # SCORING ANTI-FRAUDE (à chaque batch synchronisé, cf. services/fraud.py)
+    FRAUD_SCORING_ENABLED: bool = True
+    FRAUD_VELOCITY_WINDOW_MS: int = 60_000          # Fenêtre glissante par payeur
+    FRAUD_VELOCITY_MAX: int = 10                    # Paiements max d'un payeur dans la fenêtre
+    FRAUD_MAX_CLOCK_SKEW_MS: int = 300_000          # Horodatage dans le futur toléré (horloge du téléphone)
+    FRAUD_MAX_OFFLINE_AGE_MS: int = 30 * 86_400_000 # Paiement hors-ligne plus vieux que ça : suspect
+
+    # CONTRÔLE D'ADMISSION (cf. core/admission.py) : 429 + Retry-After avant de toucher au pool
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_INFLIGHT: int = 64              # Requêtes en cours (toutes classes) au-delà desquelles même les lectures attendent
+    ADMISSION_WRITE_SHARE: float = 0.8            # Part de ADMISSION_MAX_INFLIGHT ouverte aux recharges
+    ADMISSION_BULK_SHARE: float = 0.5             # ... et à la sync : le reste est gardé aux lectures de solde
+    ADMISSION_WRITE_MAX_POOL_WAIT: float = 1.0    # Attente récente d'une connexion (s) au-delà de laquelle les recharges sont refusées
+    ADMISSION_BULK_MAX_POOL_WAIT: float = 0.25    # ... et la sync (délestée en premier)
+    ADMISSION_RETRY_AFTER_MAX: int = 60           # Plafond du Retry-After (secondes)
+    ADMISSION_KEY_LIMITS: bool = True             # False : délestage global seul (benchmarks de débit)
+    ADMISSION_DEVICE_RATE: float = 0.5            # Batches / s par device_id (seau de jetons)
+    ADMISSION_DEVICE_BURST: int = 10
+    ADMISSION_DEVICE_CONCURRENCY: int = 1         # Batches d'un même appareil traités en même temps
+    ADMISSION_MERCHANT_RATE: float = 2.0          # Batches / s par merchant_pk (tous ses appareils)
+    ADMISSION_MERCHANT_BURST: int = 30
+    ADMISSION_MERCHANT_CONCURRENCY: int = 4
+    ADMISSION_PHONE_RATE: float = 1.0             # Recharges / s par numéro
+    ADMISSION_PHONE_BURST: int = 5
+    ADMISSION_PHONE_CONCURRENCY: int = 1
+    ADMISSION_MAX_KEYS: int = 100_000             # Seaux gardés en mémoire (magasin local)
+    ADMISSION_LEASE_SECONDS: int = 300            # Place de concurrence reprise si le worker meurt (magasin partagé)
+    ADMISSION_SHARED_URL: str = ""                # ex: redis://localhost:6379/1 : seaux et places communs à tous les workers
+
+    # HACHAGE DES PIN (bcrypt, hors de la boucle asyncio)
+    BCRYPT_ROUNDS: int = 12                 # Facteur de coût : à régler avec benchmarks/bench_hashing.py
+    HASH_WORKERS: int = 2                   # Threads dédiés à bcrypt (ne pas dépasser le nb de coeurs)
+    HASH_MAX_PENDING: int = 64              # Hachages admis (en cours + en attente) avant de refuser
+    HASH_QUEUE_TIMEOUT_SECONDS: float = 5.0 # Attente max d'une place avant de répondre 503
+    HASH_FAILED_CACHE_SIZE: int = 10000     # Échecs de vérification gardés en mémoire
+    HASH_FAILED_CACHE_TTL: int = 60         # Secondes
+
+    # SYNC EN STREAMING (Content-Type: application/x-ndjson)
+    SYNC_STREAM_CHUNK_SIZE: int = 500       # Nb de transactions validées + commitées à la fois
+    SYNC_STREAM_MAX_LINE_BYTES: int = 65536 # Une ligne = une transaction : au-delà, c'est une erreur
+    SYNC_STREAM_MAX_ERRORS: int = 1000      # Taille max de la liste "errors" gardée dans le rapport
+
+    # DÉMARRAGE (cf. core/startup.py, mesure : python main.py --measure-startup)
+    STARTUP_MIGRATE: bool = True            # Sérialisé entre workers (verrou) ; en prod : python -m app.core.migrations au déploiement
+    STARTUP_WARMUP: bool = True             # Pool, caches et filtre chargés avant d'accepter le trafic
+    STARTUP_POOL_PREFILL: int = 4           # Connexions ouvertes d'avance (bornées par DB_POOL_SIZE)
+    STARTUP_KEY_INDEX_WARM: int = 10_000    # Empreintes des marchands les plus actifs chargées dans key_index
+
+    # BENCHMARKS : en-tête X-SQL-Count (nb d'instructions SQL envoyées pendant la requête)
+    SQL_COUNT_HEADER: bool = False
+
+    # MÉTRIQUES (GET /metrics au format Prometheus, cf. core/metrics.py)
+    METRICS_ENABLED: bool = True
+    METRICS_SLOW_REQUEST_SECONDS: float = 1.0   # Au-delà, la requête est gardée dans /sys/slow-traces
+    METRICS_TRACE_SAMPLE_RATE: float = 0.01     # Part des requêtes dont on garde le texte SQL (si lentes)
+    METRICS_TRACE_BUFFER: int = 200             # Nb de traces lentes gardées (les plus récentes)
+
     class Config:
         env_file = ".env"
         # Cette option permet de gérer les majuscules/minuscules
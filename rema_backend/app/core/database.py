@@ -1,33 +1,299 @@
+import asyncio
+import itertools
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import Select
+from starlette.concurrency import run_in_threadpool
+
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import settings
 
 # 1. On récupère l'URL de Render. Si elle n'existe pas, on utilise SQLite par défaut.
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
 # 2. Le petit correctif magique pour PostgreSQL sur Render
-if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
-    SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
+def fix_scheme(url: str) -> str:
+    if url and url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+SQLALCHEMY_DATABASE_URL = fix_scheme(SQLALCHEMY_DATABASE_URL)
 
 # 3. Si aucune URL n'est trouvée (cas de ton PC local), on crée une base SQLite
 if not SQLALCHEMY_DATABASE_URL:
     SQLALCHEMY_DATABASE_URL = "sqlite:///./rema.db"
 
+IS_SQLITE = "sqlite" in SQLALCHEMY_DATABASE_URL
+
 # 4. Configuration du moteur
 connect_args = {}
-if "sqlite" in SQLALCHEMY_DATABASE_URL:
+if IS_SQLITE:
     connect_args = {"check_same_thread": False}
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
+# Réglages du pool (ignorés par SQLite qui gère ses propres pools)
+pool_args = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+if not IS_SQLITE:
+    pool_args.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args=connect_args, **pool_args, **metrics.pool_class_args(SQLALCHEMY_DATABASE_URL)
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+# 5. Mode ASYNC (optionnel) : même base, driver asynchrone
+def to_async_url(url: str) -> str:
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+async_engine = None
+AsyncSessionLocal = None
+if settings.DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        to_async_url(SQLALCHEMY_DATABASE_URL), **pool_args, **metrics.pool_class_args(SQLALCHEMY_DATABASE_URL, is_async=True)
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+# 6. RÉPLICAS EN LECTURE (optionnel)
+class ReplicaPool:
+    """
+    Réplicas en lecture, servis à tour de rôle parmi ceux en bonne santé.
+    La santé est vérifiée en tâche de fond (health_loop) : SELECT 1, plus le retard
+    de réplication sur PostgreSQL. Aucun réplica sain -> les lectures restent sur le primaire.
+    """
+
+    def __init__(self, engines: List[Engine]):
+        self.engines = engines
+        self.healthy = [True] * len(engines)
+        self.errors = [""] * len(engines)
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def pick(self) -> Optional[Engine]:
+        candidates = [engine for engine, ok in zip(self.engines, self.healthy) if ok]
+        if not candidates:
+            return None
+        with self._lock:
+            turn = next(self._turn)
+        return candidates[turn % len(candidates)]
+
+    def _probe(self, engine: Engine) -> None:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            if engine.dialect.name == "postgresql":
+                lag = conn.execute(text(
+                    "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                )).scalar()
+                if lag > settings.REPLICA_MAX_LAG_SECONDS:
+                    raise RuntimeError(f"retard de réplication {lag:.1f}s")
+
+    def check(self) -> None:
+        for i, engine in enumerate(self.engines):
+            try:
+                self._probe(engine)
+                self.healthy[i], self.errors[i] = True, ""
+            except Exception as e:
+                if self.healthy[i]:
+                    print(f"⚠️ Réplica {engine.url.render_as_string(hide_password=True)} écarté : {e}")
+                self.healthy[i], self.errors[i] = False, str(e)
+
+    def stats(self) -> list:
+        return [
+            {"url": engine.url.render_as_string(hide_password=True), "healthy": ok, "error": error}
+            for engine, ok, error in zip(self.engines, self.healthy, self.errors)
+        ]
+
+
+# Clés (ex: numéro de téléphone) écrites récemment : leurs lectures restent sur le primaire
+# le temps que les réplicas rattrapent leur retard (par processus, au mieux)
+recent_writes = TTLCache(maxsize=100_000, ttl=settings.REPLICA_MAX_LAG_SECONDS)
+
+
+class RoutingSession(Session):
+    """
+    Session de lecture : les SELECT partent sur un réplica, jusqu'à la première écriture
+    (flush, INSERT / UPDATE / DELETE, SELECT ... FOR UPDATE). À partir de là, et pour
+    tout le reste de la requête, la session reste collée au primaire (read-your-writes).
+    """
+
+    def __init__(self, *args, replicas: Optional[ReplicaPool] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+        self.sticky_primary = replicas is None
+
+    def use_primary(self) -> None:
+        self.sticky_primary = True
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        if self.sticky_primary:
+            return primary
+        is_plain_read = isinstance(clause, Select) and clause._for_update_arg is None
+        if self._flushing or not is_plain_read:
+            self.sticky_primary = True
+            return primary
+        return self.replicas.pick() or primary
+
+
+def primary_for(db: Session, key) -> None:
+    """Lecture d'une donnée que le client vient peut-être d'écrire : on évite les réplicas."""
+    if isinstance(db, RoutingSession) and recent_writes.get(str(key)):
+        db.use_primary()
+
+
+def mark_written(key) -> None:
+    recent_writes.set(str(key), True)
+
+
+REPLICA_URLS = [fix_scheme(url.strip()) for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+
+replica_pool: Optional[ReplicaPool] = None
+async_replica_pool: Optional[ReplicaPool] = None
+ReadSessionLocal = SessionLocal
+AsyncReadSessionLocal = AsyncSessionLocal
+if REPLICA_URLS:
+    replica_pool = ReplicaPool([
+        create_engine(url, connect_args=connect_args, **pool_args, **metrics.pool_class_args(url))
+        for url in REPLICA_URLS
+    ])
+    ReadSessionLocal = sessionmaker(
+        class_=RoutingSession, autocommit=False, autoflush=False, bind=engine, replicas=replica_pool
+    )
+    if settings.DB_ASYNC:
+        # En async, get_bind doit renvoyer les moteurs synchrones sous-jacents des AsyncEngine.
+        # Mêmes URLs, même ordre : l'état de santé est partagé avec le pool synchrone (seul sondé).
+        async_replica_pool = ReplicaPool([
+            create_async_engine(
+                to_async_url(url), **pool_args, **metrics.pool_class_args(url, is_async=True)
+            ).sync_engine
+            for url in REPLICA_URLS
+        ])
+        async_replica_pool.healthy = replica_pool.healthy
+        async_replica_pool.errors = replica_pool.errors
+        AsyncReadSessionLocal = async_sessionmaker(
+            async_engine, sync_session_class=RoutingSession, replicas=async_replica_pool,
+            autoflush=False, expire_on_commit=False,
+        )
+
+
+def read_engine() -> Engine:
+    """Moteur pour une lecture brute (hors Session), ex: curseur streamé de l'historique."""
+    return (replica_pool.pick() if replica_pool else None) or engine
+
+
+async def health_loop():
+    """Tâche de fond (lifespan) : vérifie les réplicas et met de côté ceux en panne / en retard."""
+    while True:
+        try:
+            if replica_pool is not None:
+                await run_in_threadpool(replica_pool.check)
+        except Exception as e:
+            print(f"⚠️ Vérification des réplicas en échec : {e}")
+        await asyncio.sleep(settings.REPLICA_HEALTH_INTERVAL_SECONDS)
+
+
+# 7. INSTRUMENTATION (/metrics, X-SQL-Count) : hooks SQL sur tous les moteurs, jauges des pools
+if settings.METRICS_ENABLED or settings.SQL_COUNT_HEADER:
+    metrics.install_sql_hooks()
+
+
+def pool_connections() -> dict:
+    engines = [("primary", engine)] + [
+        (f"replica{i}", replica) for i, replica in enumerate(replica_pool.engines if replica_pool else [])
+    ]
+    values = {}
+    for name, eng in engines:
+        pool = eng.pool
+        if hasattr(pool, "checkedout"):   # QueuePool et dérivés
+            values[(name, "checked_out")] = pool.checkedout()
+            values[(name, "idle")] = pool.checkedin()
+    return values
+
+
+metrics.registry.register(metrics.GaugeFunc(
+    "rema_db_pool_connections", "Connexions des pools synchrones", pool_connections, ("engine", "state"),
+))
+
+
 # La fonction que tes routers utilisent
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Variante pour les routes de lecture (GET) : réplicas si configurés
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class DbRunner:
+    """
+    Exécute une fonction métier "fn(db, ...)" écrite avec une Session classique :
+    - mode async : via AsyncSession.run_sync (I/O non bloquant sur l'event loop)
+    - mode sync  : dans le threadpool de Starlette (SQLite en dev)
+    Les routes chaudes restent donc "async def" sans dupliquer leur logique.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.is_async = AsyncSessionLocal is not None
+
+    async def run(self, fn, *args, **kwargs):
+        if self.is_async:
+            return await self.session.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+
+@asynccontextmanager
+async def open_db_runner(read_only: bool = False):
+    """Même chose que get_db_runner, hors requête HTTP (tâches de fond, workers)."""
+    if AsyncSessionLocal is not None:
+        factory = AsyncReadSessionLocal if read_only else AsyncSessionLocal
+        async with factory() as session:
+            yield DbRunner(session)
+    else:
+        db = (ReadSessionLocal if read_only else SessionLocal)()
+        try:
+            yield DbRunner(db)
+        finally:
+            db.close()
+
+
+async def get_db_runner():
+    async with open_db_runner() as runner:
+        yield runner
+
+
+async def get_read_db_runner():
+    """Pour les routes de lecture : réplicas (si configurés) jusqu'à la première écriture."""
+    async with open_db_runner(read_only=True) as runner:
+        yield runner
@@ -0,0 +1,18 @@
+import hashlib
+
+# Empreinte de taille fixe des clés publiques : BLAKE2b sur 32 octets.
+# Les colonnes public_key / *_pubk_hash (texte de longueur variable) ne servent plus aux recherches :
+# tous les lookups passent par les colonnes *_fp, indexées.
+FINGERPRINT_BYTES = 32
+
+
+def fingerprint(public_key: str) -> bytes:
+    return hashlib.blake2b(public_key.encode("utf-8"), digest_size=FINGERPRINT_BYTES).digest()
+
+
+def fingerprint_default(column: str):
+    """Valeur par défaut SQLAlchemy : empreinte calculée depuis une autre colonne du même INSERT."""
+    def compute(context):
+        value = context.get_current_parameters().get(column)
+        return fingerprint(value) if value is not None else None
+    return compute
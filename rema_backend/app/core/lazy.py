@@ -0,0 +1,31 @@
+"""
+Imports différés : le module n'est réellement chargé qu'au premier accès à un de ses attributs.
+Sert aux modules lourds (NumPy via fraud / replay_filter) qui ne sont utiles qu'au premier
+batch synchronisé : le démarrage ne les paie pas, la phase de chauffe (core/startup.py) les
+charge avant d'ouvrir le trafic quand STARTUP_WARMUP est actif.
+"""
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Module déjà importé : renvoyé tel quel. Sinon, un module enregistré mais pas encore exécuté."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+
+def is_loaded(module: ModuleType) -> bool:
+    """False tant qu'un module obtenu par lazy_import n'a pas été touché (ne déclenche pas le chargement)."""
+    return type(module) is ModuleType
@@ -0,0 +1,406 @@
+"""
+Instrumentation du chemin chaud, exposée au format texte Prometheus sur /metrics.
+
+- MetricsMiddleware (ASGI pur) : latence par route (gabarit du chemin, jamais l'URL brute) et,
+  pour chaque requête, nombre et durée des instructions SQL + attente de connexion au pool.
+- Hooks SQLAlchemy sur la classe Engine (before/after_cursor_execute) et pools chronométrés.
+- stage("verify") : durée des étapes du pipeline de sync ; BATCH_SIZE : taille des batches.
+- Requêtes lentes (> METRICS_SLOW_REQUEST_SECONDS) : gardées dans un tampon circulaire, lu sur
+  /sys/slow-traces. Le texte des instructions SQL n'est conservé que pour un échantillon
+  (METRICS_TRACE_SAMPLE_RATE) des requêtes : les autres n'en paient pas le coût.
+
+Coût par requête : quelques perf_counter() et additions, une bissection par observation.
+Les métriques vivent dans le processus : un /metrics par worker uvicorn, agrégés par Prometheus.
+"""
+import bisect
+import math
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import settings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+BATCH_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+MAX_TRACE_STATEMENTS = 50
+MAX_STATEMENT_CHARS = 300
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values]
+        return lines
+
+
+class Histogram:
+    """
+    Compteurs par seau NON cumulés en mémoire (une seule case incrémentée par observation),
+    cumulés au rendu comme l'attend Prometheus (le <= inclusif).
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[tuple, list] = {}    # labels -> [n par seau..., n au-delà, somme]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series[:-1]):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class GaugeFunc:
+    """Jauge lue au moment du rendu : fn() -> {(valeurs de labels): valeur}."""
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], Dict[tuple, float]],
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            values = sorted(self.fn().items())
+        except Exception:
+            return lines
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values]
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return ("\n".join(lines) + "\n").encode()
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    "rema_http_request_duration_seconds", "Durée des requêtes HTTP", LATENCY_BUCKETS, ("method", "route", "status"),
+))
+REQUEST_SQL_STATEMENTS = registry.register(Histogram(
+    "rema_http_request_sql_statements", "Instructions SQL envoyées par requête", COUNT_BUCKETS, ("route",),
+))
+REQUEST_SQL_SECONDS = registry.register(Histogram(
+    "rema_http_request_sql_seconds", "Temps passé en SQL par requête", LATENCY_BUCKETS, ("route",),
+))
+SQL_STATEMENT_SECONDS = registry.register(Histogram(
+    "rema_sql_statement_duration_seconds", "Durée de chaque instruction SQL", SQL_BUCKETS,
+))
+POOL_WAIT_SECONDS = registry.register(Histogram(
+    "rema_db_pool_checkout_seconds", "Attente d'une connexion du pool (ping et ouverture compris)", SQL_BUCKETS,
+))
+SYNC_STAGE_SECONDS = registry.register(Histogram(
+    "rema_sync_stage_duration_seconds", "Durée des étapes du pipeline de sync", LATENCY_BUCKETS, ("stage",),
+))
+BATCH_SIZE = registry.register(Histogram(
+    "rema_sync_batch_size", "Transactions par batch synchronisé", BATCH_BUCKETS, ("source",),
+))
+SLOW_REQUESTS = registry.register(Counter(
+    "rema_http_slow_requests_total", "Requêtes au-delà de METRICS_SLOW_REQUEST_SECONDS", ("route",),
+))
+
+
+# --- CONTEXTE DE LA REQUÊTE EN COURS ---
+class RequestStats:
+    """
+    Posé dans un ContextVar par le middleware. Le threadpool et run_sync travaillent sur une
+    copie du contexte, mais reçoivent le même objet : leurs incréments arrivent bien ici.
+    """
+
+    __slots__ = ("sql_count", "sql_seconds", "pool_wait", "stages", "statements")
+
+    def __init__(self, sampled: bool = False):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.pool_wait = 0.0
+        self.stages: Dict[str, float] = {}
+        self.statements: Optional[list] = [] if sampled else None
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current() -> Optional[RequestStats]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Chronomètre une étape du pipeline de sync (histogramme + détail de la requête en cours)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        SYNC_STAGE_SECONDS.observe(elapsed, name)
+        stats = _current.get()
+        if stats is not None:
+            stats.stages[name] = stats.stages.get(name, 0.0) + elapsed
+
+
+# --- HOOKS SQLALCHEMY ---
+_START_KEY = "rema_statement_start"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+    stats = _current.get()
+    if stats is not None:
+        stats.sql_count += 1
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get(_START_KEY)
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    SQL_STATEMENT_SECONDS.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.sql_seconds += elapsed
+        if stats.statements is not None and len(stats.statements) < MAX_TRACE_STATEMENTS:
+            text = statement[:MAX_STATEMENT_CHARS] + (" [executemany]" if executemany else "")
+            stats.statements.append({"ms": round(elapsed * 1000, 3), "sql": text})
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get(_START_KEY):
+        conn.info[_START_KEY].pop()
+
+
+class RecentAverage:
+    """
+    Moyenne mobile exponentielle qui retombe vers 0 sans nouvel échantillon (demi-vie en secondes) :
+    un pool qui ne sert plus de connexions ne reste pas "saturé" indéfiniment.
+    """
+
+    def __init__(self, half_life: float, alpha: float = 0.2):
+        self.half_life = half_life
+        self.alpha = alpha
+        self._value = 0.0
+        self._at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _decayed(self, now: float) -> float:
+        return self._value * 0.5 ** ((now - self._at) / self.half_life)
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._value = self._decayed(now) * (1 - self.alpha) + value * self.alpha
+            self._at = now
+
+    def value(self) -> float:
+        with self._lock:
+            return self._decayed(time.monotonic())
+
+
+# Attente récente d'une connexion (toutes les connexions du processus) : signal de core/admission.py
+POOL_WAIT_RECENT = RecentAverage(half_life=5.0)
+
+
+def _observe_pool_wait(elapsed: float) -> None:
+    POOL_WAIT_SECONDS.observe(elapsed)
+    POOL_WAIT_RECENT.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.pool_wait += elapsed
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool dont chaque checkout (attente, ping, ouverture éventuelle) est chronométré."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _observe_pool_wait(time.perf_counter() - start)
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _observe_pool_wait(time.perf_counter() - start)
+
+
+def pool_class_args(url: str, is_async: bool = False) -> dict:
+    """poolclass à passer à create_engine (SQLite en mémoire garde le pool choisi par SQLAlchemy)."""
+    parsed = make_url(url)
+    in_memory = parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+    if not settings.METRICS_ENABLED or in_memory:
+        return {}
+    return {"poolclass": TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool}
+
+
+_installed = False
+
+
+def install_sql_hooks() -> None:
+    """Sur la classe Engine : primaire, réplicas et moteurs synchrones sous-jacents des AsyncEngine."""
+    global _installed
+    if _installed:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    _installed = True
+
+
+# --- TRACES DES REQUÊTES LENTES ---
+slow_traces: deque = deque(maxlen=settings.METRICS_TRACE_BUFFER)
+
+
+def _route_of(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+def _record(scope, status: int, elapsed: float, stats: RequestStats) -> None:
+    route = _route_of(scope)
+    REQUEST_SECONDS.observe(elapsed, scope["method"], route, str(status))
+    REQUEST_SQL_STATEMENTS.observe(stats.sql_count, route)
+    REQUEST_SQL_SECONDS.observe(stats.sql_seconds, route)
+    if elapsed < settings.METRICS_SLOW_REQUEST_SECONDS:
+        return
+    SLOW_REQUESTS.inc(route)
+    slow_traces.append({
+        "at": time.time(),
+        "method": scope["method"],
+        "route": route,
+        "path": scope.get("path"),
+        "status": status,
+        "ms": round(elapsed * 1000, 2),
+        "sql_count": stats.sql_count,
+        "sql_ms": round(stats.sql_seconds * 1000, 2),
+        "pool_wait_ms": round(stats.pool_wait * 1000, 2),
+        "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in stats.stages.items()},
+        "statements": stats.statements,     # None : requête hors échantillon
+    })
+
+
+def dump_traces(clear: bool = False) -> List[dict]:
+    traces = list(slow_traces)
+    if clear:
+        slow_traces.clear()
+    return traces
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI pur (pas de BaseHTTPMiddleware : ni tâche ni file par requête).
+    Avec sql_count_header, ajoute X-SQL-Count à la réponse (instructions envoyées avant l'en-tête).
+    """
+
+    def __init__(self, app, sql_count_header: bool = False):
+        self.app = app
+        self.sql_count_header = sql_count_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(sampled=random.random() < settings.METRICS_TRACE_SAMPLE_RATE)
+        token = _current.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.sql_count_header:
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-sql-count", str(stats.sql_count).encode())
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            _record(scope, status, time.perf_counter() - start, stats)
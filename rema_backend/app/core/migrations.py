@@ -0,0 +1,216 @@
+"""
+Migrations légères, idempotentes : python -m app.core.migrations (au déploiement), ou au démarrage
+du serveur si STARTUP_MIGRATE est actif. Rien n'est plus fait à l'import de l'application.
+
+Chaque worker uvicorn passe par le lifespan : les migrations sont sérialisées par un verrou
+(pg_advisory_lock sous PostgreSQL, verrou de fichier à côté de la base SQLite). Le premier
+worker migre, les suivants attendent puis ne trouvent plus rien à faire.
+
+create_all() crée les tables manquantes mais n'ajoute jamais une colonne à une table existante :
+ce module comble ce trou (ALTER TABLE ... ADD COLUMN) puis remplit les nouvelles colonnes par lots.
+"""
+import os
+from contextlib import contextmanager
+from typing import List
+
+from sqlalchemy import bindparam, func, insert, inspect, select, update
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.keys import fingerprint
+from app.models.archive import TransactionArchive
+from app.models.blacklist import BlacklistEntry, BlacklistVersion
+from app.models.settlement import SettlementRollup
+from app.models.transaction import Transaction
+from app.models.user import User
+
+BACKFILL_BATCH_SIZE = 1000
+# Clé du verrou consultatif PostgreSQL (arbitraire, propre à REMA)
+ADVISORY_LOCK_KEY = 0x52454D41
+
+users = User.__table__
+transactions = Transaction.__table__
+rollups = SettlementRollup.__table__
+archives = TransactionArchive.__table__
+blacklist_entries = BlacklistEntry.__table__
+blacklist_version = BlacklistVersion.__table__
+
+
+def add_missing_columns(conn: Connection, table) -> List[str]:
+    """Ajoute (nullable, sans défaut serveur) les colonnes du modèle absentes de la base."""
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+        added.append(column.name)
+    return added
+
+
+def create_missing_indexes(conn: Connection, table) -> None:
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def backfill_user_fingerprints(conn: Connection) -> int:
+    """
+    users.public_key_fp = BLAKE2b(public_key).
+    L'index est unique : si plusieurs comptes partagent une clé (l'inscription ne l'interdisait pas),
+    seul le plus ancien reçoit l'empreinte, les autres restent à NULL et ne sont plus trouvables par clé.
+    """
+    taken = set(conn.execute(select(users.c.public_key_fp).where(users.c.public_key_fp.is_not(None))).scalars())
+    stmt = update(users).where(users.c.id == bindparam("user_id")).values(public_key_fp=bindparam("fp"))
+    done, last_id = 0, 0
+    while True:
+        rows = conn.execute(
+            select(users.c.id, users.c.public_key)
+            .where(users.c.public_key_fp.is_(None), users.c.id > last_id)
+            .order_by(users.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return done
+        last_id = rows[-1].id
+        params = []
+        for user_id, public_key in rows:
+            fp = fingerprint(public_key)
+            if fp in taken:
+                print(f"⚠️ Clé publique en double (user {user_id}) : pas d'empreinte")
+                continue
+            taken.add(fp)
+            params.append({"user_id": user_id, "fp": fp})
+        if params:
+            conn.execute(stmt, params)
+            done += len(params)
+
+
+def backfill_transaction_fingerprints(conn: Connection) -> int:
+    stmt = (
+        update(transactions)
+        .where(transactions.c.id == bindparam("tx_id"))
+        .values(sender_fp=bindparam("s_fp"), receiver_fp=bindparam("r_fp"))
+    )
+    done, last_id = 0, 0
+    while True:
+        rows = conn.execute(
+            select(transactions.c.id, transactions.c.sender_pubk_hash, transactions.c.receiver_pubk_hash)
+            .where(transactions.c.sender_fp.is_(None), transactions.c.id > last_id)
+            .order_by(transactions.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return done
+        last_id = rows[-1].id
+        conn.execute(stmt, [
+            {"tx_id": tx_id, "s_fp": fingerprint(sender), "r_fp": fingerprint(receiver)}
+            for tx_id, sender, receiver in rows
+        ])
+        done += len(rows)
+
+
+def backfill_blacklist_versions(conn: Connection) -> int:
+    """
+    Entrées antérieures au compteur : version = id (l'ancienne version servie aux terminaux,
+    leurs ?since= restent valables), puis le compteur démarre au plus grand des deux.
+    """
+    filled = conn.execute(
+        update(blacklist_entries).where(blacklist_entries.c.version.is_(None)).values(version=blacklist_entries.c.id)
+    ).rowcount
+    if conn.execute(select(blacklist_version.c.id)).first() is None:
+        top = conn.execute(select(func.coalesce(func.max(blacklist_entries.c.version), 0))).scalar()
+        conn.execute(insert(blacklist_version).values(id=1, version=top))
+    return filled
+
+
+def run(engine: Engine) -> None:
+    with engine.begin() as conn:
+        for table in (users, transactions, blacklist_entries):
+            added = add_missing_columns(conn, table)
+            if added:
+                print(f"🛠️ Migration {table.name} : colonnes ajoutées {added}")
+
+    # Un commit par table : un gros historique de transactions ne retient pas le verrou sur users
+    with engine.begin() as conn:
+        filled = backfill_user_fingerprints(conn)
+        create_missing_indexes(conn, users)
+    if filled:
+        print(f"🛠️ Migration users : {filled} empreintes de clé calculées")
+
+    with engine.begin() as conn:
+        filled = backfill_transaction_fingerprints(conn)
+        create_missing_indexes(conn, transactions)
+    if filled:
+        print(f"🛠️ Migration transactions : {filled} empreintes de clé calculées")
+
+    with engine.begin() as conn:
+        filled = backfill_blacklist_versions(conn)
+        create_missing_indexes(conn, blacklist_entries)
+    if filled:
+        print(f"🛠️ Migration blacklist_entries : {filled} versions reprises des ids")
+
+
+def settlement_missing(conn) -> bool:
+    """settlement_rollups vide alors que des paiements existent (table ou archive froide)."""
+    def empty(table) -> bool:
+        return conn.execute(select(table.c[0]).limit(1)).first() is None
+
+    return empty(rollups) and not (empty(transactions) and empty(archives))
+
+
+@contextmanager
+def migration_lock(engine: Engine):
+    """Un seul processus migre à la fois (deux ALTER TABLE ... ADD COLUMN simultanés échouent)."""
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.exec_driver_sql(f"SELECT pg_advisory_lock({ADVISORY_LOCK_KEY})")
+            try:
+                yield
+            finally:
+                conn.exec_driver_sql(f"SELECT pg_advisory_unlock({ADVISORY_LOCK_KEY})")
+        return
+    path = engine.url.database if engine.dialect.name == "sqlite" else None
+    try:
+        import fcntl
+    except ImportError:  # Windows : poste de dev, un seul processus
+        fcntl = None
+    if not path or path == ":memory:" or fcntl is None:
+        yield
+        return
+    with open(f"{os.path.abspath(path)}.migrate.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def migrate_all() -> None:
+    """Tables manquantes, colonnes ajoutées, écritures d'ouverture du journal, puis relevés marchands."""
+    import app.models  # noqa: F401  (enregistre toutes les tables auprès de Base.metadata)
+    from app.core import database
+
+    with migration_lock(database.engine):
+        _migrate_all(database)
+
+
+def _migrate_all(database) -> None:
+    from app.services import ledger
+
+    database.Base.metadata.create_all(bind=database.engine)
+    run(database.engine)
+    # Les comptes antérieurs au journal reçoivent leur écriture d'ouverture (idempotent)
+    with database.SessionLocal() as db:
+        ledger.backfill_opening_entries(db)
+        db.commit()
+    # Historique antérieur aux relevés : recalcul complet, une seule fois (table vide)
+    with database.SessionLocal() as db:
+        if settlement_missing(db):
+            from app.services import settlement  # NumPy : seulement si le recalcul est nécessaire
+
+            filled = settlement.rebuild(db)
+            print(f"🛠️ Migration settlement_rollups : {filled['rollups']} cases calculées")
+
+
+if __name__ == "__main__":
+    migrate_all()
@@ -0,0 +1,33 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson absent : on retombe sur le json standard de Starlette
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Réponse par défaut de l'app (routes sans response_model) : rendu orjson.
+    À déclarer via fastapi.datastructures.Default(...) dans main.py : les routes AVEC
+    response_model gardent ainsi le chemin direct de FastAPI (pydantic -> octets JSON).
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def precompiled(adapter: TypeAdapter, value: Any, status_code: int = 200, headers=None) -> Response:
+    """
+    Sérialise avec un TypeAdapter construit une fois au chargement du module :
+    ni re-validation, ni jsonable_encoder, le JSON sort directement du coeur Rust de pydantic.
+    """
+    return Response(
+        content=adapter.dump_json(value), status_code=status_code, headers=headers, media_type="application/json"
+    )
@@ -2,12 +2,9 @@ from datetime import datetime, timedelta
 from typing import Any, Union
 
 from jose import jwt
-from passlib.context import CryptContext
 
 from app.core.config import settings
-
-# Configuration du hachage (bcrypt)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.services import hashing
 
 def create_access_token(subject: Union[str, Any], expires_delta: timedelta = None) -> str:
     """
@@ -28,11 +25,12 @@ def create_access_token(subject: Union[str, Any], expires_delta: timedelta = Non
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Vérifie si le mot de passe correspond au hash.
+    (Bloquant : dans une route async, préférer `await hashing.verify(...)`.)
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return hashing.verify_sync(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """
     Crypte le mot de passe.
     """
-    return pwd_context.hash(password)
\ No newline at end of file
+    return hashing.hash_sync(password)
\ No newline at end of file
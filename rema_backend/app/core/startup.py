@@ -0,0 +1,199 @@
+"""
+Démarrage à froid, phase par phase.
+
+À l'import (main.py) : aucune requête SQL, et les modules lourds sont différés (core/lazy.py).
+Dans le lifespan, avant d'accepter le trafic :
+  1. migrations (STARTUP_MIGRATE) : create_all, colonnes ajoutées, écritures d'ouverture
+  2. chauffe (STARTUP_WARMUP)     : pool de connexions pré-rempli, blacklist compilée,
+                                    marchands actifs dans key_index, filtre anti-rejeu, NumPy
+Chaque phase est chronométrée dans `timeline` (servie par /sys/startup).
+python main.py --measure-startup joue le démarrage complet et imprime le détail.
+"""
+import asyncio
+import logging
+import re
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import List
+
+STAGE_IMPORT = "import"
+STAGE_LIFESPAN = "lifespan"
+STAGE_REQUEST = "request"
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| *(\S+)")
+
+logger = logging.getLogger(__name__)
+
+
+class Timeline:
+    """Durées des phases du démarrage, dans l'ordre. Le temps zéro est l'import de ce module."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._last = self.origin
+        self.phases: List[dict] = []
+        self.ready_ms = None
+        self.numpy_loaded = None
+
+    def _record(self, stage: str, name: str, start: float, end: float) -> None:
+        self.phases.append({"stage": stage, "name": name, "ms": round((end - start) * 1000, 1)})
+        self._last = end
+
+    def mark(self, name: str) -> None:
+        """Import : la phase `name` va du repère précédent à maintenant."""
+        self._record(STAGE_IMPORT, name, self._last, time.perf_counter())
+
+    @contextmanager
+    def phase(self, name: str, stage: str = STAGE_LIFESPAN):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(stage, name, start, time.perf_counter())
+
+    def ready(self) -> None:
+        self.ready_ms = round((time.perf_counter() - self.origin) * 1000, 1)
+
+    def as_dict(self) -> dict:
+        totals = {}
+        for phase in self.phases:
+            totals[phase["stage"]] = round(totals.get(phase["stage"], 0) + phase["ms"], 1)
+        return {"phases": self.phases, "totals_ms": totals, "ready_ms": self.ready_ms}
+
+
+timeline = Timeline()
+
+
+# --- CHAUFFE ---
+async def _prefill(engine, count: int) -> None:
+    """Ouvre `count` connexions en même temps puis les rend : elles restent dans le pool."""
+    from starlette.concurrency import run_in_threadpool
+
+    connections = await asyncio.gather(*[run_in_threadpool(engine.connect) for _ in range(count)])
+    for conn in connections:
+        conn.close()
+
+
+async def _prefill_async(engine, count: int) -> None:
+    connections = await asyncio.gather(*[engine.connect().start() for _ in range(count)])
+    for conn in connections:
+        await conn.close()
+
+
+def _in_session(fn, *args):
+    from app.core import database
+
+    with database.SessionLocal() as db:
+        return fn(db, *args)
+
+
+def _load_deferred() -> None:
+    from app.services import sync_engine
+
+    # Premier accès à un attribut : exécute le module différé (et importe NumPy)
+    sync_engine.fraud.score
+    sync_engine.replay_filter.get_filter
+    sync_engine.settlement.record
+
+
+async def warm_up() -> None:
+    """
+    Une étape en échec est signalée mais ne bloque pas le démarrage :
+    chaque cache se remplit de toute façon à la première requête qui en a besoin.
+    """
+    from starlette.concurrency import run_in_threadpool
+
+    from app.core import database
+    from app.core.config import settings
+    from app.services import blacklist, key_index, sync_engine
+
+    steps = []
+    count = min(settings.STARTUP_POOL_PREFILL, settings.DB_POOL_SIZE)
+    if count > 0:
+        engines = [database.engine] + (database.replica_pool.engines if database.replica_pool else [])
+        steps.append((f"pool pré-rempli ({count} connexions)",
+                      lambda: asyncio.gather(*[_prefill(engine, count) for engine in engines])))
+        if database.async_engine is not None:
+            steps.append((f"pool async pré-rempli ({count} connexions)",
+                          lambda: _prefill_async(database.async_engine, count)))
+    steps.append(("blacklist compilée", lambda: run_in_threadpool(_in_session, blacklist.get_snapshot)))
+    if settings.STARTUP_KEY_INDEX_WARM > 0:
+        steps.append(("key_index (marchands actifs)", lambda: run_in_threadpool(
+            _in_session, key_index.index.warm, settings.STARTUP_KEY_INDEX_WARM)))
+    steps.append(("modules différés (NumPy)", lambda: run_in_threadpool(_load_deferred)))
+    steps.append(("filtre anti-rejeu", lambda: run_in_threadpool(_in_session, sync_engine.replay_filter.get_filter)))
+
+    for name, step in steps:
+        try:
+            with timeline.phase(name):
+                await step()
+        except Exception:
+            logger.warning("Chauffe '%s' ignorée", name, exc_info=True)
+
+
+async def start() -> None:
+    """Appelé par le lifespan avant toute tâche de fond."""
+    from starlette.concurrency import run_in_threadpool
+
+    from app.core import migrations
+    from app.core.config import settings
+
+    if settings.STARTUP_MIGRATE:
+        with timeline.phase("migrations"):
+            await run_in_threadpool(migrations.migrate_all)
+    if settings.STARTUP_WARMUP:
+        await warm_up()
+    timeline.ready()
+
+
+# --- MESURE : python main.py --measure-startup ---
+def heaviest_imports(module: str = "main", top: int = 12) -> List[tuple]:
+    """Paquets de premier niveau les plus lents à importer (sous-processus propre, -X importtime)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    packages = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, name = int(match.group(1)), match.group(2)
+        root = name.split(".")[0]
+        # La ligne du paquet racine inclut déjà ses sous-modules
+        if name == root and name != module:
+            packages[root] = max(packages.get(root, 0), cumulative)
+    return sorted(((name, us / 1000) for name, us in packages.items()), key=lambda item: -item[1])[:top]
+
+
+async def _boot_and_probe(app) -> None:
+    import httpx
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            for label in ("1re requête GET /", "2e requête GET /"):
+                with timeline.phase(label, stage=STAGE_REQUEST):
+                    await client.get("/")
+        timeline.numpy_loaded = "numpy" in sys.modules
+
+
+def measure(app) -> None:
+    asyncio.run(_boot_and_probe(app))
+    report = timeline.as_dict()
+
+    print(f"{'phase':<46} | {'ms':>8}")
+    print("-" * 57)
+    for stage in (STAGE_IMPORT, STAGE_LIFESPAN, STAGE_REQUEST):
+        for phase in report["phases"]:
+            if phase["stage"] == stage:
+                print(f"{stage + ' : ' + phase['name']:<46} | {phase['ms']:>8.1f}")
+        print(f"{'  total ' + stage:<46} | {report['totals_ms'].get(stage, 0):>8.1f}")
+    print(f"{'prêt à servir (depuis le 1er import)':<46} | {report['ready_ms']:>8.1f}")
+
+    print("\nImports les plus lourds (cumulés, se recoupent : fastapi inclut starlette et pydantic)")
+    for name, ms in heaviest_imports():
+        print(f"  {name:<44} | {ms:>8.1f}")
+    print("\nNumPy chargé avant la 1re requête :", "oui" if timeline.numpy_loaded else "non (STARTUP_WARMUP=false)")
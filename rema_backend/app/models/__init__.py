@@ -1,4 +1,10 @@
 # app/models/__init__.py
 from app.core.database import Base
 from .user import User
-from .transaction import Transaction
\ No newline at end of file
+from .transaction import Transaction
+from .balance_shard import BalanceShard
+from .ledger import LedgerEntry, LedgerSnapshot
+from .sync_checkpoint import SyncCheckpoint
+from .blacklist import BlacklistEntry, BlacklistVersion
+from .archive import TransactionArchive
+from .settlement import SettlementRollup
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class TransactionArchive(Base):
+    """
+    Catalogue des segments d'archive froide (cf. services/archive.py et services/partitions.py).
+    Une ligne = un répertoire de colonnes NumPy, écrit une fois. Ajout seul :
+    max(id) sert de version du catalogue pour les processus qui l'ont en mémoire.
+    """
+    __tablename__ = "transaction_archives"
+
+    id = Column(Integer, primary_key=True)
+    # Partition (mois UTC du timestamp, "YYYY-MM") d'où viennent les lignes
+    partition_key = Column(String(7), nullable=False, index=True)
+    # Chemin du segment, relatif à ARCHIVE_PATH
+    path = Column(String, nullable=False, unique=True)
+    row_count = Column(Integer, nullable=False)
+    min_id = Column(BigInteger, nullable=False)
+    max_id = Column(BigInteger, nullable=False)
+    min_timestamp = Column(BigInteger, nullable=False)
+    max_timestamp = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
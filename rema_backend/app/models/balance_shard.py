@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, BigInteger, ForeignKey
+from app.core.database import Base
+
+class BalanceShard(Base):
+    """
+    Sous-compteur de crédit pour les marchands très sollicités (BALANCE_MODE="sharded").
+    Chaque sync crédite UNE case au hasard au lieu de la ligne "users" du marchand,
+    puis un job replie périodiquement les cases dans users.balance_atomic.
+    """
+    __tablename__ = "balance_shards"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+
+    # Montant crédité mais pas encore replié dans users.balance_atomic
+    pending_atomic = Column(BigInteger, default=0, nullable=False)
@@ -0,0 +1,37 @@
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, LargeBinary
+from sqlalchemy.sql import func
+from app.core.database import Base
+from app.core.keys import FINGERPRINT_BYTES, fingerprint_default
+
+class BlacklistEntry(Base):
+    """
+    Clés publiques que les terminaux hors-ligne doivent refuser.
+    Table en ajout seul. Chaque ajout porte la version de la liste qui l'a introduit
+    (compteur de blacklist_version, cf. services/blacklist.py) : les ids, eux, ne sont pas
+    commités dans l'ordre et ne peuvent pas servir de curseur (?since=).
+    """
+    __tablename__ = "blacklist_entries"
+
+    id = Column(Integer, primary_key=True)
+    public_key = Column(String, nullable=False)
+    public_key_fp = Column(
+        LargeBinary(FINGERPRINT_BYTES), unique=True, nullable=False,
+        default=fingerprint_default("public_key"),
+    )
+    # OVER_BUDGET / DOUBLE_SPEND (cf. services/fraud.py)
+    reason = Column(String(32), nullable=False)
+    # Lecture des ajouts : WHERE version > ? AND version <= ?
+    version = Column(BigInteger, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class BlacklistVersion(Base):
+    """
+    Compteur de version de la blacklist (une seule ligne, id = 1).
+    Incrémenté par UPDATE dans la transaction qui ajoute les clés : le verrou de ligne
+    ordonne les ajouts concurrents, une version n'est visible qu'avec toutes les précédentes.
+    """
+    __tablename__ = "blacklist_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
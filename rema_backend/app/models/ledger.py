@@ -0,0 +1,46 @@
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+# Comptes d'un utilisateur
+ACCOUNT_BANK = "BANK"    # Solde en ligne (users.balance_atomic)
+ACCOUNT_VAULT = "VAULT"  # Réserve hors-ligne du téléphone (users.offline_reserved_atomic)
+
+
+class LedgerEntry(Base):
+    """
+    Journal des mouvements d'argent : INSERT uniquement, jamais d'UPDATE ni de DELETE.
+    Un montant positif crédite le compte, un montant négatif le débite.
+    """
+    __tablename__ = "ledger_entries"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    account = Column(String(8), nullable=False)
+    amount_atomic = Column(BigInteger, nullable=False)
+
+    # OPENING, SIGNUP_BONUS, RECHARGE, OFFLINE_PAYMENT, DEVICE_RESET
+    kind = Column(String(24), nullable=False)
+    # Référence métier (uuid de la transaction offline, etc.)
+    reference = Column(String(64), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Lecture "queue du journal" : WHERE user_id = ? AND account = ? AND id > ?
+        Index("ix_ledger_user_account_id", "user_id", "account", "id"),
+    )
+
+
+class LedgerSnapshot(Base):
+    """
+    Solde matérialisé par compte, replié périodiquement depuis le journal.
+    Solde courant = balance_atomic + SUM(entrées avec id > last_entry_id).
+    """
+    __tablename__ = "ledger_snapshots"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    account = Column(String(8), primary_key=True)
+    balance_atomic = Column(BigInteger, nullable=False, default=0)
+    last_entry_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, BigInteger, LargeBinary
+from app.core.database import Base
+from app.core.keys import FINGERPRINT_BYTES
+
+class SettlementRollup(Base):
+    """
+    Totaux journaliers par marchand, devise et statut (GET /merchants/{pk}/settlement).
+    Mis à jour par la sync dans la même transaction que l'INSERT des paiements
+    (services/settlement.py) : un relevé ne lit jamais la table transactions.
+    """
+    __tablename__ = "settlement_rollups"
+
+    # Empreinte de la clé du marchand (comme transactions.receiver_fp)
+    # Clé primaire dans l'ordre des lectures : WHERE receiver_fp = ? AND day BETWEEN ? AND ?
+    receiver_fp = Column(LargeBinary(FINGERPRINT_BYTES), primary_key=True)
+    # Jour UTC, en jours depuis le 1970-01-01 (timestamp // 86 400 000)
+    day = Column(Integer, primary_key=True)
+    currency_code = Column(Integer, primary_key=True)
+    status = Column(String, primary_key=True)
+
+    tx_count = Column(BigInteger, nullable=False, default=0)
+    amount_atomic = Column(BigInteger, nullable=False, default=0)
+    # Paiements marqués suspects par le scoring anti-fraude (inclus dans les deux totaux ci-dessus)
+    flagged_count = Column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class SyncCheckpoint(Base):
+    """
+    Progression d'un upload en streaming, par batch_id.
+    Mis à jour dans la MÊME transaction que chaque paquet inséré : un upload
+    relancé reprend exactement après le dernier paquet commité.
+    """
+    __tablename__ = "sync_checkpoints"
+
+    batch_id = Column(String(64), primary_key=True)
+    merchant_pk = Column(String, nullable=False)
+
+    # Nb de lignes "transaction" déjà traitées (dans l'ordre du flux)
+    rows_done = Column(Integer, default=0, nullable=False)
+    # Rapport partiel (même format que la réponse de /transactions/sync), en JSON
+    report_json = Column(Text, nullable=False, default="{}")
+
+    # IN_PROGRESS / COMPLETED
+    status = Column(String(16), default="IN_PROGRESS", nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
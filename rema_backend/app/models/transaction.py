@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, BigInteger, Boolean, LargeBinary
+from sqlalchemy import Column, Integer, String, BigInteger, Boolean, Index, LargeBinary
 from sqlalchemy.sql import func
 from app.core.database import Base
+from app.core.keys import FINGERPRINT_BYTES
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -17,6 +18,10 @@ class Transaction(Base):
     # --- CRYPTOGRAPHIE & IDENTITÉ (BODY) ---
     sender_pubk_hash = Column(String, index=True, nullable=False)
     receiver_pubk_hash = Column(String, index=True, nullable=False)
+    # Malgré leur nom, les deux colonnes ci-dessus contiennent les clés brutes :
+    # les empreintes BLAKE2b (taille fixe) sont ici, remplies par sync_engine et par la migration
+    sender_fp = Column(LargeBinary(FINGERPRINT_BYTES), index=True, nullable=True)
+    receiver_fp = Column(LargeBinary(FINGERPRINT_BYTES), index=True, nullable=True)
 
     # [Doc Section 8.1] Amount_Atomic (8 octets - uint64)
     # Stocké en BigInteger.
@@ -47,4 +52,21 @@ class Transaction(Base):
     # 🔥 [NOUVEAU] LA COLONNE B2B POUR VISA / FEDAPAY / NSIA
     # C'est ici qu'on stockera leurs "Order IDs" ou références clients
     # On utilise un String qui contiendra du JSON (ex: '{"order_id": "123"}')
-    metadata_blob = Column(String, nullable=True, default="{}")
\ No newline at end of file
+    metadata_blob = Column(String, nullable=True, default="{}")
+
+    # --- HISTORIQUE (GET /transactions/history) ---
+    # Pagination par curseur sur (empreinte, timestamp, id) : une page profonde coûte
+    # autant que la première. Sur PostgreSQL, INCLUDE rend l'index couvrant (index-only scan).
+    # Partitions (services/partitions.py) : plages de timestamp par mois UTC, lues et archivées
+    # par (timestamp, id) sans parcourir la table.
+    __table_args__ = (
+        Index("ix_transactions_timestamp_id", "timestamp", "id"),
+        Index(
+            "ix_transactions_receiver_fp_ts_id", "receiver_fp", "timestamp", "id",
+            postgresql_include=["transaction_uuid", "sender_pubk_hash", "amount_atomic", "currency_code", "status"],
+        ),
+        Index(
+            "ix_transactions_sender_fp_ts_id", "sender_fp", "timestamp", "id",
+            postgresql_include=["transaction_uuid", "receiver_pubk_hash", "amount_atomic", "currency_code", "status"],
+        ),
+    )
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, BigInteger, DateTime
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, LargeBinary
 from sqlalchemy.sql import func
 from app.core.database import Base
+from app.core.keys import FINGERPRINT_BYTES, fingerprint_default
 
 class User(Base):
     __tablename__ = "users"
@@ -12,6 +13,12 @@ class User(Base):
     full_name = Column(String, nullable=False)
     pin_hash = Column(String, nullable=False)
     public_key = Column(String, nullable=False)
+    # BLAKE2b(public_key) : c'est CETTE colonne qui sert aux recherches (cf. services/key_index.py)
+    # Nullable : les doublons historiques de clé ne reçoivent pas d'empreinte (cf. core/migrations.py)
+    public_key_fp = Column(
+        LargeBinary(FINGERPRINT_BYTES), unique=True, index=True, nullable=True,
+        default=fingerprint_default("public_key"),
+    )
     role = Column(String, default="USER")
     
     # Device ID (Sécurité)
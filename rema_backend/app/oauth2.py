@@ -1,3 +1,5 @@
+import hashlib
+import time
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi import Depends, status, HTTPException
@@ -6,6 +8,8 @@ from sqlalchemy.orm import Session
 
 # 👇 CORRECTION DES IMPORTS ICI
 from app.core import database 
+from app.core.cache import TTLCache, TwoLevelCache, build_shared_backend
+from app.core.config import settings
 from . import schemas, models
 
 # --- CONFIGURATION SÉCURITÉ ---
@@ -15,6 +19,21 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# --- CACHES (évite un aller-retour DB par requête authentifiée) ---
+# Token décodé : clé = sha256(token), valable jusqu'à son "exp"
+token_cache = TTLCache(settings.TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+# Identité (schemas.CurrentUser) : clé = user id, L2 partagé optionnel entre workers
+identity_cache = TwoLevelCache(
+    "identity", settings.IDENTITY_CACHE_SIZE, settings.IDENTITY_CACHE_TTL, build_shared_backend()
+)
+
+def invalidate_user(user_id) -> None:
+    """À appeler après chaque écriture sur un User (signup, recharge, récupération...)."""
+    identity_cache.invalidate(str(user_id))
+
+def cache_stats() -> dict:
+    return {"token": token_cache.stats(), "identity": identity_cache.stats()}
+
 # --- 1. CRÉATION DU TOKEN ---
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -25,6 +44,11 @@ def create_access_token(data: dict):
 
 # --- 2. VÉRIFICATION DU TOKEN ---
 def verify_access_token(token: str, credentials_exception):
+    token_key = hashlib.sha256(token.encode()).hexdigest()
+    token_data = token_cache.get(token_key)
+    if token_data is not None:
+        return token_data
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         id: str = payload.get("user_id")
@@ -33,6 +57,9 @@ def verify_access_token(token: str, credentials_exception):
         token_data = schemas.TokenData(id=str(id))
     except JWTError:
         raise credentials_exception
+
+    # Le token reste en cache jusqu'à son expiration, jamais au-delà
+    token_cache.set(token_key, token_data, ttl=payload.get("exp", 0) - time.time())
     return token_data
 
 # --- 3. RÉCUPÉRATION DE L'UTILISATEUR COURANT ---
@@ -43,7 +70,18 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         headers={"WWW-Authenticate": "Bearer"},
     )
     token_data = verify_access_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token_data.id).first()
+
+    cached = identity_cache.get(token_data.id)
+    if cached is not None:
+        return schemas.CurrentUser(**cached)
+
+    # Colonnes de CurrentUser uniquement (jamais les soldes ni le hash du PIN)
+    user = db.query(models.User).filter(models.User.id == token_data.id).with_entities(
+        *(getattr(models.User, field) for field in schemas.CurrentUser.model_fields)
+    ).first()
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+
+    current_user = schemas.CurrentUser.model_validate(user)
+    identity_cache.set(token_data.id, current_user.model_dump())
+    return current_user
\ No newline at end of file
@@ -1,3 +1,5 @@
+import hmac
+
 from fastapi import APIRouter, Depends, status, HTTPException
 from sqlalchemy.orm import Session
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
@@ -7,13 +9,21 @@ from app import oauth2
 
 # 🔥 IMPORTS CORRIGÉS (Nouvelle Architecture)
 from app.models.user import User
+from app.models.ledger import ACCOUNT_BANK
+from app.services import hashing, key_index, ledger
 from app.schemas.user import UserCreate, UserResponse
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+# bcrypt saturé (tempête de logins) : on fait patienter le client au lieu de bloquer le serveur
+HASHING_BUSY = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Serveur occupé, réessayez dans un instant",
+    headers={"Retry-After": "1"},
+)
+
 # --- INSCRIPTION (SIGNUP) ---
-@router.post('/signup', status_code=status.HTTP_201_CREATED, response_model=UserResponse)
-def signup(user_in: UserCreate, db: Session = Depends(database.get_db)):
+def create_user(db: Session, user_in: UserCreate, pin_hash: str):
     
     # 1. Vérification doublon (Utilisation directe de User)
     existing_user = db.query(User).filter(User.phone_number == user_in.phone_number).first()
@@ -23,11 +33,13 @@ def signup(user_in: UserCreate, db: Session = Depends(database.get_db)):
     # 2. Vérif Clé Publique
     if not user_in.public_key or len(user_in.public_key) < 10:
         raise HTTPException(status_code=400, detail="Clé publique (Identity) manquante")
+    if key_index.key_exists(db, user_in.public_key):
+        raise HTTPException(status_code=400, detail="Cette clé publique est déjà utilisée")
 
     # 3. Création
     new_user = User(
         phone_number=user_in.phone_number,
-        pin_hash=user_in.pin_hash,  
+        pin_hash=pin_hash,  
         full_name=user_in.full_name,
         public_key=user_in.public_key,
         role=user_in.role,
@@ -37,22 +49,61 @@ def signup(user_in: UserCreate, db: Session = Depends(database.get_db)):
     )
     
     db.add(new_user)
+    db.flush()
+    ledger.record(db, new_user.id, ACCOUNT_BANK, new_user.balance_atomic, "SIGNUP_BONUS")
     db.commit()
     db.refresh(new_user)
+    # Un id peut être réutilisé après un reset de la base : on purge le cache d'identité
+    oauth2.invalidate_user(new_user.id)
+    database.mark_written(new_user.phone_number)
     
-    return new_user
+    return UserResponse.model_validate(new_user)
+
+@router.post('/signup', status_code=status.HTTP_201_CREATED, response_model=UserResponse)
+async def signup(user_in: UserCreate, runner: database.DbRunner = Depends(database.get_db_runner)):
+    # bcrypt tourne dans son pool dédié, jamais sur la boucle ni dans une transaction ouverte
+    try:
+        pin_hash = await hashing.hash(user_in.pin_hash)
+    except hashing.HashingBusy:
+        raise HASHING_BUSY
+    return await runner.run(create_user, user_in, pin_hash)
 
 # --- CONNEXION (LOGIN) ---
-@router.post('/login')
-def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+def find_credentials(db: Session, phone_number: str):
     # Utilisation directe de User
-    user = db.query(User).filter(User.phone_number == user_credentials.username).first()
+    return db.query(User.id, User.pin_hash).filter(User.phone_number == phone_number).first()
+
+def store_pin_hash(db: Session, user_id: int, pin_hash: str):
+    db.query(User).filter(User.id == user_id).update({User.pin_hash: pin_hash}, synchronize_session=False)
+    db.commit()
+
+@router.post('/login')
+async def login(
+    user_credentials: OAuth2PasswordRequestForm = Depends(),
+    runner: database.DbRunner = Depends(database.get_db_runner),
+):
+    user = await runner.run(find_credentials, user_credentials.username)
     
     if not user:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Identifiants invalides")
     
-    if user.pin_hash != user_credentials.password:
+    try:
+        if hashing.is_hashed(user.pin_hash):
+            valid = await hashing.verify(user_credentials.password, user.pin_hash)
+            upgrade = valid and hashing.needs_rehash(user.pin_hash)
+        else:
+            # Compte créé avant le hachage : PIN stocké tel quel, haché au premier login réussi
+            valid = hmac.compare_digest(user.pin_hash.encode(), user_credentials.password.encode())
+            upgrade = valid
+    except hashing.HashingBusy:
+        raise HASHING_BUSY
+    if not valid:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Code PIN incorrect")
+    if upgrade:
+        try:
+            await runner.run(store_pin_hash, user.id, await hashing.hash(user_credentials.password))
+        except hashing.HashingBusy:
+            pass  # Le login reste valide : on re-hachera à la prochaine connexion
     
     token = oauth2.create_access_token(data={"user_id": str(user.id)})
-    return {"access_token": token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": token, "token_type": "bearer"}
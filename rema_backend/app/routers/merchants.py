@@ -0,0 +1,49 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app import oauth2
+from app.core import admission, database
+from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.schemas.settlement import SettlementReport
+from app.schemas.user import CurrentUser
+
+# NumPy (recalcul des relevés) : pas à l'import de l'application
+settlement = lazy_import("app.services.settlement")
+
+router = APIRouter(prefix="/merchants", tags=["Merchants"])
+
+
+# --- RELEVÉ JOURNALIER (lu dans settlement_rollups uniquement) ---
+def read_settlement(db: Session, phone: str, public_key: str, first_day: date, last_day: date):
+    # Sync toute récente : le réplica n'a peut-être pas encore les nouveaux totaux
+    database.primary_for(db, phone)
+    return settlement.report(db, public_key, first_day, last_day)
+
+
+@router.get("/{pk}/settlement", response_model=SettlementReport)
+async def get_settlement(
+    pk: str,
+    from_day: Optional[date] = Query(None, alias="from"),
+    to_day: Optional[date] = Query(None, alias="to"),
+    current_user: CurrentUser = Depends(oauth2.get_current_user),
+    runner: database.DbRunner = Depends(database.get_read_db_runner),
+):
+    """
+    Totaux par jour UTC, devise et statut des paiements reçus par le marchand `pk`, bornes incluses
+    (?from=2026-01-01&to=2026-01-31). Sans bornes : les SETTLEMENT_DEFAULT_DAYS derniers jours.
+    Coût constant quelle que soit la taille de l'historique.
+    """
+    if current_user.public_key != pk:
+        raise HTTPException(status_code=403, detail="Relevé réservé au marchand concerné")
+    to_day = to_day or datetime.now(timezone.utc).date()
+    from_day = from_day or to_day - timedelta(days=settings.SETTLEMENT_DEFAULT_DAYS - 1)
+    if from_day > to_day:
+        raise HTTPException(status_code=400, detail="Période invalide (from > to)")
+    if (to_day - from_day).days >= settings.SETTLEMENT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Période limitée à {settings.SETTLEMENT_MAX_DAYS} jours")
+    async with admission.admit(admission.CLASS_READ):
+        return await runner.run(read_settlement, current_user.phone_number, pk, from_day, to_day)
@@ -1,70 +1,186 @@
-import nacl.signing
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError 
-from app.core.database import get_db
+import json
+from functools import partial
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app import oauth2
+from app.core import admission, database, metrics
+from app.core.config import settings
+from app.core.responses import precompiled
 
-from app.models.transaction import Transaction
-from app.models.user import User
+from app.models.sync_checkpoint import SyncCheckpoint
+from app.services import history, signatures, sync_engine, sync_jobs, sync_pipeline, sync_stream, wire_format
 
 # 🔥 CORRECTION IMPORT : On utilise le bon nom défini dans le schéma
-from app.schemas.transaction import TransactionBatchRequest
+from app.schemas.transaction import SYNC_REPORT_ADAPTER, SyncReport, TransactionBatchRequest
+from app.schemas.user import CurrentUser
 
 router = APIRouter(prefix="/transactions", tags=["Transactions"])
 
-# 🔥 CORRECTION TYPE : batch est de type TransactionBatchRequest
-@router.post("/sync")
-def sync_batch_transactions(batch: TransactionBatchRequest, db: Session = Depends(get_db)):
-    print(f"📥 Batch de {len(batch.transactions)} txs")
-    
-    report = {"processed": 0, "failed": 0, "errors": [], "status": "partial_success"}
-    
-    merchant = db.query(User).filter(User.public_key == batch.merchant_pk).first()
-    if not merchant:
-        raise HTTPException(status_code=404, detail="Marchand introuvable")
-
-    for tx in batch.transactions:
-        try:
-            # Idempotence
-            exists = db.query(Transaction).filter(Transaction.transaction_uuid == tx.uuid).first()
-            if exists: continue 
-
-            # Anti-Rejeu
-            nonce_exists = db.query(Transaction).filter(Transaction.nonce == tx.nonce).first()
-            if nonce_exists: continue
-
-            # Accounting
-            sender = db.query(User).filter(User.public_key == tx.sender_pk).first()
-            if sender: sender.offline_reserved_atomic -= tx.amount
-            merchant.balance_atomic += tx.amount
-
-            # Création
-            new_tx = Transaction(
-                transaction_uuid=tx.uuid,
-                protocol_ver=tx.protocol_ver,
-                sender_pubk_hash=tx.sender_pk, 
-                receiver_pubk_hash=batch.merchant_pk,
-                amount_atomic=tx.amount,       
-                currency_code=tx.currency,
-                nonce=tx.nonce,
-                signature=tx.signature,
-                timestamp=tx.timestamp,
-                status="COMPLETED",
-                is_offline_synced=True,
-                metadata_blob=tx.metadata 
-            )
-
-            try:
-                db.add(new_tx)
-                db.commit() 
-                report["processed"] += 1
-            except IntegrityError:
-                db.rollback() 
-                continue 
-
-        except Exception as e:
-            report["failed"] += 1
-            report["errors"].append({"uuid": tx.uuid, "msg": str(e)})
-
-    report["status"] = "success" if report["failed"] == 0 else "partial_success"
-    return report
\ No newline at end of file
+
+def content_type_of(request: Request) -> str:
+    return request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+def wants_async(request: Request) -> bool:
+    # RFC 7240 : le client peut demander un traitement asynchrone avec "Prefer: respond-async"
+    return settings.SYNC_ASYNC_JOBS or "respond-async" in request.headers.get("prefer", "").lower()
+
+
+SYNC_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": TransactionBatchRequest.model_json_schema()},
+            wire_format.CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}},
+            sync_stream.CONTENT_TYPE: {"schema": {"type": "string", "description": "En-tête puis 1 transaction par ligne"}},
+        },
+    }
+}
+
+
+async def stream_sync(request: Request, runner: database.DbRunner) -> dict:
+    """
+    Mode streaming (NDJSON) pour les très gros batches : la 1re ligne est l'en-tête,
+    puis une transaction par ligne. Le corps est lu au fil de l'eau et traité par
+    paquets de SYNC_STREAM_CHUNK_SIZE (mémoire bornée), chaque paquet étant commité
+    avec son checkpoint. Un upload relancé avec le même batch_id reprend là où il s'était arrêté.
+    """
+    lines = sync_stream.iter_lines(request.stream())
+    header = await sync_stream.read_header(lines)
+    async with admission.admit(admission.CLASS_BULK, device=header.device_id, merchant=header.merchant_pk):
+        return await _stream_batch(lines, header, runner)
+
+
+async def _stream_batch(lines, header, runner: database.DbRunner) -> dict:
+    with metrics.stage("lookup"):
+        merchant = await runner.run(sync_pipeline.find_merchant, header.merchant_pk)
+    rows_done, report, completed = await runner.run(sync_stream.load_checkpoint, header)
+    if completed:
+        return report
+
+    tag = signatures.merchant_tag(merchant.phone_number)
+    try:
+        async for seen, chunk in sync_stream.iter_chunks(lines, rows_done, settings.SYNC_STREAM_CHUNK_SIZE):
+            if settings.SYNC_VERIFY_SIGNATURES:
+                with metrics.stage("verify"):
+                    chunk = await run_in_threadpool(signatures.filter_valid, chunk, tag, report)
+            await runner.run(sync_stream.ingest_chunk, merchant, header, chunk, seen, report)
+            rows_done = seen
+
+        metrics.BATCH_SIZE.observe(rows_done, "stream")
+        return await runner.run(sync_stream.complete, header, rows_done, report)
+    except sync_stream.ConcurrentUpload as e:
+        # L'autre upload continue : le client relance plus tard et reprend au checkpoint
+        return e.report
+
+
+async def enqueue_sync(request: Request, response: Response) -> dict:
+    """
+    Mode asynchrone : le batch est persisté dans la file (clé = batch_id) et traité par
+    les workers. Réponse immédiate 202 + job_id. Un batch_id déjà connu renvoie l'état
+    du job existant sans relire ni retraiter quoi que ce soit.
+    """
+    queue = sync_jobs.get_queue()
+
+    # Le client peut annoncer son batch_id en en-tête : le renvoi d'un batch connu
+    # est alors résolu sans même lire le corps
+    known_id = request.headers.get("x-batch-id")
+    if known_id:
+        existing = await run_in_threadpool(queue.get, known_id)
+        if existing is not None:
+            response.status_code = status.HTTP_200_OK
+            return sync_jobs.describe(existing)
+
+    body = await request.body()
+    content_type = content_type_of(request)
+    batch = sync_pipeline.decode_body(content_type, body, sync_engine.new_report())
+    # La file absorbe les pics : seules les limites par appareil / marchand s'appliquent ici
+    async with admission.admit(None, device=batch.device_id, merchant=batch.merchant_pk):
+        job, created = await run_in_threadpool(queue.submit, batch.batch_id, batch.merchant_pk, content_type, body)
+    if job["merchant_pk"] != batch.merchant_pk:
+        raise HTTPException(status_code=409, detail="batch_id déjà utilisé par un autre marchand")
+
+    # Workers démarrés à la demande : rien ne sonde la file tant qu'aucun batch n'y est mis
+    sync_jobs.ensure_workers()
+    response.status_code = status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK
+    response.headers["Location"] = f"{router.prefix}/sync/{batch.batch_id}"
+    return sync_jobs.describe(job)
+
+
+# 🔥 CORRECTION TYPE : le corps est un TransactionBatchRequest (JSON, binaire ou NDJSON)
+@router.post(
+    "/sync",
+    openapi_extra=SYNC_OPENAPI,
+    responses={200: {"model": SyncReport}, 202: {"description": "Batch accepté dans la file"}},
+)
+async def sync_batch_transactions(
+    request: Request, response: Response, runner: database.DbRunner = Depends(database.get_db_runner)
+):
+    content_type = content_type_of(request)
+    if content_type == sync_stream.CONTENT_TYPE:
+        return precompiled(SYNC_REPORT_ADAPTER, await stream_sync(request, runner))
+
+    if wants_async(request):
+        return await enqueue_sync(request, response)
+
+    # Sync délestée : refus avant même de lire le corps (les limites par clé attendent le décodage)
+    admission.check_load(admission.CLASS_BULK)
+    report = sync_engine.new_report()
+    batch = sync_pipeline.decode_body(content_type, await request.body(), report)
+    async with admission.admit(admission.CLASS_BULK, device=batch.device_id, merchant=batch.merchant_pk):
+        report = await sync_pipeline.run_batch(runner, batch, report)
+    return precompiled(SYNC_REPORT_ADAPTER, report)
+
+
+def read_checkpoint(db, batch_id: str):
+    checkpoint = db.get(SyncCheckpoint, batch_id)
+    if checkpoint is None:
+        return None
+    return {
+        "job_id": None,
+        "batch_id": checkpoint.batch_id,
+        "status": "DONE" if checkpoint.status == "COMPLETED" else "RUNNING",
+        "rows_done": checkpoint.rows_done,
+        "report": json.loads(checkpoint.report_json),
+    }
+
+
+# --- SUIVI D'UN BATCH (file de jobs ou upload streaming) ---
+@router.get("/sync/{batch_id}")
+async def get_sync_status(batch_id: str, runner: database.DbRunner = Depends(database.get_db_runner)):
+    job = await run_in_threadpool(sync_jobs.get_queue().get, batch_id)
+    if job is not None:
+        return sync_jobs.describe(job)
+
+    checkpoint = await runner.run(read_checkpoint, batch_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="Batch inconnu")
+    return checkpoint
+
+
+# --- HISTORIQUE (pagination par curseur, réponse streamée) ---
+@router.get("/history")
+async def get_history(
+    direction: Literal["in", "out", "all"] = history.DIRECTION_ALL,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    cursor: Optional[str] = None,
+    limit: int = Query(history.DEFAULT_PAGE_SIZE, ge=1, le=history.MAX_PAGE_SIZE),
+    current_user: CurrentUser = Depends(oauth2.get_current_user),
+):
+    """
+    Transactions de l'utilisateur connecté, les plus récentes d'abord.
+    Pour la page suivante, renvoyer "next_cursor" tel quel dans ?cursor= (null = fin de l'historique).
+    Pas d'OFFSET : la page 10 000 d'un gros marchand coûte autant que la page 1.
+    """
+    try:
+        stmt = history.build_query(current_user.public_key, direction, status_filter, cursor, limit)
+    except history.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Contrôle à l'entrée : la page (<= MAX_PAGE_SIZE lignes) est streamée après le retour de la route
+    admission.check_load(admission.CLASS_READ)
+    # Archive froide lue pendant le rendu, seulement si la table ne suffit pas à remplir la page
+    load_archived = partial(history.archived_rows, current_user.public_key, direction, status_filter, cursor)
+    return StreamingResponse(history.render_page(stmt, limit, load_archived), media_type="application/json")
+
@@ -1,67 +1,144 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
-from app.core import database
-from typing import List
+from app.core import admission, database
+from app import oauth2
+from typing import List, Optional
 
 # Import des modèles et schémas
 from app.models.user import User 
-from app.schemas.user import RechargeRequest, RecoverRequest, UserResponse
+from app.models.ledger import ACCOUNT_BANK, ACCOUNT_VAULT
+from app.services import balances, blacklist, ledger
+from app.schemas.user import BalanceResponse, RechargeRequest, RecoverRequest, UserResponse
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
 # --- 1. VOIR LE SOLDE ---
-@router.get("/{phone}/balance")
-def get_balance(phone: str, db: Session = Depends(database.get_db)):
-    user = db.query(User).filter(User.phone_number == phone).first()
+def read_balance(db: Session, phone: str):
+    # Recharge / sync toute récente : le réplica n'a peut-être pas encore la nouvelle valeur
+    database.primary_for(db, phone)
+    # Deux colonnes seulement : pas d'objet ORM à hydrater (ni à suivre dans la session)
+    user = db.query(User).filter(User.phone_number == phone).with_entities(User.id, User.full_name).first()
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+
+    # Lecture depuis le journal : snapshot + queue (O(1) quel que soit l'historique)
+    accounts = ledger.read_balances(db, user.id)
     
     return {
         "full_name": user.full_name,
-        "balance_atomic": user.balance_atomic,         # Solde BANQUE
-        "offline_vault_atomic": user.offline_reserved_atomic # Solde TÉLÉPHONE (Sync)
+        "balance_atomic": accounts[ACCOUNT_BANK],         # Solde BANQUE
+        "offline_vault_atomic": accounts[ACCOUNT_VAULT]   # Solde TÉLÉPHONE (Sync)
     }
 
-# --- 2. RECHARGER LE TÉLÉPHONE (Correction Mathématique) ---
-@router.post("/recharge-offline")
-def recharge_offline(req: RechargeRequest, db: Session = Depends(database.get_db)):
-    user = db.query(User).filter(User.phone_number == req.phone).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Utilisateur introuvable")
+@router.get("/{phone}/balance", response_model=BalanceResponse)
+async def get_balance(phone: str, runner: database.DbRunner = Depends(database.get_read_db_runner)):
+    # Classe prioritaire : servie tant que le worker n'est pas plein, même quand la sync est délestée
+    async with admission.admit(admission.CLASS_READ):
+        return await runner.run(read_balance, phone)
 
+# --- 2. RECHARGER LE TÉLÉPHONE (Correction Mathématique) ---
+def apply_recharge(db: Session, req: RechargeRequest):
     if req.amount <= 0:
         raise HTTPException(status_code=400, detail="Montant invalide")
     
     # 🔥 CORRECTION CRITIQUE ICI 🔥
-    # Avant: On ajoutait partout (Création d'argent magique)
-    # Maintenant: On retire de la Banque (-) pour mettre dans le Téléphone (+)
-    
-    if user.balance_atomic < req.amount:
+    # On retire de la Banque (-) pour mettre dans le Téléphone (+)
+    # en UN SEUL UPDATE conditionnel : deux recharges simultanées ne peuvent plus
+    # lire le même solde et écraser l'écriture de l'autre.
+    row = balances.move_to_vault(db, req.phone, req.amount)
+    if row is None:
+        db.rollback()
+        if not db.query(User.id).filter(User.phone_number == req.phone).first():
+            raise HTTPException(status_code=404, detail="Utilisateur introuvable")
         raise HTTPException(status_code=400, detail="Solde bancaire insuffisant")
 
-    user.balance_atomic -= req.amount          # On débit la Banque
-    user.offline_reserved_atomic += req.amount # On crédit le "Vault" du téléphone
-
+    ledger.LedgerWriter(db) \
+        .add(row.id, ACCOUNT_BANK, -req.amount, "RECHARGE") \
+        .add(row.id, ACCOUNT_VAULT, req.amount, "RECHARGE") \
+        .flush()
     db.commit()
-    db.refresh(user)
+    oauth2.invalidate_user(row.id)
+    database.mark_written(req.phone)
     
     # On renvoie le nouveau solde BANQUE pour que l'app se mette à jour
-    return {"status": "success", "new_online_balance": user.balance_atomic}
+    return {"status": "success", "new_online_balance": row.balance_atomic}
+
+@router.post("/recharge-offline")
+async def recharge_offline(req: RechargeRequest, runner: database.DbRunner = Depends(database.get_db_runner)):
+    async with admission.admit(admission.CLASS_WRITE, phone=req.phone):
+        return await runner.run(apply_recharge, req)
 
 # --- 3. SÉCURITÉ : BLACKLIST ---
-@router.get("/security/blacklist", response_model=List[str])
-def get_security_blacklist(db: Session = Depends(database.get_db)):
-    return []
+def etag_matches(request: Request, etag: str) -> bool:
+    candidates = request.headers.get("if-none-match", "")
+    return any(c.strip().removeprefix("W/") in (etag, "*") for c in candidates.split(",") if c.strip())
+
+BLACKLIST_OPENAPI = {
+    "responses": {
+        200: {"content": {blacklist.BINARY_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}}}},
+        304: {"description": "Liste inchangée depuis l'ETag envoyé"},
+    }
+}
+
+@router.get("/security/blacklist", response_model=List[str], openapi_extra=BLACKLIST_OPENAPI)
+async def get_security_blacklist(
+    request: Request,
+    since: Optional[int] = None,
+    runner: database.DbRunner = Depends(database.get_read_db_runner),
+):
+    """
+    Clés à refuser hors-ligne (alimentées par le scoring anti-fraude).
+    - ETag fort par version ET par représentation : If-None-Match -> 304 sans corps
+    - ?since=<X-Blacklist-Version déjà connue> -> uniquement les clés ajoutées depuis
+    - Accept: application/vnd.rema.blacklist -> empreintes binaires (voir services/blacklist.py)
+    - Liste complète en JSON : servie pré-compressée si Accept-Encoding contient gzip
+    Aucun encodage n'est fait ici : tout est préparé au changement de version.
+    """
+    snapshot = await runner.run(blacklist.get_snapshot)
+    wants_binary = blacklist.BINARY_CONTENT_TYPE in request.headers.get("accept", "")
+    wants_gzip = "gzip" in request.headers.get("accept-encoding", "")
+
+    headers = {
+        "X-Blacklist-Version": str(snapshot.version),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if wants_binary:
+        variant, media_type = "bin", blacklist.BINARY_CONTENT_TYPE
+    elif since is None and wants_gzip:
+        variant, media_type = "json-gzip", "application/json"
+        headers["Content-Encoding"] = "gzip"
+    else:
+        variant, media_type = "json", "application/json"
+    headers["ETag"] = snapshot.etag(variant, since)
+
+    if etag_matches(request, headers["ETag"]):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+
+    if wants_binary:
+        body = snapshot.binary(since)
+    elif since is not None:
+        body = json.dumps(snapshot.keys_since(since), separators=(",", ":")).encode()
+    elif wants_gzip:
+        body = snapshot.json_gzip
+    else:
+        body = snapshot.json_body
+    return Response(content=body, media_type=media_type, headers=headers)
 
 # --- 4. RÉCUPÉRATION ---
 @router.post("/recover-lost-device")
 def recover_lost_device(req: RecoverRequest, db: Session = Depends(database.get_db)):
-    user = db.query(User).filter(User.phone_number == req.phone).first()
-    if not user: 
-         raise HTTPException(status_code=403, detail="Accès refusé")
-    
     # En cas de perte, on remet l'argent offline vers online (si possible)
     # Pour l'instant, on reset juste le offline pour éviter le vol
-    user.offline_reserved_atomic = 0 
+    reset = balances.reset_vault(db, req.phone)
+    if reset is None: 
+         raise HTTPException(status_code=403, detail="Accès refusé")
+    
+    user_id, removed = reset
+    ledger.record(db, user_id, ACCOUNT_VAULT, -removed, "DEVICE_RESET")
     db.commit()
-    return {"status": "success"}
\ No newline at end of file
+    oauth2.invalidate_user(user_id)
+    database.mark_written(req.phone)
+    return {"status": "success"}
@@ -2,10 +2,13 @@
 
 # 1. On expose les NOUVEAUX Schémas de Transaction (Batch & Payload)
 # On a remplacé TransactionSyncRequest par TransactionBatchRequest
-from .transaction import TransactionBatchRequest, TransactionResponse, SignedPayload
+from .transaction import TransactionBatchRequest, TransactionBatchHeader, TransactionResponse, SignedPayload, SyncReport
 
 # 2. On expose les Schémas d'Authentification (JWT)
 from .token import Token, TokenData
 
 # 3. On expose les Schémas Utilisateurs
-from .user import UserCreate, UserResponse
\ No newline at end of file
+from .user import UserCreate, UserResponse, CurrentUser, BalanceResponse
+
+# 4. On expose les Schémas des relevés marchands
+from .settlement import SettlementReport
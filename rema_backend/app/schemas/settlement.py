@@ -0,0 +1,27 @@
+from datetime import date
+from typing import List
+
+from pydantic import BaseModel
+
+# Relevé marchand (GET /merchants/{pk}/settlement) : montants en unités atomiques
+class SettlementDay(BaseModel):
+    day: date
+    currency_code: int
+    status: str
+    tx_count: int
+    amount_atomic: int
+    flagged_count: int   # Paiements marqués suspects (déjà inclus dans tx_count / amount_atomic)
+
+class SettlementTotal(BaseModel):
+    currency_code: int
+    status: str
+    tx_count: int
+    amount_atomic: int
+    flagged_count: int
+
+class SettlementReport(BaseModel):
+    merchant_pk: str
+    from_day: date
+    to_day: date
+    days: List[SettlementDay]
+    totals: List[SettlementTotal]
@@ -1,5 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter, field_validator
 from typing import List, Optional
+from typing_extensions import TypedDict
+
+# Horodatages acceptés (ms epoch) : 1970-01-01 -> 9999-12-31, bornes de datetime / date.
+# Au-delà, relevés (jour UTC), partitions mensuelles et archive ne sauraient pas les ranger.
+TIMESTAMP_MIN_MS = 0
+TIMESTAMP_MAX_MS = 253_402_300_799_999
+
 
 # ✅ SingleTransaction
 class SingleTransaction(BaseModel):
@@ -14,14 +21,26 @@ class SingleTransaction(BaseModel):
     signature: str      
     type: str = "OFFLINE_PAYMENT"
     metadata: Optional[str] = "{}" 
+    # [Doc Section 8.1] CRC32 (hex) : renseigné UNIQUEMENT par le format binaire, après vérification
+    checksum: Optional[str] = None
 
-# ✅ CORRECTION NOM : TransactionBatchRequest (C'est ce que ton serveur cherche !)
-class TransactionBatchRequest(BaseModel):
+    # En JSON / NDJSON, rien ne permet de vérifier un checksum fourni par le client :
+    # on l'ignore plutôt que de stocker une valeur non contrôlée dans integrity_checksum
+    @field_validator("checksum", mode="before")
+    @classmethod
+    def _ignore_client_checksum(cls, value):
+        return None
+
+# En-tête d'un batch (1re ligne du mode streaming NDJSON)
+class TransactionBatchHeader(BaseModel):
     merchant_pk: str        
     batch_id: str
     device_id: str
     count: int
     sync_timestamp: str
+
+# ✅ CORRECTION NOM : TransactionBatchRequest (C'est ce que ton serveur cherche !)
+class TransactionBatchRequest(TransactionBatchHeader):
     transactions: List[SingleTransaction]
 
 # ✅ AJOUT : Ces classes sont souvent requises par d'autres fichiers (oauth2)
@@ -31,4 +50,20 @@ class TransactionResponse(BaseModel):
 
 class SignedPayload(BaseModel):
     payload: str
-    signature: str
\ No newline at end of file
+    signature: str
+
+# ✅ Rapport de sync (réponse de POST /transactions/sync et des jobs)
+# TypedDict + TypeAdapter : le rapport reste un dict côté moteur, sérialisé sans modèle intermédiaire
+class SyncError(TypedDict):
+    uuid: Optional[str]
+    msg: str
+
+class SyncReport(TypedDict):
+    processed: int
+    failed: int
+    flagged: int
+    errors: List[SyncError]
+    status: str
+
+SYNC_REPORT_ADAPTER = TypeAdapter(SyncReport)
+
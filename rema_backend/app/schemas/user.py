@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Optional
 
 class UserCreate(BaseModel):
     phone_number: str = Field(..., description="Format international sans +")
@@ -21,6 +22,25 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Solde (GET /users/{phone}/balance) : sérialisé directement en octets JSON par FastAPI
+class BalanceResponse(BaseModel):
+    full_name: str
+    balance_atomic: int          # Solde BANQUE
+    offline_vault_atomic: int    # Solde TÉLÉPHONE (Sync)
+
+# Identité de l'utilisateur connecté (mise en cache par oauth2.get_current_user)
+# ⚠️ Pas de solde ici : les soldes se lisent TOUJOURS en base
+class CurrentUser(BaseModel):
+    id: int
+    phone_number: str
+    full_name: str
+    role: Optional[str] = None
+    public_key: str
+    device_hardware_id: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
 # 🔥 CORRECTION CRITIQUE POUR LA RECHARGE
 # Flutter envoie: { "amount": X, "phone": Y }
 # Donc ici, on doit avoir 'phone', PAS 'phone_number'
@@ -0,0 +1,2 @@
+# app/services/__init__.py
+# Moteurs métier partagés par les routers (ingestion, vérification, ...)
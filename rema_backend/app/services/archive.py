@@ -0,0 +1,402 @@
+"""
+Archive froide des transactions : segments en colonnes NumPy, lus en mmap.
+
+Un segment est un répertoire <ARCHIVE_PATH>/<YYYY-MM>/seg-<min_id>-<max_id>/, écrit une fois :
+  meta.json                     nb de lignes, bornes, encodage de chaque colonne
+  <col>.npy                     colonnes numériques (id, timestamp, montant, devise, version, drapeaux)
+  <col>.codes.npy + <col>.dict.*
+                                colonnes à dictionnaire : clés publiques (un marchand, des milliers
+                                de lignes) et statut -> un code uint32 par ligne
+  <col>.bin + <col>.off.npy     chaînes de longueur variable, en octets bruts quand c'est de
+                                l'hexadécimal (signature, nonce : moitié de la taille)
+  <col>.npy (n x 16 octets)     chaînes UUID canoniques
+  <col>.null.npy                masque des NULL (colonnes qui en contiennent)
+  uuid.hash.npy / uuid.pos.npy, nonce.hash.npy / nonce.pos.npy
+                                index anti-rejeu : empreintes 64 bits triées + ligne d'origine.
+                                Une empreinte trouvée est confirmée sur la valeur exacte.
+
+Pas de compression générique : elle interdirait le mmap. Ouvrir un segment ne lit que meta.json,
+une recherche (bissection) ne touche que quelques pages.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid as uuid_lib
+from collections import namedtuple
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.models.archive import TransactionArchive
+
+FORMAT = "rema-archive-1"
+
+FLAG_OFFLINE_SYNCED = 1
+FLAG_SUSPICIOUS = 2
+
+NUMERIC_COLUMNS = {
+    "id": np.int64,
+    "timestamp": np.int64,
+    "amount_atomic": np.int64,
+    "currency_code": np.int32,
+    "protocol_ver": np.int16,
+}
+DICTIONARY_COLUMNS = ("sender_pubk_hash", "receiver_pubk_hash", "status")
+STRING_COLUMNS = ("transaction_uuid", "nonce", "signature", "integrity_checksum", "metadata_blob")
+# Index anti-rejeu : nom court -> colonne
+KEY_COLUMNS = {"uuid": "transaction_uuid", "nonce": "nonce"}
+
+catalog = TransactionArchive.__table__
+
+# Ligne d'historique servie depuis l'archive : mêmes champs que history._side
+HistoryRow = namedtuple(
+    "HistoryRow",
+    ["id", "timestamp", "transaction_uuid", "counterparty", "amount_atomic", "currency_code", "status", "direction"],
+)
+
+
+def _hash64(values: Sequence[str]) -> np.ndarray:
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(v.encode(), digest_size=8).digest(), "little") for v in values),
+        dtype=np.uint64, count=len(values),
+    )
+
+
+# --- ÉCRITURE ---
+def _is_uuid(value: str) -> bool:
+    try:
+        return str(uuid_lib.UUID(value)) == value
+    except (ValueError, AttributeError, TypeError):
+        return False
+
+
+def _is_hex(value: str) -> bool:
+    try:
+        return bytes.fromhex(value).hex() == value
+    except (ValueError, TypeError):
+        return False
+
+
+def _encode_strings(values: Sequence[Optional[str]]) -> Tuple[str, Dict[str, np.ndarray]]:
+    """Choisit l'encodage le plus compact qui redonne EXACTEMENT les chaînes d'origine."""
+    present = [v for v in values if v is not None]
+    arrays: Dict[str, np.ndarray] = {}
+    if len(present) < len(values):
+        arrays["null"] = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+
+    if present and all(_is_uuid(v) for v in present):
+        raw = b"".join(uuid_lib.UUID(v).bytes if v is not None else bytes(16) for v in values)
+        arrays[""] = np.frombuffer(raw, dtype=np.uint8).reshape(len(values), 16)
+        return "uuid", arrays
+
+    if present and all(_is_hex(v) for v in present):
+        encoding, parts = "hex", [bytes.fromhex(v) if v is not None else b"" for v in values]
+    else:
+        encoding, parts = "utf8", [v.encode() if v is not None else b"" for v in values]
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in parts], out=offsets[1:])
+    arrays["bin"] = np.frombuffer(b"".join(parts), dtype=np.uint8)
+    arrays["off"] = offsets
+    return encoding, arrays
+
+
+def _save(path: str, array: np.ndarray) -> None:
+    with open(path, "wb") as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_segment(rows: Sequence, directory: str) -> dict:
+    """
+    Écrit les lignes (mappings avec les colonnes de transactions) dans `directory`.
+    Le répertoire n'apparaît qu'une fois complet (écriture à côté puis renommage atomique).
+    """
+    n = len(rows)
+    tmp = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    encodings = {}
+    for name, dtype in NUMERIC_COLUMNS.items():
+        _save(os.path.join(tmp, f"{name}.npy"), np.array([row[name] or 0 for row in rows], dtype=dtype))
+
+    flags = np.fromiter(
+        ((FLAG_OFFLINE_SYNCED if row["is_offline_synced"] else 0) | (FLAG_SUSPICIOUS if row["is_flagged_suspicious"] else 0)
+         for row in rows), dtype=np.uint8, count=n,
+    )
+    _save(os.path.join(tmp, "flags.npy"), flags)
+
+    for name in DICTIONARY_COLUMNS:
+        codes: Dict[Optional[str], int] = {}
+        column = np.fromiter((codes.setdefault(row[name], len(codes)) for row in rows), dtype=np.uint32, count=n)
+        _save(os.path.join(tmp, f"{name}.codes.npy"), column)
+        encoding, arrays = _encode_strings(list(codes))
+        for suffix, array in arrays.items():
+            _save(os.path.join(tmp, f"{name}.dict{'.' + suffix if suffix else ''}.npy"), array)
+        encodings[name] = {"kind": "dictionary", "encoding": encoding, "size": len(codes)}
+
+    for name in STRING_COLUMNS:
+        encoding, arrays = _encode_strings([row[name] for row in rows])
+        for suffix, array in arrays.items():
+            _save(os.path.join(tmp, f"{name}{'.' + suffix if suffix else ''}.npy"), array)
+        encodings[name] = {"kind": "string", "encoding": encoding}
+
+    for short, name in KEY_COLUMNS.items():
+        hashes = _hash64([row[name] for row in rows])
+        order = np.argsort(hashes, kind="stable")
+        _save(os.path.join(tmp, f"{short}.hash.npy"), hashes[order])
+        _save(os.path.join(tmp, f"{short}.pos.npy"), order.astype(np.uint32))
+
+    ids = [row["id"] for row in rows]
+    timestamps = [row["timestamp"] or 0 for row in rows]
+    meta = {
+        "format": FORMAT,
+        "rows": n,
+        "min_id": min(ids), "max_id": max(ids),
+        "min_timestamp": min(timestamps), "max_timestamp": max(timestamps),
+        "columns": encodings,
+    }
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, directory)
+    return meta
+
+
+# --- LECTURE ---
+class Segment:
+    """Un segment ouvert : les colonnes sont mappées à la demande et gardées ouvertes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self.min_timestamp = self.meta["min_timestamp"]
+        self.max_timestamp = self.meta["max_timestamp"]
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._dicts: Dict[str, List[Optional[str]]] = {}
+        self._codes_by_value: Dict[str, Dict[Optional[str], int]] = {}
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def array(self, name: str) -> np.ndarray:
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        return array
+
+    def _has(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self.path, f"{name}.npy"))
+
+    def _strings(self, prefix: str, encoding: str, positions: Sequence[int]) -> List[Optional[str]]:
+        nulls = self.array(f"{prefix}.null") if self._has(f"{prefix}.null") else None
+        out: List[Optional[str]] = []
+        if encoding == "uuid":
+            raw = self.array(prefix)
+            for pos in positions:
+                out.append(None if nulls is not None and nulls[pos] else str(uuid_lib.UUID(bytes=raw[pos].tobytes())))
+            return out
+        blob, offsets = self.array(f"{prefix}.bin"), self.array(f"{prefix}.off")
+        for pos in positions:
+            if nulls is not None and nulls[pos]:
+                out.append(None)
+                continue
+            chunk = blob[offsets[pos]:offsets[pos + 1]].tobytes()
+            out.append(chunk.hex() if encoding == "hex" else chunk.decode())
+        return out
+
+    def dictionary(self, name: str) -> List[Optional[str]]:
+        values = self._dicts.get(name)
+        if values is None:
+            spec = self.meta["columns"][name]
+            values = self._dicts[name] = self._strings(f"{name}.dict", spec["encoding"], range(spec["size"]))
+        return values
+
+    def code_of(self, name: str, value: str) -> Optional[int]:
+        codes = self._codes_by_value.get(name)
+        if codes is None:
+            codes = self._codes_by_value[name] = {v: i for i, v in enumerate(self.dictionary(name))}
+        return codes.get(value)
+
+    def positions_of(self, name: str, code: int) -> np.ndarray:
+        """
+        Lignes dont la colonne à dictionnaire vaut `code` : tri des codes fait une fois par
+        processus et par segment, puis deux bissections par lecture (pas de masque sur tout le segment).
+        """
+        postings = self._postings.get(name)
+        if postings is None:
+            order = np.argsort(self.array(f"{name}.codes"), kind="stable")
+            postings = self._postings[name] = (np.asarray(self.array(f"{name}.codes"))[order], order)
+        codes, order = postings
+        return order[np.searchsorted(codes, code, side="left"):np.searchsorted(codes, code, side="right")]
+
+    def values(self, name: str, positions: Sequence[int]) -> list:
+        if name in NUMERIC_COLUMNS:
+            column = self.array(name)
+            return [int(column[pos]) for pos in positions]
+        if name in ("is_offline_synced", "is_flagged_suspicious"):
+            bit = FLAG_OFFLINE_SYNCED if name == "is_offline_synced" else FLAG_SUSPICIOUS
+            flags = self.array("flags")
+            return [bool(flags[pos] & bit) for pos in positions]
+        spec = self.meta["columns"][name]
+        if spec["kind"] == "dictionary":
+            values, codes = self.dictionary(name), self.array(f"{name}.codes")
+            return [values[codes[pos]] for pos in positions]
+        return self._strings(name, spec["encoding"], positions)
+
+    def rows_at(self, positions: Sequence[int], columns: Sequence[str]) -> List[dict]:
+        data = {name: self.values(name, positions) for name in columns}
+        return [{name: data[name][i] for name in columns} for i in range(len(positions))]
+
+    def locate(self, short: str, values: Sequence[str]) -> Dict[str, int]:
+        """Ligne de chaque valeur (uuid ou nonce) présente : bissection sur les empreintes + confirmation exacte."""
+        if not values:
+            return {}
+        hashes, positions = self.array(f"{short}.hash"), self.array(f"{short}.pos")
+        wanted = _hash64(values)
+        start = np.searchsorted(hashes, wanted, side="left")
+        found = {}
+        column = KEY_COLUMNS[short]
+        for value, h, i in zip(values, wanted, start):
+            while i < len(hashes) and hashes[i] == h:
+                pos = int(positions[i])
+                if self.values(column, [pos])[0] == value:
+                    found[value] = pos
+                    break
+                i += 1
+        return found
+
+    def find(self, short: str, values: Sequence[str]) -> Set[str]:
+        return set(self.locate(short, values))
+
+    def history(self, side_column: str, key: str, direction: str, counterparty_column: str,
+                status: Optional[str], after: Optional[Tuple[int, int]], limit: int) -> List[HistoryRow]:
+        code = self.code_of(side_column, key)
+        if code is None:
+            return []
+        matches = self.positions_of(side_column, code)
+        if status:
+            status_code = self.code_of("status", status)
+            if status_code is None:
+                return []
+            matches = matches[np.asarray(self.array("status.codes"))[matches] == status_code]
+        ts, ids = np.asarray(self.array("timestamp")), np.asarray(self.array("id"))
+        if after is not None:
+            matches = matches[(ts[matches] < after[0]) | ((ts[matches] == after[0]) & (ids[matches] < after[1]))]
+        if len(matches) == 0:
+            return []
+        # (timestamp, id) décroissants, comme l'index de l'historique
+        order = np.lexsort((ids[matches], ts[matches]))[::-1][:limit]
+        picked = [int(p) for p in matches[order]]
+        columns = ("id", "timestamp", "transaction_uuid", counterparty_column, "amount_atomic", "currency_code", "status")
+        return [
+            HistoryRow(row["id"], row["timestamp"], row["transaction_uuid"], row[counterparty_column],
+                       row["amount_atomic"], row["currency_code"], row["status"], direction)
+            for row in self.rows_at(picked, columns)
+        ]
+
+
+class ArchiveStore:
+    """
+    Segments connus du processus, rechargés quand le catalogue change (max(id), comme la blacklist).
+    Les segments sont immuables : ajout seul, sans verrou côté lecteurs.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.version = 0
+        self.segments: List[Segment] = []
+        self._lock = threading.Lock()
+
+    def refresh(self, db) -> List[Segment]:
+        version = db.execute(select(func.max(catalog.c.id))).scalar() or 0
+        if version == self.version:
+            return self.segments
+        with self._lock:
+            segments = self.segments if version > self.version else []
+            start = self.version if version > self.version else 0
+            rows = db.execute(
+                select(catalog.c.id, catalog.c.path).where(catalog.c.id > start).order_by(catalog.c.id)
+            ).all()
+            segments = segments + [Segment(os.path.join(self.root, row.path)) for row in rows]
+            self.segments, self.version = segments, version
+        return self.segments
+
+    def reset(self) -> None:
+        with self._lock:
+            self.segments, self.version = [], 0
+
+    def stats(self) -> dict:
+        segments = self.segments
+        return {"version": self.version, "segments": len(segments), "rows": sum(s.rows for s in segments)}
+
+
+store = ArchiveStore(settings.ARCHIVE_PATH)
+
+
+def find_existing(db, uuids: List[str], nonces: List[str]) -> Tuple[Set[str], Set[str]]:
+    """Anti-rejeu : uuid et nonces déjà présents dans l'archive (appelé à chaque batch, sans préfiltre)."""
+    if not uuids and not nonces:
+        return set(), set()
+    found_uuids, found_nonces = set(), set()
+    for segment in store.refresh(db):
+        found_uuids |= segment.find("uuid", uuids)
+        found_nonces |= segment.find("nonce", nonces)
+    return found_uuids, found_nonces
+
+
+def iter_replay_keys(db) -> Iterator[Tuple[List[str], List[str]]]:
+    """(uuids, nonces) de chaque segment, pour reconstruire le filtre anti-rejeu."""
+    for segment in store.refresh(db):
+        positions = range(segment.rows)
+        yield segment.values("transaction_uuid", positions), segment.values("nonce", positions)
+
+
+def history_rows(db, side_column: str, key: str, direction: str, counterparty_column: str,
+                 status: Optional[str], after: Optional[Tuple[int, int]], limit: int) -> List[HistoryRow]:
+    """
+    Segments parcourus du plus récent au plus ancien (max_timestamp). Sont sautés : ceux
+    entièrement plus récents que le curseur, puis, dès que la page est pleine, tous ceux qui
+    ne peuvent plus y entrer.
+    """
+    segments = sorted(
+        (s for s in store.refresh(db) if after is None or s.min_timestamp <= after[0]),
+        key=lambda s: s.max_timestamp, reverse=True,
+    )
+    rows: List[HistoryRow] = []
+    for segment in segments:
+        if len(rows) >= limit and segment.max_timestamp < rows[-1].timestamp:
+            break
+        rows += segment.history(side_column, key, direction, counterparty_column, status, after, limit)
+        rows.sort(key=lambda row: (row.timestamp, row.id), reverse=True)
+        del rows[limit:]
+    return rows
+
+
+def scan(db, uuid: Optional[str] = None, sender_pk: Optional[str] = None, receiver_pk: Optional[str] = None,
+         limit: int = 100) -> List[dict]:
+    """Lecture d'audit : lignes complètes, par uuid ou par clé de payeur / marchand."""
+    columns = list(NUMERIC_COLUMNS) + list(DICTIONARY_COLUMNS) + list(STRING_COLUMNS) + \
+        ["is_offline_synced", "is_flagged_suspicious"]
+    out: List[dict] = []
+    for segment in store.refresh(db):
+        if uuid is not None:
+            candidates = np.array(list(segment.locate("uuid", [uuid]).values()), dtype=np.int64)
+        else:
+            candidates = np.arange(segment.rows)
+        for column, key in (("sender_pubk_hash", sender_pk), ("receiver_pubk_hash", receiver_pk)):
+            if key is not None and len(candidates):
+                code = segment.code_of(column, key)
+                codes = np.asarray(segment.array(f"{column}.codes"))
+                candidates = candidates[:0] if code is None else candidates[codes[candidates] == code]
+        positions = [int(p) for p in candidates[:limit - len(out)]]
+        out += segment.rows_at(positions, columns)
+        if len(out) >= limit:
+            break
+    return out
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import random
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.balance_shard import BalanceShard
+from app.models.user import User
+
+users_table = User.__table__
+shards_table = BalanceShard.__table__
+
+logger = logging.getLogger(__name__)
+
+
+def sharding_enabled() -> bool:
+    return settings.BALANCE_MODE == "sharded"
+
+
+# --- 1. RECHARGE : BANQUE -> VAULT (UN SEUL UPDATE CONDITIONNEL) ---
+def move_to_vault(db: Session, phone: str, amount: int):
+    """
+    Débit Banque / crédit Vault en une instruction :
+    UPDATE users SET balance = balance - :amt, vault = vault + :amt
+    WHERE phone = :phone AND balance >= :amt RETURNING id, balance
+    Pas de lecture préalable, donc pas de mise à jour perdue ni de verrou applicatif.
+    Renvoie None si l'utilisateur n'existe pas OU si le solde est insuffisant.
+    """
+    stmt = (
+        update(users_table)
+        .where(users_table.c.phone_number == phone, users_table.c.balance_atomic >= amount)
+        .values(
+            balance_atomic=users_table.c.balance_atomic - amount,
+            offline_reserved_atomic=users_table.c.offline_reserved_atomic + amount,
+        )
+        .returning(users_table.c.id, users_table.c.balance_atomic)
+    )
+    row = db.execute(stmt).first()
+    if row is None and sharding_enabled():
+        # Le solde peut être "en attente" dans les shards : on replie ce compte et on réessaie
+        user_id = db.execute(select(users_table.c.id).where(users_table.c.phone_number == phone)).scalar()
+        if user_id is not None and fold_shards(db, user_id=user_id):
+            row = db.execute(stmt).first()
+    return row
+
+
+def reset_vault(db: Session, phone: str) -> Optional[Tuple[int, int]]:
+    """
+    Remise à zéro du Vault (appareil perdu) par compare-and-set : on ne met à 0 que la
+    valeur lue, pour que l'écriture au journal corresponde exactement au montant retiré.
+    Renvoie (id, montant retiré) ou None si l'utilisateur n'existe pas.
+    """
+    while True:
+        row = db.execute(
+            select(users_table.c.id, users_table.c.offline_reserved_atomic).where(users_table.c.phone_number == phone)
+        ).first()
+        if row is None:
+            return None
+        done = db.execute(
+            update(users_table)
+            .where(users_table.c.id == row.id, users_table.c.offline_reserved_atomic == row.offline_reserved_atomic)
+            .values(offline_reserved_atomic=0)
+            .returning(users_table.c.id)
+        ).first()
+        if done is not None:
+            return row.id, row.offline_reserved_atomic
+
+
+# --- 2. SYNC : DÉBIT DES VAULTS PAYEURS + CRÉDIT MARCHAND ---
+def debit_vaults(db: Session, deltas: Dict[int, int]) -> None:
+    """
+    Un UPDATE relatif par payeur (executemany), dans l'ordre des ids pour éviter les deadlocks.
+
+    Volontairement SANS garde "offline_reserved_atomic >= :delta" : le paiement hors-ligne a
+    déjà eu lieu, le refuser ici ne le défait pas et casserait l'égalité avec le crédit
+    marchand et le journal. Un vault négatif est donc attendu : c'est le découvert que
+    fraud.py lit (offline_reserved_atomic < 0) pour marquer OVER_BUDGET / DOUBLE_SPEND.
+    """
+    if not deltas:
+        return
+    db.execute(
+        update(users_table)
+        .where(users_table.c.id == bindparam("b_id"))
+        .values(offline_reserved_atomic=users_table.c.offline_reserved_atomic - bindparam("b_delta")),
+        [{"b_id": uid, "b_delta": delta} for uid, delta in sorted(deltas.items())],
+    )
+
+
+def credit(db: Session, user_id: int, amount: int) -> None:
+    if amount == 0:
+        return
+    if sharding_enabled():
+        _credit_shard(db, user_id, amount)
+        return
+    db.execute(
+        update(users_table)
+        .where(users_table.c.id == user_id)
+        .values(balance_atomic=users_table.c.balance_atomic + amount)
+    )
+
+
+def _upsert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(shards_table)
+    if dialect == "sqlite":
+        return sqlite.insert(shards_table)
+    raise RuntimeError(f"BALANCE_MODE=sharded non supporté sur {dialect}")
+
+
+def _credit_shard(db: Session, user_id: int, amount: int) -> None:
+    """Crédit sur une case tirée au hasard : les syncs concurrentes d'un même marchand ne se bloquent plus."""
+    stmt = _upsert(db).values(
+        user_id=user_id, shard=random.randrange(settings.BALANCE_SHARD_COUNT), pending_atomic=amount
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[shards_table.c.user_id, shards_table.c.shard],
+        set_={"pending_atomic": shards_table.c.pending_atomic + stmt.excluded.pending_atomic},
+    )
+    db.execute(stmt)
+
+
+# --- 3. REPLI DES SHARDS ---
+def fold_shards(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    Replie les montants en attente dans users.balance_atomic. Chaque case est décrémentée
+    de la valeur LUE, sous condition "pending >= lu" : un crédit arrivé entre-temps n'est
+    jamais perdu, et deux replis concurrents ne peuvent pas déplacer deux fois le même argent.
+    Renvoie le total replié. Le commit est laissé à l'appelant.
+    """
+    query = select(shards_table.c.user_id, shards_table.c.shard, shards_table.c.pending_atomic).where(
+        shards_table.c.pending_atomic != 0
+    )
+    if user_id is not None:
+        query = query.where(shards_table.c.user_id == user_id)
+
+    totals: Dict[int, int] = {}
+    for r in db.execute(query).all():
+        taken = db.execute(
+            update(shards_table)
+            .where(
+                shards_table.c.user_id == r.user_id,
+                shards_table.c.shard == r.shard,
+                shards_table.c.pending_atomic >= r.pending_atomic,
+            )
+            .values(pending_atomic=shards_table.c.pending_atomic - r.pending_atomic)
+            .returning(shards_table.c.user_id)
+        ).first()
+        if taken is not None:
+            totals[r.user_id] = totals.get(r.user_id, 0) + r.pending_atomic
+
+    if not totals:
+        return 0
+    db.execute(
+        update(users_table)
+        .where(users_table.c.id == bindparam("b_id"))
+        .values(balance_atomic=users_table.c.balance_atomic + bindparam("b_amount")),
+        [{"b_id": uid, "b_amount": amount} for uid, amount in sorted(totals.items())],
+    )
+    return sum(totals.values())
+
+
+def fold_all() -> int:
+    db = SessionLocal()
+    try:
+        folded = fold_shards(db)
+        db.commit()
+        return folded
+    finally:
+        db.close()
+
+
+async def fold_loop() -> None:
+    """Tâche de fond (mode "sharded") : repli périodique des sous-soldes."""
+    while True:
+        await asyncio.sleep(settings.BALANCE_FOLD_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(fold_all)
+        except Exception:
+            logger.exception("Repli des shards en échec")
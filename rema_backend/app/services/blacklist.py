@@ -0,0 +1,180 @@
+"""
+Blacklist des clés publiques, telle que la servent les terminaux hors-ligne.
+
+La liste vit en mémoire sous forme compilée (Snapshot) et n'est reconstruite qu'au
+changement de version (compteur blacklist_version), par AJOUT des nouvelles entrées.
+La version n'est pas max(id) : sous PostgreSQL, une séquence ne commite pas dans l'ordre,
+et une entrée ajoutée par une longue sync pourrait arriver sous une version déjà servie.
+Toutes les représentations servies sont calculées à ce moment-là, jamais par requête :
+- JSON (liste de clés hex, format historique de l'app) + sa version gzip
+- binaire compact (Content-Type: application/vnd.rema.blacklist) :
+
+    magic    4s  b"RBL1"
+    flags    B   0 = liste complète, 1 = delta depuis `since`
+    version  Q   version de la liste
+    since    Q   0 pour une liste complète
+    count    I   nombre d'empreintes
+    puis count x 32 octets : BLAKE2b-256 de la clé publique (chaîne UTF-8), dans l'ordre des versions
+
+Les empreintes sont des condensés aléatoires : incompressibles, le binaire part donc tel quel
+(32 octets par clé contre ~67 en JSON, et ~35 en JSON gzip).
+"""
+import bisect
+import gzip
+import json
+import struct
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.keys import FINGERPRINT_BYTES, fingerprint
+from app.models.blacklist import BlacklistEntry, BlacklistVersion
+
+BINARY_CONTENT_TYPE = "application/vnd.rema.blacklist"
+MAGIC = b"RBL1"
+FLAG_DELTA = 1
+HEADER = struct.Struct("<4sBQQI")
+
+entries_table = BlacklistEntry.__table__
+version_table = BlacklistVersion.__table__
+VERSION_ROW = 1
+
+
+class Snapshot:
+    """Une version figée de la liste. Immuable : partagée sans verrou entre les requêtes."""
+
+    __slots__ = ("version", "ids", "keys", "fingerprints", "json_body", "json_gzip")
+
+    def __init__(self, version: int, ids: List[int], keys: List[str], fingerprints: bytes):
+        self.version = version
+        self.ids = ids                      # Croissants : ids[i] = version qui a ajouté keys[i]
+        self.keys = keys
+        self.fingerprints = fingerprints    # Concaténation, même ordre que keys
+        self.json_body = json.dumps(keys, separators=(",", ":")).encode()
+        self.json_gzip = gzip.compress(self.json_body, compresslevel=9, mtime=0)
+
+    def etag(self, variant: str = "json", since: Optional[int] = None) -> str:
+        # ETag fort : une valeur différente par représentation (format, encodage, delta)
+        delta = f"-since{since}" if since is not None else ""
+        return f'"bl-{self.version}{delta}-{variant}"'
+
+    def _start(self, since: int) -> int:
+        return bisect.bisect_right(self.ids, since)
+
+    def keys_since(self, since: int) -> List[str]:
+        """Delta : les clés ajoutées après `since` (bisect sur les ids, pas de requête)."""
+        return self.keys[self._start(since):]
+
+    def binary(self, since: Optional[int] = None) -> bytes:
+        if since is None:
+            return HEADER.pack(MAGIC, 0, self.version, 0, len(self.keys)) + self.fingerprints
+        start = self._start(since)
+        return (
+            HEADER.pack(MAGIC, FLAG_DELTA, self.version, since, len(self.keys) - start)
+            + self.fingerprints[start * FINGERPRINT_BYTES:]
+        )
+
+
+_snapshot = Snapshot(0, [], [], b"")
+_lock = threading.Lock()
+
+
+def _insert_ignore(db: Session, table=entries_table):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    raise RuntimeError(f"Dialecte non supporté pour la blacklist : {dialect}")
+
+
+def _next_version(db: Session) -> int:
+    """
+    version = version + 1 sur la ligne unique : le verrou est gardé jusqu'au commit de
+    l'appelant, un second ajout attend donc le premier et prend la version suivante.
+    """
+    bump = update(version_table).where(version_table.c.id == VERSION_ROW) \
+        .values(version=version_table.c.version + 1).returning(version_table.c.version)
+    version = db.execute(bump).scalar()
+    if version is None:
+        # Base neuve (ou réinitialisée) : la ligne est créée une fois, puis incrémentée
+        db.execute(_insert_ignore(db, version_table).values(id=VERSION_ROW, version=0))
+        version = db.execute(bump).scalar()
+    return version
+
+
+def add(db: Session, reasons: Dict[str, str]) -> int:
+    """
+    Ajoute des clés (clé publique -> motif) dans la transaction de l'appelant.
+    Une clé déjà présente est ignorée : sa version d'origine ne bouge pas.
+    La ligne du compteur reste verrouillée jusqu'au commit de l'appelant : les syncs qui
+    blacklistent en même temps se sérialisent sur ce point. À appeler en dernier, juste
+    avant le commit (c'est ce que fait sync_engine.apply_transactions).
+    """
+    if not reasons:
+        return 0
+    version = _next_version(db)
+    rows = [
+        {"public_key": key, "public_key_fp": fingerprint(key), "reason": reason, "version": version}
+        for key, reason in sorted(reasons.items())
+    ]
+    stmt = _insert_ignore(db).returning(entries_table.c.id)
+    return len(db.execute(stmt, rows).all())
+
+
+def current_version(db: Session) -> int:
+    return db.execute(select(version_table.c.version).where(version_table.c.id == VERSION_ROW)).scalar() or 0
+
+
+def get_snapshot(db: Session) -> Snapshot:
+    """
+    Chaque appel ne coûte qu'une lecture du compteur ; quand la version a bougé, seules les
+    entrées nouvelles sont lues et ajoutées aux listes (les encodages sont refaits une fois).
+    Les entrées sont bornées par la version lue : un ajout commité entre les deux lectures
+    attend le prochain appel.
+    """
+    global _snapshot
+    version = current_version(db)
+    snapshot = _snapshot
+    if version == snapshot.version:
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshot
+        if version < snapshot.version:
+            # Base réinitialisée : on repart de zéro
+            snapshot = Snapshot(0, [], [], b"")
+        rows = db.execute(
+            select(entries_table.c.version, entries_table.c.public_key, entries_table.c.public_key_fp)
+            .where(entries_table.c.version > snapshot.version, entries_table.c.version <= version)
+            .order_by(entries_table.c.version, entries_table.c.id)
+        ).all()
+        if version > snapshot.version:
+            snapshot = Snapshot(
+                version,
+                snapshot.ids + [row.version for row in rows],
+                snapshot.keys + [row.public_key for row in rows],
+                snapshot.fingerprints + b"".join(row.public_key_fp for row in rows),
+            )
+        _snapshot = snapshot
+    return snapshot
+
+
+def reset() -> None:
+    global _snapshot
+    with _lock:
+        _snapshot = Snapshot(0, [], [], b"")
+
+
+def stats() -> Dict[str, Optional[int]]:
+    snapshot = _snapshot
+    return {
+        "version": snapshot.version,
+        "size": len(snapshot.keys),
+        "json_bytes": len(snapshot.json_body),
+        "json_gzip_bytes": len(snapshot.json_gzip),
+        "binary_bytes": HEADER.size + len(snapshot.fingerprints),
+    }
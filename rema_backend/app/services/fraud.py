@@ -0,0 +1,244 @@
+"""
+Scoring anti-fraude des paiements hors-ligne, vectorisé (NumPy) : aucune requête par ligne.
+
+Règles (un bit par règle, une ligne est suspecte dès qu'un bit est levé) :
+- VELOCITY     : plus de FRAUD_VELOCITY_MAX paiements d'un même payeur dans FRAUD_VELOCITY_WINDOW_MS
+- OVER_BUDGET  : le cumul payé dépasse la réserve hors-ligne (offline_reserved_atomic) du payeur
+- CLOCK        : horodatage dans le futur (au-delà de la dérive tolérée) ou trop ancien
+- DOUBLE_SPEND : dépassement de réserve ET la réserve a déjà été dépensée chez un autre marchand
+
+OVER_BUDGET et DOUBLE_SPEND mettent la clé du payeur en blacklist (services/blacklist.py).
+"""
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.keys import fingerprint
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.schemas.transaction import SingleTransaction
+from app.services import blacklist
+
+VELOCITY = 1
+OVER_BUDGET = 2
+CLOCK = 4
+DOUBLE_SPEND = 8
+
+BLACKLIST_REASONS = {DOUBLE_SPEND: "DOUBLE_SPEND", OVER_BUDGET: "OVER_BUDGET"}
+
+# Réserve inconnue (payeur non inscrit) : pas de contrôle de budget
+NO_BUDGET = np.iinfo(np.int64).max
+# Bornes de calcul : évitent les débordements int64 sur des valeurs farfelues envoyées par un client
+_MAX_TS = 1 << 42       # ms epoch, ~ an 2109
+_MAX_AMOUNT = 1 << 40
+
+HISTORY_CHUNK_SIZE = 50_000
+IN_CHUNK_SIZE = 900
+
+transactions_table = Transaction.__table__
+users_table = User.__table__
+
+
+def score(senders: np.ndarray, timestamps: np.ndarray, amounts: np.ndarray,
+          budgets: np.ndarray, now_ms: int) -> np.ndarray:
+    """
+    senders : code entier du payeur par ligne (0..k-1), budgets : réserve par code (taille k).
+    Renvoie les bits de fraude par ligne, dans l'ordre d'entrée.
+    """
+    n = len(senders)
+    if n == 0:
+        return np.zeros(0, dtype=np.uint8)
+
+    ts = np.clip(timestamps, 0, _MAX_TS)
+    amounts = np.clip(amounts, 0, _MAX_AMOUNT)
+    # Tri par (payeur, horodatage), stable : les ex-aequo gardent l'ordre du batch
+    order = np.lexsort((np.arange(n), ts, senders))
+    s, t, a = senders[order], ts[order], amounts[order]
+
+    new_group = np.empty(n, dtype=bool)
+    new_group[0] = True
+    np.not_equal(s[1:], s[:-1], out=new_group[1:])
+    group_start = np.maximum.accumulate(np.where(new_group, np.arange(n), 0))
+
+    flags = np.zeros(n, dtype=np.uint8)
+
+    # Vélocité : clé composite (payeur, temps) triée -> un searchsorted donne le début de fenêtre
+    window = settings.FRAUD_VELOCITY_WINDOW_MS
+    span = int(t.max()) + window + 1
+    key = s.astype(np.int64) * span + t
+    window_start = np.searchsorted(key, key - window, side="left")
+    in_window = np.arange(n) - window_start + 1
+    flags[in_window > settings.FRAUD_VELOCITY_MAX] |= VELOCITY
+
+    # Budget : cumul par payeur (cumsum global moins le cumul avant le début du groupe)
+    cum = np.cumsum(a)
+    spent = cum - (cum[group_start] - a[group_start])
+    flags[spent > budgets[s]] |= OVER_BUDGET
+
+    # Horloge
+    clock_bad = (t > now_ms + settings.FRAUD_MAX_CLOCK_SKEW_MS) | (t < now_ms - settings.FRAUD_MAX_OFFLINE_AGE_MS)
+    flags[clock_bad] |= CLOCK
+
+    result = np.empty(n, dtype=np.uint8)
+    result[order] = flags
+    return result
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _load_budgets(db: Session, user_ids: List[int]) -> Dict[int, int]:
+    budgets = {}
+    for i in range(0, len(user_ids), IN_CHUNK_SIZE):
+        chunk = user_ids[i:i + IN_CHUNK_SIZE]
+        budgets.update(db.execute(
+            select(users_table.c.id, users_table.c.offline_reserved_atomic).where(users_table.c.id.in_(chunk))
+        ).all())
+    return budgets
+
+
+def _spent_elsewhere(db: Session, sender_fps: List[bytes], merchant_fp: bytes) -> set:
+    """Payeurs (empreintes) qui ont déjà des paiements synchronisés chez un AUTRE marchand."""
+    found = set()
+    for i in range(0, len(sender_fps), IN_CHUNK_SIZE):
+        chunk = sender_fps[i:i + IN_CHUNK_SIZE]
+        found.update(db.execute(
+            select(transactions_table.c.sender_fp)
+            .where(transactions_table.c.sender_fp.in_(chunk), transactions_table.c.receiver_fp != merchant_fp)
+            .distinct()
+        ).scalars())
+    return found
+
+
+def score_batch(db: Session, merchant: User, transactions: List[SingleTransaction],
+                sender_ids: Dict[str, int]) -> Tuple[np.ndarray, Dict[str, str]]:
+    """
+    Appelé par sync_engine AVANT l'insertion et le débit des réserves : les budgets lus
+    sont ceux d'avant ce batch. Deux syncs concurrentes d'un même payeur peuvent chacune
+    voir la réserve entière ; la passe historique (score_history) rattrape ce cas.
+    Renvoie (bits par transaction, {clé à blacklister: motif}).
+    """
+    keys, senders = np.unique(np.array([tx.sender_pk for tx in transactions], dtype=object), return_inverse=True)
+    timestamps = np.fromiter((tx.timestamp for tx in transactions), dtype=np.int64, count=len(transactions))
+    amounts = np.fromiter((tx.amount for tx in transactions), dtype=np.int64, count=len(transactions))
+
+    stored = _load_budgets(db, sorted(set(sender_ids.values())))
+    budgets = np.array([
+        stored.get(sender_ids.get(key), NO_BUDGET) for key in keys
+    ], dtype=np.int64)
+
+    flags = score(senders, timestamps, amounts, budgets, _now_ms())
+
+    over = np.unique(senders[(flags & OVER_BUDGET) != 0])
+    if len(over) == 0:
+        return flags, {}
+
+    over_keys = [keys[code] for code in over]
+    merchant_fp = merchant.public_key_fp or fingerprint(merchant.public_key)
+    elsewhere = _spent_elsewhere(db, [fingerprint(key) for key in over_keys], merchant_fp)
+
+    reasons = {}
+    double_codes = []
+    for code, key in zip(over, over_keys):
+        if fingerprint(key) in elsewhere:
+            reasons[key] = BLACKLIST_REASONS[DOUBLE_SPEND]
+            double_codes.append(code)
+        else:
+            reasons[key] = BLACKLIST_REASONS[OVER_BUDGET]
+    if double_codes:
+        flags[np.isin(senders, double_codes) & ((flags & OVER_BUDGET) != 0)] |= DOUBLE_SPEND
+    return flags, reasons
+
+
+# --- PASSE HISTORIQUE ---
+def _history_chunk(db: Session, after_fp: bytes, limit: int):
+    """
+    Lignes de payeurs COMPLETS (un payeur n'est jamais coupé entre deux paquets),
+    lues dans l'ordre de l'index (sender_fp, timestamp, id).
+    """
+    columns = (
+        transactions_table.c.id, transactions_table.c.sender_fp, transactions_table.c.sender_pubk_hash,
+        transactions_table.c.receiver_fp, transactions_table.c.timestamp, transactions_table.c.amount_atomic,
+        transactions_table.c.is_flagged_suspicious,
+    )
+    order = (transactions_table.c.sender_fp, transactions_table.c.timestamp, transactions_table.c.id)
+    rows = db.execute(
+        select(*columns).where(transactions_table.c.sender_fp > after_fp).order_by(*order).limit(limit)
+    ).all()
+    if len(rows) < limit:
+        return rows
+    last_fp = rows[-1].sender_fp
+    complete = [row for row in rows if row.sender_fp != last_fp]
+    if complete:
+        return complete
+    # Un seul payeur plus gros que le paquet : on le lit en entier
+    return db.execute(select(*columns).where(transactions_table.c.sender_fp == last_fp).order_by(*order)).all()
+
+
+def score_history(db: Session, chunk_size: int = HISTORY_CHUNK_SIZE) -> Dict[str, int]:
+    """
+    Rejoue les règles sur tout l'historique, payeur par payeur, un commit par paquet.
+    Pour le budget, on ne connaît que la réserve actuelle : un payeur à découvert (réserve < 0)
+    a dépensé |réserve| de trop, ce sont ses derniers paiements (dans l'ordre du temps) qui sont marqués.
+    """
+    summary = {"rows": 0, "flagged": 0, "blacklisted": 0}
+    after_fp = b""
+    now_ms = _now_ms()
+    while True:
+        rows = _history_chunk(db, after_fp, chunk_size)
+        if not rows:
+            return summary
+        after_fp = rows[-1].sender_fp
+
+        fps, senders = np.unique(np.array([row.sender_fp for row in rows], dtype=object), return_inverse=True)
+        timestamps = np.fromiter((row.timestamp or 0 for row in rows), dtype=np.int64, count=len(rows))
+        amounts = np.fromiter((row.amount_atomic for row in rows), dtype=np.int64, count=len(rows))
+
+        # Budget = total payé - découvert, pour les seuls payeurs à découvert
+        overdrawn = dict(db.execute(
+            select(users_table.c.public_key_fp, users_table.c.offline_reserved_atomic)
+            .where(users_table.c.public_key_fp.in_(list(fps)), users_table.c.offline_reserved_atomic < 0)
+        ).all())
+        totals = np.bincount(senders, weights=np.clip(amounts, 0, _MAX_AMOUNT), minlength=len(fps)).astype(np.int64)
+        budgets = np.array([
+            totals[code] + overdrawn[fp] if fp in overdrawn else NO_BUDGET for code, fp in enumerate(fps)
+        ], dtype=np.int64)
+
+        flags = score(senders, timestamps, amounts, budgets, now_ms)
+
+        # Double dépense : le payeur à découvert a payé au moins deux marchands différents
+        receivers = np.array([row.receiver_fp for row in rows], dtype=object)
+        reasons = {}
+        for code in np.unique(senders[(flags & OVER_BUDGET) != 0]):
+            mine = senders == code
+            double = len(set(receivers[mine])) > 1
+            if double:
+                flags[mine & ((flags & OVER_BUDGET) != 0)] |= DOUBLE_SPEND
+            first = int(np.flatnonzero(mine)[0])
+            reasons[rows[first].sender_pubk_hash] = BLACKLIST_REASONS[DOUBLE_SPEND if double else OVER_BUDGET]
+
+        already = np.fromiter((bool(row.is_flagged_suspicious) for row in rows), dtype=bool, count=len(rows))
+        to_flag = np.flatnonzero((flags != 0) & ~already)
+        if len(to_flag):
+            db.execute(
+                update(transactions_table)
+                .where(transactions_table.c.id == bindparam("tx_id"))
+                .values(is_flagged_suspicious=True),
+                [{"tx_id": rows[i].id} for i in to_flag],
+            )
+        summary["blacklisted"] += blacklist.add(db, reasons)
+        db.commit()
+        summary["rows"] += len(rows)
+        summary["flagged"] += len(to_flag)
+
+
+if __name__ == "__main__":
+    from app.core import database
+
+    with database.SessionLocal() as session:
+        print(score_history(session))
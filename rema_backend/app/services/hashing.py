@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import bcrypt
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+# bcrypt ignore tout au-delà de 72 octets (et bcrypt >= 4.1 refuse carrément)
+MAX_SECRET_BYTES = 72
+
+_executor: Optional[ThreadPoolExecutor] = None
+_admission: Optional[asyncio.Semaphore] = None
+
+# Échecs récents : clé = HMAC(secret, hash) avec une clé propre au processus,
+# pour ne jamais garder le PIN (ni un condensé rejouable hors du processus) en mémoire.
+_cache_key = os.urandom(32)
+failed_cache = TTLCache(maxsize=settings.HASH_FAILED_CACHE_SIZE, ttl=settings.HASH_FAILED_CACHE_TTL)
+
+_counters = {"hashed": 0, "verified": 0, "rejected_busy": 0, "waiting": 0}
+
+
+class HashingBusy(Exception):
+    """Trop de hachages en attente : le client doit réessayer plus tard."""
+
+
+def _encode(secret: str) -> bytes:
+    # Même règle que l'ancien utils.hash : une clé Ed25519 en hex dépasse la limite
+    return secret.encode("utf-8")[:MAX_SECRET_BYTES]
+
+
+def is_hashed(value: Optional[str]) -> bool:
+    """Les comptes créés avant le hachage ont leur PIN stocké tel quel."""
+    return bool(value) and value.startswith(("$2a$", "$2b$", "$2y$"))
+
+
+def hash_sync(secret: str, rounds: Optional[int] = None) -> str:
+    """Version bloquante (scripts, migrations). Dans une route, utiliser `await hash()`."""
+    salt = bcrypt.gensalt(rounds or settings.BCRYPT_ROUNDS)
+    _counters["hashed"] += 1
+    return bcrypt.hashpw(_encode(secret), salt).decode("ascii")
+
+
+def verify_sync(secret: str, hashed: str) -> bool:
+    _counters["verified"] += 1
+    try:
+        return bcrypt.checkpw(_encode(secret), hashed.encode("ascii"))
+    except ValueError:
+        # Hash illisible (colonne corrompue, ancien format) : on refuse, on ne plante pas
+        return False
+
+
+def needs_rehash(hashed: str) -> bool:
+    """Vrai si le hash a été fait avec un autre facteur de coût que BCRYPT_ROUNDS."""
+    try:
+        return int(hashed.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.HASH_WORKERS, thread_name_prefix="rema-bcrypt")
+    return _executor
+
+
+def _get_admission() -> asyncio.Semaphore:
+    global _admission
+    if _admission is None:
+        _admission = asyncio.Semaphore(settings.HASH_MAX_PENDING)
+    return _admission
+
+
+async def _run(fn, *args):
+    """
+    Contrôle d'admission : au plus HASH_MAX_PENDING hachages admis à la fois.
+    Les suivants attendent leur tour (sans bloquer la boucle) puis, passé
+    HASH_QUEUE_TIMEOUT_SECONDS, sont refusés avec HashingBusy.
+    Le pool dédié borne le CPU pris par bcrypt : le threadpool d'anyio reste libre
+    pour les autres routes synchrones.
+    """
+    admission = _get_admission()
+    _counters["waiting"] += 1
+    try:
+        await asyncio.wait_for(admission.acquire(), timeout=settings.HASH_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        _counters["rejected_busy"] += 1
+        raise HashingBusy()
+    finally:
+        _counters["waiting"] -= 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), fn, *args)
+    finally:
+        admission.release()
+
+
+async def hash(secret: str) -> str:
+    return await _run(hash_sync, secret)
+
+
+def _failure_key(secret: str, hashed: str) -> bytes:
+    return hmac.new(_cache_key, _encode(secret) + b"\x00" + hashed.encode("ascii", "replace"), hashlib.sha256).digest()
+
+
+async def verify(secret: str, hashed: str) -> bool:
+    """
+    Vérification asynchrone. Un couple (PIN, hash) qui vient d'échouer est refusé
+    sans repasser par bcrypt : un client qui boucle sur un mauvais PIN ne coûte plus rien.
+    Les succès ne sont jamais mis en cache.
+    """
+    key = _failure_key(secret, hashed)
+    if failed_cache.get(key):
+        return False
+    ok = await _run(verify_sync, secret, hashed)
+    if not ok:
+        failed_cache.set(key, True)
+    return ok
+
+
+def benchmark(rounds: int, duration: float = 1.0) -> Dict[str, Any]:
+    """Mesure le débit de bcrypt sur CETTE machine pour un facteur de coût donné (un seul thread)."""
+    salt = bcrypt.gensalt(rounds)
+    count = 0
+    started = time.perf_counter()
+    while True:
+        bcrypt.hashpw(b"123456", salt)
+        count += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= duration:
+            break
+    return {
+        "rounds": rounds,
+        "ms_per_hash": round(elapsed / count * 1000, 1),
+        "hashes_per_sec": round(count / elapsed, 2),
+    }
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "rounds": settings.BCRYPT_ROUNDS,
+        "workers": settings.HASH_WORKERS,
+        "max_pending": settings.HASH_MAX_PENDING,
+        **_counters,
+        "failed_cache": failed_cache.stats(),
+    }
@@ -0,0 +1,201 @@
+import base64
+import json
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Optional, Tuple
+
+from sqlalchemy import literal, select, tuple_, union_all
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from app.core import database
+from app.core.keys import fingerprint
+from app.core.lazy import lazy_import
+from app.models.transaction import Transaction
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+DIRECTION_IN = "in"     # Reçu (marchand)
+DIRECTION_OUT = "out"   # Payé
+DIRECTION_ALL = "all"
+
+# Les lignes sont lues par paquets : jamais plus de STREAM_BATCH lignes en mémoire
+STREAM_BATCH = 100
+
+transactions = Transaction.__table__
+
+# NumPy : chargé à la première page d'historique, pas à l'import de l'application
+archive = lazy_import("app.services.archive")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# --- CURSEUR OPAQUE ---
+# Position = (timestamp, id) de la dernière ligne servie ; l'ordre est (timestamp, id) décroissant.
+def encode_cursor(timestamp: int, tx_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp}:{tx_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, tx_id = raw.split(":")
+        return int(timestamp), int(tx_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Curseur invalide")
+
+
+def _side(fp_column, counterparty_column, direction: str, fp: bytes, status: Optional[str],
+          after: Optional[Tuple[int, int]], limit: int):
+    stmt = select(
+        transactions.c.id,
+        transactions.c.timestamp,
+        transactions.c.transaction_uuid,
+        counterparty_column.label("counterparty"),
+        transactions.c.amount_atomic,
+        transactions.c.currency_code,
+        transactions.c.status,
+        literal(direction).label("direction"),
+    ).where(fp_column == fp)
+    if status:
+        stmt = stmt.where(transactions.c.status == status)
+    if after is not None:
+        # Comparaison de tuples : suit exactement l'index (fp, timestamp, id)
+        stmt = stmt.where(tuple_(transactions.c.timestamp, transactions.c.id) < tuple_(*after))
+    return stmt.order_by(transactions.c.timestamp.desc(), transactions.c.id.desc()).limit(limit)
+
+
+def build_query(public_key: str, direction: str, status: Optional[str], cursor: Optional[str], limit: int):
+    """
+    Une page = limit + 1 lignes (la ligne en trop dit s'il existe une page suivante).
+    "all" fusionne les deux côtés : chaque côté ne lit que limit + 1 lignes dans son index.
+    """
+    fp = fingerprint(public_key)
+    after = decode_cursor(cursor) if cursor else None
+    fetch = limit + 1
+    sides = []
+    if direction in (DIRECTION_IN, DIRECTION_ALL):
+        sides.append(_side(transactions.c.receiver_fp, transactions.c.sender_pubk_hash, DIRECTION_IN, fp, status, after, fetch))
+    if direction in (DIRECTION_OUT, DIRECTION_ALL):
+        sides.append(_side(transactions.c.sender_fp, transactions.c.receiver_pubk_hash, DIRECTION_OUT, fp, status, after, fetch))
+    if len(sides) == 1:
+        return sides[0]
+
+    # SQLite refuse ORDER BY / LIMIT dans les branches d'un UNION : on les emballe en sous-requêtes
+    merged = union_all(*[select(side.subquery()) for side in sides]).subquery()
+    return select(merged).order_by(merged.c.timestamp.desc(), merged.c.id.desc()).limit(fetch)
+
+
+def archived_rows(public_key: str, direction: str, status: Optional[str], cursor: Optional[str], count: int) -> list:
+    """
+    Les `count` premières lignes de la page lues dans l'archive froide, même ordre.
+    Un paiement hors-ligne tardif peut rester dans la table alors que son mois est archivé :
+    render_page fusionne donc les deux sources au lieu de les enchaîner.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    sides = []
+    if direction in (DIRECTION_IN, DIRECTION_ALL):
+        sides.append(("receiver_pubk_hash", DIRECTION_IN, "sender_pubk_hash"))
+    if direction in (DIRECTION_OUT, DIRECTION_ALL):
+        sides.append(("sender_pubk_hash", DIRECTION_OUT, "receiver_pubk_hash"))
+    rows = []
+    with database.ReadSessionLocal() as db:
+        for side_column, side, counterparty_column in sides:
+            rows += archive.history_rows(db, side_column, public_key, side, counterparty_column, status, after, count)
+    rows.sort(key=lambda row: (row.timestamp, row.id), reverse=True)
+    return rows[:count]
+
+
+def archive_horizon_ms(now: Optional[float] = None) -> int:
+    """
+    Début du mois UTC en cours : seuls des mois entièrement écoulés partent dans l'archive
+    (services/partitions.py), une ligne plus récente que ça ne peut pas y avoir de concurrente.
+    """
+    today = datetime.fromtimestamp(time.time() if now is None else now, tz=timezone.utc)
+    return int(datetime(today.year, today.month, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _iter_rows_sync(stmt):
+    with database.read_engine().connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=STREAM_BATCH).execute(stmt)
+        for row in result:
+            yield row
+
+
+async def iter_rows(stmt) -> AsyncIterator:
+    """Curseur serveur (sur un réplica si configuré) : en async via AsyncSession.stream, sinon dans le threadpool."""
+    if database.AsyncReadSessionLocal is not None:
+        async with database.AsyncReadSessionLocal() as session:
+            result = await session.stream(stmt.execution_options(yield_per=STREAM_BATCH))
+            async for row in result:
+                yield row
+    else:
+        async for row in iterate_in_threadpool(_iter_rows_sync(stmt)):
+            yield row
+
+
+def _item(row) -> dict:
+    return {
+        "uuid": row.transaction_uuid,
+        "direction": row.direction,
+        "counterparty_pk": row.counterparty,
+        "amount_atomic": row.amount_atomic,
+        "currency_code": row.currency_code,
+        "status": row.status,
+        "timestamp": row.timestamp,
+    }
+
+
+async def _merged(stmt, fetch: int, load_archived: Optional[Callable[[int], list]]) -> AsyncIterator:
+    """
+    Lignes de la table et de l'archive, dans l'ordre (timestamp, id) décroissant.
+    L'archive n'est lue qu'à la première ligne de la table antérieure au mois en cours (ou si la
+    table ne remplit pas la page), et seulement pour les lignes qui manquent encore à la page.
+    """
+    horizon = archive_horizon_ms()
+    pending = None
+    head = None
+    served = 0
+
+    async def load():
+        rows = await run_in_threadpool(load_archived, fetch - served) if load_archived is not None else []
+        return iter(rows)
+
+    async for row in iter_rows(stmt):
+        if pending is None and row.timestamp < horizon:
+            pending = await load()
+            head = next(pending, None)
+        while head is not None and (head.timestamp, head.id) > (row.timestamp, row.id):
+            yield head
+            served += 1
+            head = next(pending, None)
+        yield row
+        served += 1
+    if pending is None:
+        pending = await load()
+        head = next(pending, None)
+    while head is not None:
+        yield head
+        head = next(pending, None)
+
+
+async def render_page(stmt, limit: int, load_archived: Optional[Callable[[int], list]] = None) -> AsyncIterator[bytes]:
+    """
+    Sérialise la page au fil de l'eau : {"items": [...], "next_cursor": "..."|null}.
+    next_cursor est écrit à la fin, une fois la ligne "en trop" vue (ou pas).
+    load_archived(n) : les n lignes suivantes de l'archive (cf. archived_rows), appelé au plus une fois.
+    """
+    yield b'{"items":['
+    served = 0
+    last = None
+    next_cursor = None
+    async for row in _merged(stmt, limit + 1, load_archived):
+        if served == limit:
+            next_cursor = encode_cursor(last.timestamp, last.id)
+            break
+        yield (b"," if served else b"") + json.dumps(_item(row), separators=(",", ":")).encode()
+        served += 1
+        last = row
+    yield b'],"next_cursor":' + json.dumps(next_cursor).encode() + b"}"
@@ -0,0 +1,110 @@
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.keys import fingerprint
+from app.models.transaction import Transaction
+from app.models.user import User
+
+# Limite des IN (...) : même valeur que sync_engine
+_IN_CHUNK = 900
+# Transactions récentes parcourues par warm()
+_WARM_SCAN_ROWS = 100_000
+
+
+class KeyIndex:
+    """
+    Table empreinte -> user_id gardée en mémoire pour la boucle de sync.
+    Remplie à la demande (un SELECT groupé pour les empreintes inconnues) ;
+    les absences ne sont PAS mémorisées, un marchand inscrit entre deux batches est donc vu tout de suite.
+    Une clé publique ne change jamais de propriétaire : seul un reset de la base impose clear().
+    """
+
+    def __init__(self):
+        self._ids: Dict[bytes, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, db: Session, fingerprints: Iterable[bytes]) -> Dict[bytes, int]:
+        found: Dict[bytes, int] = {}
+        missing: List[bytes] = []
+        for fp in set(fingerprints):
+            user_id = self._ids.get(fp)
+            if user_id is None:
+                missing.append(fp)
+            else:
+                found[fp] = user_id
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        for i in range(0, len(missing), _IN_CHUNK):
+            chunk = missing[i:i + _IN_CHUNK]
+            rows = db.query(User.public_key_fp, User.id).filter(User.public_key_fp.in_(chunk)).all()
+            with self._lock:
+                for fp, user_id in rows:
+                    self._ids[fp] = user_id
+                    found[fp] = user_id
+        return found
+
+    def remember(self, fp: bytes, user_id: int) -> None:
+        with self._lock:
+            self._ids[fp] = user_id
+
+    def warm(self, db: Session, limit: int) -> int:
+        """
+        Charge d'avance les `limit` marchands les plus payés parmi les dernières transactions
+        (chauffe au démarrage : coût borné par _WARM_SCAN_ROWS, quelle que soit la taille de l'historique).
+        """
+        recent = (
+            select(Transaction.receiver_fp)
+            .where(Transaction.receiver_fp.is_not(None))
+            .order_by(Transaction.id.desc())
+            .limit(_WARM_SCAN_ROWS)
+            .subquery()
+        )
+        top = (
+            select(recent.c.receiver_fp)
+            .group_by(recent.c.receiver_fp)
+            .order_by(func.count().desc())
+            .limit(limit)
+            .subquery()
+        )
+        rows = db.execute(select(User.public_key_fp, User.id).where(User.public_key_fp.in_(select(top.c.receiver_fp)))).all()
+        with self._lock:
+            self._ids.update(rows)
+        return len(rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+index = KeyIndex()
+
+
+def find_user_ids(db: Session, public_keys: Iterable[str]) -> Dict[str, int]:
+    """clé publique -> user_id, pour toutes les clés connues (les autres sont absentes du dict)."""
+    by_fp = {fingerprint(pk): pk for pk in set(public_keys)}
+    return {by_fp[fp]: user_id for fp, user_id in index.lookup(db, by_fp).items()}
+
+
+def find_user(db: Session, public_key: str) -> Optional[User]:
+    """Le User complet (lookup par empreinte puis par clé primaire, servi par l'identity map si déjà chargé)."""
+    user_id = find_user_ids(db, [public_key]).get(public_key)
+    return db.get(User, user_id) if user_id is not None else None
+
+
+def key_exists(db: Session, public_key: str) -> bool:
+    return db.query(User.id).filter(User.public_key_fp == fingerprint(public_key)).first() is not None
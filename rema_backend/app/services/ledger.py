@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, func, insert, literal, or_, select, union_all, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.ledger import ACCOUNT_BANK, ACCOUNT_VAULT, LedgerEntry, LedgerSnapshot
+from app.models.user import User
+
+entries_table = LedgerEntry.__table__
+snapshots_table = LedgerSnapshot.__table__
+users_table = User.__table__
+
+logger = logging.getLogger(__name__)
+
+
+# --- 1. ÉCRITURE GROUPÉE (INSERT ONLY) ---
+class LedgerWriter:
+    """
+    Accumule les écritures d'une requête et les envoie en UN executemany.
+    Aucune ligne "users" n'est verrouillée par le journal.
+    Le flush se fait dans la transaction de l'appelant (même commit que les soldes).
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.rows: List[dict] = []
+
+    def add(self, user_id: int, account: str, amount: int, kind: str, reference: Optional[str] = None):
+        if amount:
+            self.rows.append({
+                "user_id": user_id, "account": account, "amount_atomic": amount,
+                "kind": kind, "reference": reference,
+            })
+        return self
+
+    def flush(self) -> int:
+        count = len(self.rows)
+        if count:
+            self.db.execute(insert(entries_table), self.rows)
+            self.rows = []
+        return count
+
+
+def record(db: Session, user_id: int, account: str, amount: int, kind: str, reference: Optional[str] = None):
+    LedgerWriter(db).add(user_id, account, amount, kind, reference).flush()
+
+
+# --- 2. LECTURE : SNAPSHOT + QUEUE DU JOURNAL ---
+def read_balances(db: Session, user_id: int) -> Dict[str, int]:
+    """
+    Solde par compte = dernier snapshot + somme des entrées postérieures.
+    La queue est bornée par l'intervalle de snapshot : la lecture reste O(1)
+    quelle que soit la taille de l'historique (index user_id, account, id).
+    """
+    snapshots = {
+        account: (balance, last_id)
+        for account, balance, last_id in db.execute(
+            select(snapshots_table.c.account, snapshots_table.c.balance_atomic, snapshots_table.c.last_entry_id)
+            .where(snapshots_table.c.user_id == user_id)
+        )
+    }
+    balances = {ACCOUNT_BANK: 0, ACCOUNT_VAULT: 0}
+    tail_filters = []
+    for account in balances:
+        base, last_id = snapshots.get(account, (0, 0))
+        balances[account] = base
+        tail_filters.append(and_(entries_table.c.account == account, entries_table.c.id > last_id))
+
+    tail = db.execute(
+        select(entries_table.c.account, func.sum(entries_table.c.amount_atomic))
+        .where(entries_table.c.user_id == user_id, or_(*tail_filters))
+        .group_by(entries_table.c.account)
+    )
+    for account, amount in tail:
+        balances[account] += int(amount or 0)
+    return balances
+
+
+# --- 3. SNAPSHOTS (REPLI INCRÉMENTAL) ---
+def safe_high_watermark(db: Session, low: int, cutoff: datetime) -> Optional[int]:
+    """
+    Plus grand id repliable : aucune transaction encore ouverte ne doit pouvoir commiter
+    un id inférieur, sinon read_balances l'ignorerait pour toujours (id <= last_entry_id).
+
+    - Postgres : un id est attribué à l'INSERT mais visible au COMMIT. Le verrou SHARE
+      (incompatible avec le ROW EXCLUSIVE de tout INSERT) attend la fin des écritures en
+      cours : une fois obtenu, tout id déjà attribué est commité ou annulé, et les suivants
+      seront plus grands. Pris dans une transaction courte, à part ; au-delà de
+      LEDGER_SNAPSHOT_LOCK_TIMEOUT_MS on renonce (None) plutôt que de bloquer les syncs.
+    - SQLite : un seul écrivain, qui attribue ses ids sous le verrou d'écriture et commite
+      avant que le suivant n'en attribue : max(id) visible est sûr par construction.
+    """
+    query = select(func.max(entries_table.c.id)).where(entries_table.c.id > low, entries_table.c.created_at <= cutoff)
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return db.execute(query).scalar()
+    try:
+        with bind.connect() as conn, conn.begin():
+            conn.exec_driver_sql(f"SET LOCAL lock_timeout = {int(settings.LEDGER_SNAPSHOT_LOCK_TIMEOUT_MS)}")
+            conn.exec_driver_sql(f"LOCK TABLE {entries_table.name} IN SHARE MODE")
+            return conn.execute(query).scalar()
+    except OperationalError:
+        return None
+
+
+def take_snapshot(db: Session) -> int:
+    """
+    Replie dans ledger_snapshots toutes les entrées entre le dernier filigrane et le
+    nouveau (voir safe_high_watermark ; entrées plus vieilles que LEDGER_SNAPSHOT_LAG_SECONDS).
+    Seule la queue est agrégée, jamais l'historique complet. Renvoie le nombre de comptes mis à jour.
+
+    Chaque worker fait tourner snapshot_loop : chaque case n'est avancée que si son
+    last_entry_id n'a pas dépassé le filigrane lu (compare-and-set, comme balances.fold_shards).
+    Si un autre repli est passé entre-temps, tout le repli est annulé (0) : le suivant
+    repartira du nouveau filigrane. Cases mises à jour dans l'ordre : pas de deadlock.
+    """
+    low = db.execute(select(func.coalesce(func.max(snapshots_table.c.last_entry_id), 0))).scalar()
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.LEDGER_SNAPSHOT_LAG_SECONDS)
+    high = safe_high_watermark(db, low, cutoff)
+    if high is None:
+        return 0
+
+    deltas = db.execute(
+        select(entries_table.c.user_id, entries_table.c.account, func.sum(entries_table.c.amount_atomic))
+        .where(entries_table.c.id > low, entries_table.c.id <= high)
+        .group_by(entries_table.c.user_id, entries_table.c.account)
+        .order_by(entries_table.c.user_id, entries_table.c.account)
+    ).all()
+
+    existing = {
+        (row.user_id, row.account)
+        for row in db.execute(
+            select(snapshots_table.c.user_id, snapshots_table.c.account).where(
+                snapshots_table.c.user_id.in_({d.user_id for d in deltas})
+            )
+        )
+    }
+    try:
+        for user_id, account, amount in deltas:
+            if (user_id, account) in existing:
+                moved = db.execute(
+                    update(snapshots_table)
+                    .where(
+                        snapshots_table.c.user_id == user_id,
+                        snapshots_table.c.account == account,
+                        snapshots_table.c.last_entry_id <= low,
+                    )
+                    .values(balance_atomic=snapshots_table.c.balance_atomic + amount, last_entry_id=high)
+                ).rowcount
+                if moved == 0:
+                    db.rollback()
+                    return 0
+            else:
+                db.execute(insert(snapshots_table).values(
+                    user_id=user_id, account=account, balance_atomic=amount, last_entry_id=high
+                ))
+    except IntegrityError:
+        # Case créée par un repli concurrent
+        db.rollback()
+        return 0
+    # Les comptes sans mouvement gardent leur ancien last_entry_id : leur queue est vide
+    return len(deltas)
+
+
+def snapshot_all() -> int:
+    db = SessionLocal()
+    try:
+        count = take_snapshot(db)
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+async def snapshot_loop() -> None:
+    """Tâche de fond : snapshot du journal toutes les LEDGER_SNAPSHOT_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(settings.LEDGER_SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(snapshot_all)
+        except Exception:
+            logger.exception("Snapshot du journal en échec")
+
+
+# --- 4. CONTRÔLE : SNAPSHOT + QUEUE == SOMME COMPLÈTE ---
+def _full_sums(db: Session, up_to_snapshot: bool = False) -> Dict[tuple, int]:
+    query = select(entries_table.c.user_id, entries_table.c.account, func.sum(entries_table.c.amount_atomic))
+    if up_to_snapshot:
+        query = query.join(snapshots_table, and_(
+            snapshots_table.c.user_id == entries_table.c.user_id,
+            snapshots_table.c.account == entries_table.c.account,
+            entries_table.c.id <= snapshots_table.c.last_entry_id,
+        ))
+    rows = db.execute(query.group_by(entries_table.c.user_id, entries_table.c.account)).all()
+    return {(user_id, account): int(amount or 0) for user_id, account, amount in rows}
+
+
+def verify(db: Session, sample: int = 20) -> dict:
+    """
+    Chaque case de ledger_snapshots doit valoir la somme des entrées id <= last_entry_id.
+    Un écart = une entrée commitée sous le filigrane après le repli : elle manque au solde lu.
+    Parcourt tout le journal (outil d'exploitation, pas un chemin de requête).
+    """
+    expected = _full_sums(db, up_to_snapshot=True)
+    mismatched = [
+        {"user_id": row.user_id, "account": row.account, "last_entry_id": row.last_entry_id,
+         "stored": row.balance_atomic, "expected": expected.get((row.user_id, row.account), 0)}
+        for row in db.execute(select(snapshots_table)).all()
+        if row.balance_atomic != expected.get((row.user_id, row.account), 0)
+    ]
+    return {"snapshots": db.execute(select(func.count()).select_from(snapshots_table)).scalar(),
+            "ok": not mismatched, "mismatched": len(mismatched), "samples": mismatched[:sample]}
+
+
+def repair(db: Session) -> dict:
+    """
+    Recalcule les cases en écart depuis le journal, sous condition qu'aucun repli ne les ait
+    avancées entre-temps (compare-and-set). Le commit est fait ici.
+    """
+    result = verify(db, sample=None)
+    for cell in result["samples"]:
+        db.execute(
+            update(snapshots_table)
+            .where(snapshots_table.c.user_id == cell["user_id"], snapshots_table.c.account == cell["account"],
+                   snapshots_table.c.last_entry_id == cell["last_entry_id"],
+                   snapshots_table.c.balance_atomic == cell["stored"])
+            .values(balance_atomic=cell["expected"])
+        )
+    db.commit()
+    return {"repaired": result["mismatched"]}
+
+
+# --- 5. OUVERTURE DES COMPTES EXISTANTS ---
+def backfill_opening_entries(db: Session) -> None:
+    """
+    Les comptes créés avant le journal reçoivent une entrée OPENING égale à leurs
+    soldes actuels. Idempotent : ne touche que les comptes sans aucune entrée.
+    """
+    no_entries = ~select(entries_table.c.id).where(entries_table.c.user_id == users_table.c.id).exists()
+    opening = union_all(*(
+        select(users_table.c.id, literal(account), column, literal("OPENING")).where(no_entries, column != 0)
+        for account, column in (
+            (ACCOUNT_BANK, users_table.c.balance_atomic),
+            (ACCOUNT_VAULT, users_table.c.offline_reserved_atomic),
+        )
+    ))
+    db.execute(insert(entries_table).from_select(["user_id", "account", "amount_atomic", "kind"], opening))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Contrôle des snapshots du journal")
+    parser.add_argument("command", choices=["verify", "repair"])
+    args = parser.parse_args()
+
+    with SessionLocal() as session:
+        result = verify(session) if args.command == "verify" else repair(session)
+    print(json.dumps(result, indent=2))
+    if args.command == "verify" and not result["ok"]:
+        sys.exit(1)
@@ -0,0 +1,230 @@
+"""
+Partitions mensuelles de `transactions` et passage à l'archive froide.
+
+Une partition = un mois UTC de `timestamp` ("YYYY-MM"), parcourue par l'index (timestamp, id).
+Le partitionnement est émulé de la même façon sur SQLite et PostgreSQL : le partitionnement natif
+de PostgreSQL obligerait à mettre `timestamp` dans la clé primaire et dans les index uniques
+(uuid, nonce), qui ne garantiraient plus l'anti-rejeu que par mois.
+
+Un mois dont la fin est plus vieille que ARCHIVE_AFTER_DAYS et dont toutes les lignes sont réglées
+part dans l'archive (services/archive.py), par segments de ARCHIVE_SEGMENT_ROWS lignes :
+  1. le segment est écrit sur disque (répertoire temporaire puis renommage)
+  2. une seule transaction SQL : ligne du catalogue + DELETE des seuls ids exportés
+Une panne entre 1 et 2 laisse un répertoire orphelin (nettoyé au passage suivant), jamais une ligne
+perdue ni en double. Un paiement hors-ligne tardif arrivé pendant l'export reste dans la table
+et part avec le passage suivant.
+
+    python -m app.services.partitions status
+    python -m app.services.partitions archive [--older-than-days 90] [--dry-run]
+    python -m app.services.partitions find --uuid ... | --sender ... | --receiver ...
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.transaction import Transaction
+from app.schemas.transaction import TIMESTAMP_MAX_MS, TIMESTAMP_MIN_MS
+from app.services import archive
+
+# Statuts définitifs : un mois qui contient autre chose n'est pas archivé
+SETTLED_STATUSES = ("COMPLETED",)
+
+# Taille max d'une liste IN (...) : SQLite limite le nombre de paramètres
+DELETE_CHUNK_SIZE = 900
+
+transactions = Transaction.__table__
+catalog = archive.catalog
+
+ARCHIVED_COLUMNS = [
+    transactions.c.id, transactions.c.timestamp, transactions.c.amount_atomic, transactions.c.currency_code,
+    transactions.c.protocol_ver, transactions.c.sender_pubk_hash, transactions.c.receiver_pubk_hash,
+    transactions.c.status, transactions.c.transaction_uuid, transactions.c.nonce, transactions.c.signature,
+    transactions.c.integrity_checksum, transactions.c.metadata_blob, transactions.c.is_offline_synced,
+    transactions.c.is_flagged_suspicious,
+]
+
+
+# --- BORNES ---
+def partition_key(ts_ms: int) -> str:
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).strftime("%Y-%m")
+
+
+def partition_bounds(key: str) -> Tuple[int, int]:
+    """[début, fin) du mois en millisecondes UTC (décembre 9999 : fin = TIMESTAMP_MAX_MS + 1)."""
+    year, month = (int(part) for part in key.split("-"))
+    start = int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    if (year, month) == (9999, 12):
+        return start, TIMESTAMP_MAX_MS + 1
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start, int(end.timestamp() * 1000)
+
+
+def _month_of(db: Session):
+    """Expression SQL "YYYY-MM" (mois UTC) de transactions.timestamp, même format que partition_key."""
+    ts = transactions.c.timestamp
+    if db.get_bind().dialect.name == "postgresql":
+        return func.to_char(func.timezone("UTC", func.to_timestamp(ts / 1000.0)), "YYYY-MM")
+    return func.strftime("%Y-%m", ts / 1000, "unixepoch")
+
+
+def _in_range():
+    return transactions.c.timestamp.between(TIMESTAMP_MIN_MS, TIMESTAMP_MAX_MS)
+
+
+def _in_partition(key: str):
+    start, end = partition_bounds(key)
+    return and_(transactions.c.timestamp >= start, transactions.c.timestamp < end)
+
+
+def hot_partitions(db: Session) -> List[dict]:
+    """
+    Mois présents dans la table, en UN GROUP BY sur le mois : le coût ne dépend que du nombre
+    de lignes, pas de l'écart entre le plus vieil et le plus récent horodatage (fourni par le
+    client). Les lignes hors bornes (antérieures à la validation à l'ingestion) n'appartiennent
+    à aucun mois : voir out_of_range_rows.
+    """
+    month = _month_of(db).label("month")
+    rows = db.execute(
+        select(month, func.count(), func.count().filter(transactions.c.status.not_in(SETTLED_STATUSES)))
+        .where(_in_range())
+        .group_by(month)
+        .order_by(month)
+    ).all()
+    return [{"partition": key, "rows": count, "unsettled": unsettled} for key, count, unsettled in rows]
+
+
+def out_of_range_rows(db: Session) -> int:
+    """Lignes sans mois valide (NULL, avant 1970, après 9999) : jamais archivées, à corriger à la main."""
+    return db.execute(
+        select(func.count()).where(or_(transactions.c.timestamp.is_(None), ~_in_range()))
+    ).scalar()
+
+
+def archivable(db: Session, older_than_days: int, now_ms: Optional[int] = None) -> List[dict]:
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    cutoff = now_ms - older_than_days * 86_400_000
+    return [
+        part for part in hot_partitions(db)
+        if partition_bounds(part["partition"])[1] <= cutoff and part["unsettled"] == 0
+    ]
+
+
+# --- ARCHIVAGE ---
+def cleanup_orphans(db: Session, root: str = None) -> List[str]:
+    """Répertoires de segments absents du catalogue (panne entre l'écriture et le commit)."""
+    root = root or settings.ARCHIVE_PATH
+    if not os.path.isdir(root):
+        return []
+    known = set(db.execute(select(catalog.c.path)).scalars())
+    removed = []
+    for month in sorted(os.listdir(root)):
+        month_dir = os.path.join(root, month)
+        if not os.path.isdir(month_dir):
+            continue
+        for name in sorted(os.listdir(month_dir)):
+            relative = f"{month}/{name}"
+            if relative not in known:
+                shutil.rmtree(os.path.join(month_dir, name), ignore_errors=True)
+                removed.append(relative)
+    return removed
+
+
+def archive_partition(db: Session, key: str, root: str = None, segment_rows: int = None) -> List[dict]:
+    """Déplace toutes les lignes du mois `key` dans des segments. Un commit par segment."""
+    root = root or settings.ARCHIVE_PATH
+    segment_rows = segment_rows or settings.ARCHIVE_SEGMENT_ROWS
+    written = []
+    after = None
+    while True:
+        stmt = select(*ARCHIVED_COLUMNS).where(_in_partition(key))
+        if after is not None:
+            stmt = stmt.where(transactions.c.id > after)
+        rows = db.execute(stmt.order_by(transactions.c.id).limit(segment_rows)).mappings().all()
+        if not rows:
+            return written
+        after = rows[-1]["id"]
+
+        # Suffixe aléatoire : SQLite réattribue l'id max une fois la ligne supprimée (archivée),
+        # la même plage d'ids peut donc revenir dans un segment ultérieur du même mois
+        relative = f"{key}/seg-{rows[0]['id']}-{after}-{os.urandom(4).hex()}"
+        directory = os.path.join(root, relative)
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        meta = archive.write_segment(rows, directory)
+        try:
+            db.execute(insert(catalog).values(
+                partition_key=key, path=relative, row_count=meta["rows"],
+                min_id=meta["min_id"], max_id=meta["max_id"],
+                min_timestamp=meta["min_timestamp"], max_timestamp=meta["max_timestamp"],
+            ))
+            ids = [row["id"] for row in rows]
+            for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+                db.execute(delete(transactions).where(transactions.c.id.in_(ids[i:i + DELETE_CHUNK_SIZE])))
+            db.commit()
+        except Exception:
+            db.rollback()
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        written.append({"path": relative, "rows": meta["rows"]})
+
+
+def archive_old_partitions(db: Session, older_than_days: int = None, dry_run: bool = False) -> List[dict]:
+    older_than_days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    removed = [] if dry_run else cleanup_orphans(db)
+    if removed:
+        print(f"🧹 Segments orphelins supprimés : {removed}")
+    done = []
+    for part in archivable(db, older_than_days):
+        if dry_run:
+            done.append({**part, "segments": []})
+            continue
+        segments = archive_partition(db, part["partition"])
+        done.append({**part, "segments": segments})
+        print(f"📦 {part['partition']} : {part['rows']} lignes -> {len(segments)} segment(s)")
+    return done
+
+
+def status(db: Session) -> dict:
+    archived = db.execute(
+        select(catalog.c.partition_key, func.count(), func.sum(catalog.c.row_count))
+        .group_by(catalog.c.partition_key).order_by(catalog.c.partition_key)
+    ).all()
+    return {
+        "hot": hot_partitions(db),
+        "out_of_range": out_of_range_rows(db),
+        "archived": [{"partition": key, "segments": count, "rows": rows} for key, count, rows in archived],
+    }
+
+
+if __name__ == "__main__":
+    from app.core import database
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="Mois présents dans la table et dans l'archive")
+    archive_cmd = commands.add_parser("archive", help="Archive les mois réglés plus vieux que N jours")
+    archive_cmd.add_argument("--older-than-days", type=int, default=None)
+    archive_cmd.add_argument("--dry-run", action="store_true", help="Liste les mois archivables sans rien déplacer")
+    find_cmd = commands.add_parser("find", help="Lecture d'audit dans l'archive")
+    find_cmd.add_argument("--uuid")
+    find_cmd.add_argument("--sender")
+    find_cmd.add_argument("--receiver")
+    find_cmd.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    with database.SessionLocal() as session:
+        if args.command == "status":
+            result = status(session)
+        elif args.command == "archive":
+            result = archive_old_partitions(session, args.older_than_days, args.dry_run)
+        else:
+            result = archive.scan(session, uuid=args.uuid, sender_pk=args.sender, receiver_pk=args.receiver,
+                                  limit=args.limit)
+        print(json.dumps(result, indent=2, default=str))
@@ -0,0 +1,249 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.transaction import Transaction
+from app.services import archive
+
+# En-tête du fichier : magic, nb de bits, nb de hachages, plus grand Transaction.id couvert.
+# Rien de propre à un processus : le nb de clés est estimé depuis les bits (stats).
+FILE_HEADER = struct.Struct("<8sQQQ")
+FILE_MAGIC = b"REMABLM2"
+WARMUP_BATCH = 50_000
+# Nb de bits à 1 par valeur d'octet (comptage des bits pour stats)
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+@contextmanager
+def file_lock(path: Optional[str]):
+    """
+    Verrou exclusif entre processus (fichier `<path>.lock`, comme core/migrations.py) :
+    création du fichier, rattrapage et écriture de l'en-tête par un seul worker à la fois.
+    """
+    try:
+        import fcntl
+    except ImportError:  # Windows : poste de dev, un seul processus
+        fcntl = None
+    if not path or fcntl is None:
+        yield
+        return
+    with open(f"{os.path.abspath(path)}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class BloomFilter:
+    """
+    Filtre de Bloom (double hachage blake2b) sur un tableau de bits NumPy.
+    "Absent" est une certitude, "présent" n'est qu'une possibilité.
+    Si `path` est fourni, les bits vivent dans un fichier mmap partagé : ils survivent
+    aux redémarrages et tous les workers qui ouvrent le même fichier les voient.
+    Ouverture et flush() se font sous file_lock(path) (voir get_filter).
+    """
+
+    def __init__(self, capacity: int, fp_rate: float, path: Optional[str] = None):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.num_bits = max(64, int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.path = path
+        self.count = 0
+        self.watermark = 0
+        self.loaded_from_disk = False
+        self.build_seconds = 0.0
+        self._lock = threading.Lock()
+
+        num_bytes = (self.num_bits + 7) // 8
+        if path:
+            self._open_file(path, num_bytes)
+        else:
+            self._mmap = None
+            self.bits = np.zeros(num_bytes, dtype=np.uint8)
+
+    def _open_file(self, path: str, num_bytes: int):
+        size = FILE_HEADER.size + num_bytes
+        fresh = not os.path.exists(path) or os.path.getsize(path) != size
+        if not fresh:
+            with open(path, "rb") as f:
+                magic, bits, hashes, watermark = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            fresh = (magic, bits, hashes) != (FILE_MAGIC, self.num_bits, self.num_hashes)
+        if fresh:
+            # Paramètres changés (ou premier lancement) : fichier vide écrit à côté puis renommé.
+            # Jamais de troncature sur place : un autre worker peut avoir l'ancien fichier en mmap.
+            tmp = f"{path}.tmp-{os.getpid()}"
+            with open(tmp, "wb") as f:
+                f.write(FILE_HEADER.pack(FILE_MAGIC, self.num_bits, self.num_hashes, 0))
+                f.truncate(size)
+            os.replace(tmp, path)
+            watermark = 0
+
+        self._file = open(path, "r+b")
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self.bits = np.frombuffer(self._mmap, dtype=np.uint8, offset=FILE_HEADER.size)
+        self.watermark = watermark
+        self.loaded_from_disk = not fresh
+
+    # --- Hachage vectorisé ---
+    def _positions(self, keys: List[str]) -> np.ndarray:
+        digests = b"".join(hashlib.blake2b(k.encode(), digest_size=16).digest() for k in keys)
+        pairs = np.frombuffer(digests, dtype=np.uint64).reshape(-1, 2)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            positions = pairs[:, :1] + steps * (pairs[:, 1:] | np.uint64(1))
+        return positions % np.uint64(self.num_bits)
+
+    def add_many(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        if not keys:
+            return
+        positions = self._positions(keys).ravel()
+        masks = np.left_shift(np.uint8(1), (positions & np.uint64(7)).astype(np.uint8))
+        with self._lock:
+            np.bitwise_or.at(self.bits, (positions >> np.uint64(3)).astype(np.intp), masks)
+            self.count += len(keys)
+
+    def might_contain_many(self, keys: List[str]) -> np.ndarray:
+        """Un booléen par clé : False = absent à coup sûr."""
+        if not keys:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        hits = (self.bits[(positions >> np.uint64(3)).astype(np.intp)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return hits.all(axis=1)
+
+    def flush(self) -> None:
+        """
+        Écrit le filigrane dans l'en-tête partagé (appelant sous file_lock). Tout id <= filigrane
+        est dans les bits ; on garde le plus grand des filigranes des workers, jamais moins.
+        """
+        if self._mmap is not None:
+            watermark = max(self.watermark, FILE_HEADER.unpack_from(self._mmap, 0)[3])
+            self._mmap[:FILE_HEADER.size] = FILE_HEADER.pack(FILE_MAGIC, self.num_bits, self.num_hashes, watermark)
+            self._mmap.flush()
+
+    def estimated_keys(self) -> int:
+        """Nb de clés estimé depuis la proportion de bits à 1 : vaut pour tous les workers du fichier."""
+        ones = min(int(POPCOUNT[self.bits].sum(dtype=np.int64)), self.num_bits - 1)
+        return int(round(-self.num_bits / self.num_hashes * math.log(1 - ones / self.num_bits)))
+
+    def stats(self) -> dict:
+        keys = self.estimated_keys()
+        fill = keys / self.capacity if self.capacity else 0.0
+        expected_fp = (1 - math.exp(-self.num_hashes * keys / self.num_bits)) ** self.num_hashes
+        return {
+            "capacity": self.capacity,
+            "keys": keys,
+            "keys_added_here": self.count,
+            "fill_ratio": round(fill, 4),
+            "target_fp_rate": self.fp_rate,
+            "expected_fp_rate": round(expected_fp, 6),
+            "bits": self.num_bits,
+            "hashes": self.num_hashes,
+            "memory_bytes": int(self.bits.nbytes),
+            "path": self.path,
+            "loaded_from_disk": self.loaded_from_disk,
+            "watermark_tx_id": self.watermark,
+            "build_seconds": round(self.build_seconds, 3),
+        }
+
+
+# --- CLÉS ---
+def uuid_key(value: str) -> str:
+    return "u:" + value
+
+
+def nonce_key(value: str) -> str:
+    return "n:" + value
+
+
+# --- FILTRE DU PROCESSUS (chargé à la première utilisation) ---
+_filter: Optional[BloomFilter] = None
+_init_lock = threading.Lock()
+
+
+def catch_up(db: Session, flt: BloomFilter) -> int:
+    """
+    Ajoute au filtre les transactions d'id > watermark (toute la table au 1er démarrage).
+    Un filtre neuf reçoit aussi les clés de l'archive froide : elles ne sont plus dans la table.
+    L'appelant détient file_lock(flt.path).
+    """
+    start = time.perf_counter()
+    added = 0
+    if flt.watermark == 0:
+        for uuids, nonces in archive.iter_replay_keys(db):
+            flt.add_many([uuid_key(u) for u in uuids] + [nonce_key(n) for n in nonces])
+            added += len(uuids)
+    while True:
+        rows = db.execute(
+            select(Transaction.id, Transaction.transaction_uuid, Transaction.nonce)
+            .where(Transaction.id > flt.watermark)
+            .order_by(Transaction.id)
+            .limit(WARMUP_BATCH)
+        ).all()
+        if not rows:
+            break
+        flt.add_many([uuid_key(r.transaction_uuid) for r in rows] + [nonce_key(r.nonce) for r in rows])
+        flt.watermark = rows[-1].id
+        added += len(rows)
+    flt.build_seconds += time.perf_counter() - start
+    flt.flush()
+    return added
+
+
+def get_filter(db: Session) -> Optional[BloomFilter]:
+    global _filter
+    if not settings.REPLAY_FILTER_ENABLED:
+        return None
+    if _filter is None:
+        with _init_lock:
+            if _filter is None:
+                _filter = _load(db)
+    return _filter
+
+
+def _load(db: Session) -> BloomFilter:
+    # Workers démarrés ensemble : le premier crée et remplit le fichier, les suivants
+    # attendent puis ne rattrapent que les ids postérieurs au filigrane qu'il a écrit
+    path = settings.REPLAY_FILTER_PATH or None
+    with file_lock(path):
+        flt = BloomFilter(settings.REPLAY_FILTER_CAPACITY, settings.REPLAY_FILTER_FP_RATE, path)
+        catch_up(db, flt)
+    return flt
+
+
+def rebuild(db: Session) -> BloomFilter:
+    """Reconstruction complète (ex: après un changement de capacité ou un reset de la base)."""
+    global _filter
+    with _init_lock, file_lock(settings.REPLAY_FILTER_PATH or None):
+        if settings.REPLAY_FILTER_PATH and os.path.exists(settings.REPLAY_FILTER_PATH):
+            os.remove(settings.REPLAY_FILTER_PATH)
+        flt = BloomFilter(
+            settings.REPLAY_FILTER_CAPACITY, settings.REPLAY_FILTER_FP_RATE, settings.REPLAY_FILTER_PATH or None
+        )
+        catch_up(db, flt)
+        _filter = flt
+    return flt
+
+
+def stats() -> Optional[dict]:
+    return _filter.stats() if _filter is not None else None
+
+
+def flush() -> None:
+    """À l'arrêt du serveur : on écrit l'en-tête (filigrane) dans le fichier mmap."""
+    if _filter is not None:
+        with file_lock(_filter.path):
+            _filter.flush()
@@ -0,0 +1,282 @@
+"""
+Relevés marchands : totaux par (marchand, jour UTC, devise, statut) tenus à jour à l'écriture.
+
+La sync appelle record() dans la même transaction que l'INSERT des paiements : un upsert
+relatif ("tx_count = tx_count + :n") par case touchée, en executemany. Un relevé ne lit que
+settlement_rollups, quelle que soit la taille de l'historique (archive froide comprise).
+
+    python -m app.services.settlement verify    recalcule tout et compare (code de sortie 1 si écart)
+    python -m app.services.settlement rebuild   recalcule tout et remplace la table
+
+Le recalcul lit la table transactions par lots (colonnes -> tableaux NumPy) puis les segments
+de l'archive (déjà en colonnes), et agrège par tri + np.add.reduceat.
+"""
+import argparse
+import json
+import sys
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, delete, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.keys import fingerprint
+from app.models.settlement import SettlementRollup
+from app.models.transaction import Transaction
+from app.services import archive
+
+DAY_MS = 86_400_000
+EPOCH = date(1970, 1, 1)
+
+# Lignes de transactions lues par lot pendant un recalcul
+SCAN_BATCH = 100_000
+INSERT_BATCH = 5_000
+
+rollups = SettlementRollup.__table__
+transactions = Transaction.__table__
+
+# (receiver_fp, day, currency_code, status) -> [tx_count, amount_atomic, flagged_count]
+Totals = Dict[Tuple[bytes, int, int, str], List[int]]
+
+
+def day_of(ts_ms: int) -> int:
+    return ts_ms // DAY_MS
+
+
+def to_date(day: int) -> date:
+    return EPOCH + timedelta(days=day)
+
+
+def from_date(value: date) -> int:
+    return (value - EPOCH).days
+
+
+# --- 1. ÉCRITURE (SYNC) ---
+def _upsert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(rollups)
+    if dialect == "sqlite":
+        return sqlite.insert(rollups)
+    raise RuntimeError(f"settlement_rollups non supporté sur {dialect}")
+
+
+def record(db: Session, receiver_fp: bytes, entries: Iterable[Tuple[int, int, str, int, bool]]) -> None:
+    """
+    entries : (currency_code, timestamp, status, amount_atomic, flagged) des paiements insérés.
+    Cases triées : deux syncs du même marchand verrouillent les lignes dans le même ordre.
+    Le commit est laissé à l'appelant.
+    """
+    totals: Dict[Tuple[int, int, str], List[int]] = {}
+    for currency, timestamp, status, amount, flagged in entries:
+        cell = totals.setdefault((day_of(timestamp), currency, status), [0, 0, 0])
+        cell[0] += 1
+        cell[1] += amount
+        cell[2] += 1 if flagged else 0
+    if not totals:
+        return
+
+    stmt = _upsert(db).values(
+        receiver_fp=bindparam("r_fp"), day=bindparam("r_day"), currency_code=bindparam("r_currency"),
+        status=bindparam("r_status"), tx_count=bindparam("r_count"), amount_atomic=bindparam("r_amount"),
+        flagged_count=bindparam("r_flagged"),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[rollups.c.receiver_fp, rollups.c.day, rollups.c.currency_code, rollups.c.status],
+        set_={
+            "tx_count": rollups.c.tx_count + stmt.excluded.tx_count,
+            "amount_atomic": rollups.c.amount_atomic + stmt.excluded.amount_atomic,
+            "flagged_count": rollups.c.flagged_count + stmt.excluded.flagged_count,
+        },
+    )
+    db.execute(stmt, [
+        {"r_fp": receiver_fp, "r_day": day, "r_currency": currency, "r_status": status,
+         "r_count": count, "r_amount": amount, "r_flagged": flagged}
+        for (day, currency, status), (count, amount, flagged) in sorted(totals.items())
+    ])
+
+
+# --- 2. LECTURE (RELEVÉ) ---
+def report(db: Session, public_key: str, first_day: date, last_day: date) -> dict:
+    """Relevé [first_day, last_day] (jours UTC inclus) : une lecture de plage sur la clé primaire."""
+    rows = db.execute(
+        select(rollups.c.day, rollups.c.currency_code, rollups.c.status,
+               rollups.c.tx_count, rollups.c.amount_atomic, rollups.c.flagged_count)
+        .where(rollups.c.receiver_fp == fingerprint(public_key),
+               rollups.c.day.between(from_date(first_day), from_date(last_day)))
+        .order_by(rollups.c.day, rollups.c.currency_code, rollups.c.status)
+    ).all()
+
+    totals: Dict[Tuple[int, str], List[int]] = {}
+    for row in rows:
+        cell = totals.setdefault((row.currency_code, row.status), [0, 0, 0])
+        cell[0] += row.tx_count
+        cell[1] += row.amount_atomic
+        cell[2] += row.flagged_count
+    return {
+        "merchant_pk": public_key,
+        "from_day": first_day,
+        "to_day": last_day,
+        "days": [
+            {"day": to_date(row.day), "currency_code": row.currency_code, "status": row.status,
+             "tx_count": row.tx_count, "amount_atomic": row.amount_atomic, "flagged_count": row.flagged_count}
+            for row in rows
+        ],
+        "totals": [
+            {"currency_code": currency, "status": status, "tx_count": count, "amount_atomic": amount,
+             "flagged_count": flagged}
+            for (currency, status), (count, amount, flagged) in sorted(totals.items())
+        ],
+    }
+
+
+# --- 3. RECALCUL VECTORISÉ ---
+def _codes(values: Iterable) -> Tuple[np.ndarray, list]:
+    """Valeurs -> codes entiers (ordre de première apparition) + table des valeurs."""
+    table: dict = {}
+    codes = np.fromiter((table.setdefault(v, len(table)) for v in values), dtype=np.int64)
+    return codes, list(table)
+
+
+def _accumulate(totals: Totals, fps: list, statuses: list, fp_codes: np.ndarray, days: np.ndarray,
+                currencies: np.ndarray, status_codes: np.ndarray, amounts: np.ndarray, flagged: np.ndarray) -> None:
+    """Ajoute à `totals` un lot de lignes déjà en colonnes : tri lexicographique puis sommes par groupe."""
+    if len(fp_codes) == 0:
+        return
+    order = np.lexsort((status_codes, currencies, days, fp_codes))
+    keys = np.stack([fp_codes, days, currencies, status_codes], axis=1)[order]
+    starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)])
+    counts = np.diff(np.r_[starts, len(order)])
+    amount_sums = np.add.reduceat(amounts[order], starts)
+    flagged_sums = np.add.reduceat(flagged[order].astype(np.int64), starts)
+    for (fp_code, day, currency, status_code), count, amount, flags in zip(
+            keys[starts].tolist(), counts.tolist(), amount_sums.tolist(), flagged_sums.tolist()):
+        cell = totals.setdefault((fps[fp_code], day, currency, statuses[status_code]), [0, 0, 0])
+        cell[0] += count
+        cell[1] += amount
+        cell[2] += flags
+
+
+def _scan_hot(db: Session, totals: Totals) -> int:
+    scanned, after = 0, 0
+    while True:
+        rows = db.execute(
+            select(transactions.c.id, transactions.c.receiver_fp, transactions.c.receiver_pubk_hash,
+                   transactions.c.timestamp, transactions.c.currency_code, transactions.c.status,
+                   transactions.c.amount_atomic, transactions.c.is_flagged_suspicious)
+            .where(transactions.c.id > after, transactions.c.timestamp.is_not(None))
+            .order_by(transactions.c.id)
+            .limit(SCAN_BATCH)
+        ).all()
+        if not rows:
+            return scanned
+        after = rows[-1].id
+        scanned += len(rows)
+        ids, fps, keys, timestamps, currencies, statuses, amounts, flagged = zip(*rows)
+        fp_codes, fp_table = _codes(fp if fp is not None else fingerprint(key) for fp, key in zip(fps, keys))
+        status_codes, status_table = _codes(statuses)
+        _accumulate(
+            totals, fp_table, status_table, fp_codes,
+            np.array(timestamps, dtype=np.int64) // DAY_MS,
+            np.array(currencies, dtype=np.int64), status_codes,
+            np.array(amounts, dtype=np.int64), np.array(flagged, dtype=bool),
+        )
+
+
+def _scan_archive(segments: List[archive.Segment], totals: Totals) -> int:
+    scanned = 0
+    for segment in segments:
+        fp_table = [fingerprint(key) for key in segment.dictionary("receiver_pubk_hash")]
+        _accumulate(
+            totals, fp_table, segment.dictionary("status"),
+            np.asarray(segment.array("receiver_pubk_hash.codes"), dtype=np.int64),
+            np.asarray(segment.array("timestamp")) // DAY_MS,
+            np.asarray(segment.array("currency_code"), dtype=np.int64),
+            np.asarray(segment.array("status.codes"), dtype=np.int64),
+            np.asarray(segment.array("amount_atomic")),
+            (np.asarray(segment.array("flags")) & archive.FLAG_SUSPICIOUS) != 0,
+        )
+        scanned += segment.rows
+    return scanned
+
+
+def compute(db: Session) -> Tuple[Totals, int]:
+    """
+    Totaux recalculés depuis la table puis l'archive. Un archivage qui se termine entre les deux
+    lectures compterait ses lignes deux fois : on recommence si le catalogue a bougé.
+    """
+    while True:
+        archive.store.refresh(db)
+        version = archive.store.version
+        totals: Totals = {}
+        scanned = _scan_hot(db, totals)
+        segments = archive.store.refresh(db)
+        if archive.store.version == version:
+            return totals, scanned + _scan_archive(segments, totals)
+
+
+def _stored(db: Session) -> Totals:
+    return {
+        (row.receiver_fp, row.day, row.currency_code, row.status): [row.tx_count, row.amount_atomic, row.flagged_count]
+        for row in db.execute(select(rollups)).all()
+    }
+
+
+def verify(db: Session, sample: int = 20) -> dict:
+    """Compare la table aux totaux recalculés. Sous trafic, les syncs en cours peuvent créer de faux écarts."""
+    expected, scanned = compute(db)
+    stored = _stored(db)
+    missing = [key for key in expected if key not in stored]
+    extra = [key for key in stored if key not in expected]
+    mismatched = [key for key in expected if key in stored and stored[key] != expected[key]]
+
+    def describe(key):
+        fp, day, currency, status = key
+        return {"receiver_fp": fp.hex(), "day": to_date(day).isoformat(), "currency_code": currency,
+                "status": status, "expected": expected.get(key), "stored": stored.get(key)}
+
+    return {
+        "transactions_scanned": scanned,
+        "rollups": len(stored),
+        "ok": not (missing or extra or mismatched),
+        "missing": len(missing), "extra": len(extra), "mismatched": len(mismatched),
+        "samples": [describe(key) for key in (missing + extra + mismatched)[:sample]],
+    }
+
+
+def rebuild(db: Session) -> dict:
+    """
+    Remplace tout le contenu de settlement_rollups, en une transaction.
+    Les upserts des syncs sont bloqués jusqu'au commit : une sync en attente n'a pas encore
+    commité ses paiements, le recalcul ne les voit pas et elle ajoute les siens juste après.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.connection().exec_driver_sql(f"LOCK TABLE {rollups.name} IN EXCLUSIVE MODE")
+    # SQLite : le DELETE prend le verrou d'écriture de la base dès maintenant
+    db.execute(delete(rollups))
+    totals, scanned = compute(db)
+    rows = [
+        {"receiver_fp": fp, "day": day, "currency_code": currency, "status": status,
+         "tx_count": count, "amount_atomic": amount, "flagged_count": flagged}
+        for (fp, day, currency, status), (count, amount, flagged) in sorted(totals.items())
+    ]
+    for i in range(0, len(rows), INSERT_BATCH):
+        db.execute(insert(rollups), rows[i:i + INSERT_BATCH])
+    db.commit()
+    return {"transactions_scanned": scanned, "rollups": len(rows)}
+
+
+if __name__ == "__main__":
+    from app.core import database
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    args = parser.parse_args()
+
+    with database.SessionLocal() as session:
+        result = verify(session) if args.command == "verify" else rebuild(session)
+    print(json.dumps(result, indent=2))
+    if args.command == "verify" and not result["ok"]:
+        sys.exit(1)
@@ -0,0 +1,97 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import nacl.exceptions
+import nacl.signing
+
+from app.core.config import settings
+from app.schemas.transaction import SingleTransaction
+
+# (clé publique hex, message canonique, signature hex)
+VerifyJob = Tuple[str, bytes, str]
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def merchant_tag(phone_number: str) -> str:
+    """
+    Le 6e champ du contrat signé par le payeur est le nom BLE du marchand
+    (son numéro sans caractères spéciaux, cf. rema_pay.dart).
+    """
+    return re.sub(r"[^\w]", "", phone_number or "")
+
+
+def canonical_message(tx: SingleTransaction, tag: str) -> bytes:
+    """
+    Contrat signé côté mobile : "uuid|nonce|sender_pk|amount|timestamp|marchand".
+    Construit UNE seule fois par transaction.
+    """
+    return f"{tx.uuid}|{tx.nonce}|{tx.sender_pk}|{tx.amount}|{tx.timestamp}|{tag}".encode("utf-8")
+
+
+@lru_cache(maxsize=settings.SIGNATURE_KEY_CACHE_SIZE)
+def get_verify_key(public_key_hex: str) -> Optional[nacl.signing.VerifyKey]:
+    """Cache des VerifyKey par sender_pk : un même payeur apparaît souvent des dizaines de fois."""
+    try:
+        return nacl.signing.VerifyKey(bytes.fromhex(public_key_hex))
+    except (ValueError, TypeError, nacl.exceptions.CryptoError):
+        return None
+
+
+def verify_one(public_key_hex: str, message: bytes, signature_hex: str) -> bool:
+    key = get_verify_key(public_key_hex)
+    if key is None:
+        return False
+    try:
+        key.verify(message, bytes.fromhex(signature_hex))
+        return True
+    except (ValueError, TypeError, nacl.exceptions.BadSignatureError):
+        return False
+
+
+def verify_chunk(jobs: Sequence[VerifyJob]) -> List[bool]:
+    return [verify_one(pk, msg, sig) for pk, msg, sig in jobs]
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.SIGNATURE_VERIFY_WORKERS, thread_name_prefix="rema-ed25519"
+        )
+    return _executor
+
+
+def verify_jobs(jobs: Sequence[VerifyJob], executor=None, chunk_size: Optional[int] = None) -> List[bool]:
+    """
+    Vérifie un lot de signatures en parallèle (par paquets) et renvoie les verdicts
+    dans le même ordre que les jobs. Les petits lots restent dans le thread courant.
+    """
+    chunk_size = chunk_size or settings.SIGNATURE_VERIFY_CHUNK_SIZE
+    if len(jobs) <= chunk_size:
+        return verify_chunk(jobs)
+
+    executor = executor or get_executor()
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    verdicts: List[bool] = []
+    for chunk_verdicts in executor.map(verify_chunk, chunks):
+        verdicts.extend(chunk_verdicts)
+    return verdicts
+
+
+def filter_valid(transactions: List[SingleTransaction], tag: str, report: dict) -> List[SingleTransaction]:
+    """
+    Étape "verify" du pipeline de sync : les transactions mal signées sont
+    comptées en échec dans le rapport (par uuid) et écartées de l'ingestion.
+    """
+    jobs = [(tx.sender_pk, canonical_message(tx, tag), tx.signature) for tx in transactions]
+    valid = []
+    for tx, ok in zip(transactions, verify_jobs(jobs)):
+        if ok:
+            valid.append(tx)
+        else:
+            report["failed"] += 1
+            report["errors"].append({"uuid": tx.uuid, "msg": "Signature Ed25519 invalide"})
+    return valid
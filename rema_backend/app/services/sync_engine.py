@@ -0,0 +1,253 @@
+from typing import Dict, List, Sequence
+
+from sqlalchemy import insert, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core import database
+from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.core.keys import fingerprint
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.schemas.transaction import TIMESTAMP_MAX_MS, TIMESTAMP_MIN_MS, SingleTransaction
+from app.models.ledger import ACCOUNT_BANK, ACCOUNT_VAULT
+from app.services import balances, blacklist, key_index, ledger
+
+# fraud, replay_filter, archive et settlement tirent NumPy : chargés au premier batch (ou pendant la chauffe),
+# pas à l'import de l'application
+fraud = lazy_import("app.services.fraud")
+replay_filter = lazy_import("app.services.replay_filter")
+archive = lazy_import("app.services.archive")
+settlement = lazy_import("app.services.settlement")
+
+# Statut d'un paiement hors-ligne synchronisé (transactions.status et settlement_rollups.status)
+STATUS_COMPLETED = "COMPLETED"
+
+# Taille max d'une liste IN (...) : SQLite limite le nombre de paramètres
+IN_CHUNK_SIZE = 900
+
+transactions_table = Transaction.__table__
+
+
+def new_report() -> dict:
+    return {"processed": 0, "failed": 0, "flagged": 0, "errors": [], "status": "partial_success"}
+
+
+def finalize_report(report: dict) -> dict:
+    report["status"] = "success" if report["failed"] == 0 else "partial_success"
+    return report
+
+
+def _chunks(values: Sequence, size: int = IN_CHUNK_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _insert_ignore(db: Session):
+    """
+    INSERT ... ON CONFLICT DO NOTHING selon le dialecte (SQLite en dev, Postgres sur Render).
+    Les doublons (uuid / nonce) sont ignorés par la base elle-même.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(transactions_table).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(transactions_table).on_conflict_do_nothing()
+    return insert(transactions_table)
+
+
+# --- 1. LOOKUPS ENSEMBLISTES ---
+def find_existing_keys(db: Session, uuids: List[str], nonces: List[str]):
+    """Un seul SELECT ... IN (...) pour tous les uuid et nonces du batch."""
+    known_uuids, known_nonces = set(), set()
+    for uuid_chunk, nonce_chunk in zip(_chunks(uuids), _chunks(nonces)):
+        rows = db.query(Transaction.transaction_uuid, Transaction.nonce).filter(
+            or_(Transaction.transaction_uuid.in_(uuid_chunk), Transaction.nonce.in_(nonce_chunk))
+        ).all()
+        for row_uuid, row_nonce in rows:
+            known_uuids.add(row_uuid)
+            known_nonces.add(row_nonce)
+    return known_uuids, known_nonces
+
+
+def find_archived_keys(db: Session, uuids: List[str], nonces: List[str]):
+    """
+    Archive froide (services/archive.py) : une transaction archivée n'est plus protégée par
+    les index uniques. Toujours interrogée, jamais derrière le filtre Bloom : un filtre en retard
+    (autre worker, autre instance) laisserait passer le rejeu. Une bissection par segment.
+    """
+    return archive.find_existing(db, uuids, nonces)
+
+
+def find_sender_ids(db: Session, public_keys: List[str]) -> Dict[str, int]:
+    """Payeurs résolus par empreinte : table en mémoire, puis un SELECT indexé pour les inconnus."""
+    return key_index.find_user_ids(db, public_keys)
+
+
+def _to_row(tx: SingleTransaction, merchant: User, suspicious: bool = False) -> dict:
+    return {
+        "transaction_uuid": tx.uuid,
+        "protocol_ver": tx.protocol_ver,
+        "sender_pubk_hash": tx.sender_pk,
+        "receiver_pubk_hash": merchant.public_key,
+        "sender_fp": fingerprint(tx.sender_pk),
+        "receiver_fp": merchant.public_key_fp or fingerprint(merchant.public_key),
+        "amount_atomic": tx.amount,
+        "currency_code": tx.currency,
+        "nonce": tx.nonce,
+        "signature": tx.signature,
+        "integrity_checksum": tx.checksum,
+        "timestamp": tx.timestamp,
+        "status": STATUS_COMPLETED,
+        "is_offline_synced": True,
+        "is_flagged_suspicious": suspicious,
+        "metadata_blob": tx.metadata,
+    }
+
+
+def _possible_replays(db: Session, transactions: List[SingleTransaction]):
+    """
+    Préfiltre Bloom : une transaction dont ni l'uuid ni le nonce ne sont "peut-être connus"
+    est absente de la table à coup sûr et n'a pas besoin du SELECT. Seules les touches possibles
+    descendent en base ; l'index unique reste le garde-fou final (ON CONFLICT DO NOTHING).
+    L'archive n'a pas cet index : elle est vérifiée à part, pour tout le batch.
+    """
+    uuids = [tx.uuid for tx in transactions]
+    nonces = [tx.nonce for tx in transactions]
+    flt = replay_filter.get_filter(db)
+    if flt is None:
+        return uuids, nonces
+    maybe = flt.might_contain_many([replay_filter.uuid_key(u) for u in uuids] + [replay_filter.nonce_key(n) for n in nonces])
+    count = len(transactions)
+    suspects = [i for i in range(count) if maybe[i] or maybe[count + i]]
+    return [uuids[i] for i in suspects], [nonces[i] for i in suspects]
+
+
+def filter_timestamps(transactions: List[SingleTransaction], report: dict) -> List[SingleTransaction]:
+    """
+    Horodatage fourni par le client, non signé par le serveur : hors bornes, la ligne est
+    comptée en échec (par uuid), quel que soit le format du corps (JSON, NDJSON, binaire).
+    """
+    valid = []
+    for tx in transactions:
+        if TIMESTAMP_MIN_MS <= tx.timestamp <= TIMESTAMP_MAX_MS:
+            valid.append(tx)
+        else:
+            report["failed"] += 1
+            report["errors"].append({"uuid": tx.uuid, "msg": "Horodatage hors bornes"})
+    return valid
+
+
+# --- 2. APPLICATION DU BATCH (SANS COMMIT) ---
+def apply_transactions(db: Session, merchant: User, transactions: List[SingleTransaction], report: dict) -> dict:
+    """
+    Ingestion ensembliste : 1 lookup uuid/nonce, 1 lookup payeurs, 1 INSERT multi-lignes,
+    puis des UPDATE agrégés pour les soldes. Le commit est laissé à l'appelant.
+    Les doublons (idempotence / anti-rejeu) sont ignorés silencieusement, comme avant.
+    """
+    transactions = filter_timestamps(transactions, report)
+    if not transactions:
+        return report
+
+    known_uuids, known_nonces = find_existing_keys(db, *_possible_replays(db, transactions))
+    archived_uuids, archived_nonces = find_archived_keys(
+        db,
+        [tx.uuid for tx in transactions if tx.uuid not in known_uuids],
+        [tx.nonce for tx in transactions if tx.nonce not in known_nonces],
+    )
+    known_uuids |= archived_uuids
+    known_nonces |= archived_nonces
+
+    # Dédoublonnage dans le batch lui-même (même uuid ou nonce envoyé deux fois)
+    candidates = []
+    for tx in transactions:
+        if tx.uuid in known_uuids or tx.nonce in known_nonces:
+            continue
+        known_uuids.add(tx.uuid)
+        known_nonces.add(tx.nonce)
+        candidates.append(tx)
+
+    if not candidates:
+        return report
+
+    sender_ids = find_sender_ids(db, sorted({tx.sender_pk for tx in candidates}))
+
+    # Scoring anti-fraude AVANT l'insertion : les lignes suspectes sont écrites déjà marquées
+    suspicious, to_blacklist = set(), {}
+    if settings.FRAUD_SCORING_ENABLED:
+        flags, to_blacklist = fraud.score_batch(db, merchant, candidates, sender_ids)
+        suspicious = {candidates[i].uuid for i in flags.nonzero()[0]}
+
+    try:
+        with db.begin_nested():
+            inserted = _bulk_insert(db, merchant, candidates, suspicious)
+    except Exception:
+        # Une ligne pourrie fait échouer l'INSERT groupé : on isole ligne par ligne
+        # pour garder le rapport par uuid.
+        inserted = _insert_one_by_one(db, merchant, candidates, suspicious, report)
+
+    _apply_balance_deltas(db, merchant, inserted, sender_ids)
+    # Relevé marchand : mêmes lignes, même transaction
+    settlement.record(db, merchant.public_key_fp or fingerprint(merchant.public_key), [
+        (tx.currency, tx.timestamp, STATUS_COMPLETED, tx.amount, tx.uuid in suspicious) for tx in inserted
+    ])
+    # Le marchand consulte son solde juste après la sync : lecture sur le primaire
+    database.mark_written(merchant.phone_number)
+    # Dernière écriture avant le commit : le verrou du compteur de version est gardé le moins longtemps possible
+    blacklist.add(db, to_blacklist)
+    _remember(db, inserted)
+    report["processed"] += len(inserted)
+    report["flagged"] = report.get("flagged", 0) + sum(1 for tx in inserted if tx.uuid in suspicious)
+    return report
+
+
+def _bulk_insert(db: Session, merchant: User, candidates: List[SingleTransaction], suspicious: set) -> List[SingleTransaction]:
+    rows = [_to_row(tx, merchant, tx.uuid in suspicious) for tx in candidates]
+    stmt = _insert_ignore(db).returning(transactions_table.c.transaction_uuid)
+    inserted_uuids = set(db.execute(stmt, rows).scalars().all())
+    return [tx for tx in candidates if tx.uuid in inserted_uuids]
+
+
+def _insert_one_by_one(db: Session, merchant: User, candidates: List[SingleTransaction], suspicious: set, report: dict):
+    inserted = []
+    stmt = _insert_ignore(db).returning(transactions_table.c.transaction_uuid)
+    for tx in candidates:
+        try:
+            with db.begin_nested():
+                if db.execute(stmt, _to_row(tx, merchant, tx.uuid in suspicious)).first() is not None:
+                    inserted.append(tx)
+        except Exception as e:
+            report["failed"] += 1
+            report["errors"].append({"uuid": tx.uuid, "msg": str(e)})
+    return inserted
+
+
+def _remember(db: Session, inserted: List[SingleTransaction]):
+    # Ajout avant le commit : si la transaction échoue, on n'a créé qu'un faux positif (sans danger)
+    flt = replay_filter.get_filter(db)
+    if flt is not None and inserted:
+        flt.add_many([replay_filter.uuid_key(tx.uuid) for tx in inserted] + [replay_filter.nonce_key(tx.nonce) for tx in inserted])
+
+
+def _apply_balance_deltas(db: Session, merchant: User, inserted: List[SingleTransaction], sender_ids: Dict[str, int]):
+    """Un UPDATE agrégé par payeur (executemany) et un seul pour le marchand."""
+    if not inserted:
+        return
+
+    sender_deltas: Dict[int, int] = {}
+    merchant_total = 0
+    journal = ledger.LedgerWriter(db)
+    for tx in inserted:
+        sender_id = sender_ids.get(tx.sender_pk)
+        if sender_id is not None:
+            sender_deltas[sender_id] = sender_deltas.get(sender_id, 0) + tx.amount
+            journal.add(sender_id, ACCOUNT_VAULT, -tx.amount, "OFFLINE_PAYMENT", tx.uuid)
+        merchant_total += tx.amount
+        journal.add(merchant.id, ACCOUNT_BANK, tx.amount, "OFFLINE_PAYMENT", tx.uuid)
+
+    # UPDATE relatifs ("balance = balance + :delta") : atomiques, sans lecture préalable
+    balances.debit_vaults(db, sender_deltas)
+    balances.credit(db, merchant.id, merchant_total)
+    # Journal : un seul executemany pour tout le batch, dans la même transaction
+    journal.flush()
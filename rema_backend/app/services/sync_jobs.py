@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import open_db_runner
+from app.services import sync_engine, sync_pipeline
+
+logger = logging.getLogger(__name__)
+
+# États d'un job
+QUEUED, RUNNING, DONE, FAILED = "QUEUED", "RUNNING", "DONE", "FAILED"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_jobs (
+    batch_id     TEXT PRIMARY KEY,
+    job_id       TEXT NOT NULL,
+    merchant_pk  TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    body         BLOB,
+    status       TEXT NOT NULL,
+    report       TEXT,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_sync_jobs_status ON sync_jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """
+    File de jobs persistante sur un fichier SQLite local (WAL), clé = batch_id.
+    Plusieurs processus uvicorn peuvent partager le même fichier : la prise d'un job
+    est un UPDATE ... RETURNING atomique.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, batch_id: str) -> Optional[sqlite3.Row]:
+        """Lookup par clé primaire : O(1) quelle que soit la taille de la file."""
+        return self._conn().execute(
+            "SELECT batch_id, job_id, merchant_pk, status, report, attempts, created_at, updated_at "
+            "FROM sync_jobs WHERE batch_id = ?", (batch_id,)
+        ).fetchone()
+
+    def submit(self, batch_id: str, merchant_pk: str, content_type: str, body: bytes) -> Tuple[sqlite3.Row, bool]:
+        """
+        INSERT OR IGNORE : un batch_id déjà connu n'est jamais ré-enregistré ni retraité.
+        Renvoie (job, créé maintenant ?).
+        """
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT OR IGNORE INTO sync_jobs (batch_id, job_id, merchant_pk, content_type, body, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (batch_id, uuid.uuid4().hex, merchant_pk, content_type, body, QUEUED, now, now),
+        )
+        return self.get(batch_id), cursor.rowcount == 1
+
+    def claim(self) -> Optional[sqlite3.Row]:
+        """
+        Prend le plus vieux job en attente (ou un job RUNNING dont le worker a disparu).
+        Un job qui a déjà épuisé ses SYNC_JOB_MAX_ATTEMPTS en faisant tomber (ou bloquer)
+        son worker n'est pas repris : il passe FAILED.
+        """
+        now = time.time()
+        expired = now - settings.SYNC_JOB_LEASE_SECONDS
+        conn = self._conn()
+        conn.execute(
+            "UPDATE sync_jobs SET status = ?, report = ?, body = NULL, updated_at = ? "
+            "WHERE status = ? AND updated_at < ? AND attempts >= ?",
+            (FAILED, json.dumps({"status": "failed", "detail": "Nombre max de tentatives atteint"}), now,
+             RUNNING, expired, settings.SYNC_JOB_MAX_ATTEMPTS),
+        )
+        return conn.execute(
+            "UPDATE sync_jobs SET status = ?, attempts = attempts + 1, updated_at = ? "
+            "WHERE batch_id = (SELECT batch_id FROM sync_jobs "
+            "  WHERE status = ? OR (status = ? AND updated_at < ? AND attempts < ?) ORDER BY created_at LIMIT 1) "
+            "RETURNING batch_id, job_id, content_type, body, attempts",
+            (RUNNING, now, QUEUED, RUNNING, expired, settings.SYNC_JOB_MAX_ATTEMPTS),
+        ).fetchone()
+
+    def finish(self, batch_id: str, status: str, report: dict) -> None:
+        # Le corps n'est plus utile une fois le job terminé : on libère la place
+        self._conn().execute(
+            "UPDATE sync_jobs SET status = ?, report = ?, body = NULL, updated_at = ? WHERE batch_id = ?",
+            (status, json.dumps(report), time.time(), batch_id),
+        )
+
+    def renew(self, batch_id: str, attempts: int) -> bool:
+        """
+        Prolonge le bail d'un job en cours. Ne touche que la tentative du worker appelant
+        (même attempts) : False si le job a été repris ou terminé entre-temps.
+        """
+        cursor = self._conn().execute(
+            "UPDATE sync_jobs SET updated_at = ? WHERE batch_id = ? AND status = ? AND attempts = ?",
+            (time.time(), batch_id, RUNNING, attempts),
+        )
+        return cursor.rowcount == 1
+
+    def retry(self, batch_id: str) -> None:
+        self._conn().execute(
+            "UPDATE sync_jobs SET status = ?, updated_at = ? WHERE batch_id = ?", (QUEUED, time.time(), batch_id)
+        )
+
+    def depth(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sync_jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchone()[0]
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(settings.SYNC_JOBS_DB_PATH)
+    return _queue
+
+
+def describe(row) -> dict:
+    """Vue publique d'un job (réponse 202 et GET /transactions/sync/{batch_id})."""
+    status = {
+        "job_id": row["job_id"],
+        "batch_id": row["batch_id"],
+        "status": row["status"],
+        "attempts": row["attempts"],
+    }
+    if row["report"]:
+        status["report"] = json.loads(row["report"])
+    return status
+
+
+# --- WORKERS ---
+async def keep_lease(job) -> None:
+    """
+    Renouvelle le bail tant que le job tourne : un batch plus long que SYNC_JOB_LEASE_SECONDS
+    n'est pas repris (et retraité) par un autre worker.
+    """
+    queue = get_queue()
+    interval = max(settings.SYNC_JOB_LEASE_SECONDS / 3, settings.SYNC_JOB_POLL_SECONDS)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await run_in_threadpool(queue.renew, job["batch_id"], job["attempts"]):
+                logger.warning("Bail du job %s perdu (repris ou terminé ailleurs)", job["batch_id"])
+                return
+        except Exception:
+            logger.exception("Renouvellement du bail du job %s en échec", job["batch_id"])
+
+
+async def process(job) -> None:
+    queue = get_queue()
+    report = sync_engine.new_report()
+    heartbeat = asyncio.create_task(keep_lease(job))
+    try:
+        batch = sync_pipeline.decode_body(job["content_type"], job["body"], report)
+        async with open_db_runner() as runner:
+            report = await sync_pipeline.run_batch(runner, batch, report, source="job")
+        await run_in_threadpool(queue.finish, job["batch_id"], DONE, report)
+    except HTTPException as e:
+        # Erreur "client" (marchand inconnu, corps invalide...) : inutile de réessayer
+        await run_in_threadpool(queue.finish, job["batch_id"], FAILED, {"status": "failed", "detail": e.detail})
+    except Exception as e:
+        if job["attempts"] >= settings.SYNC_JOB_MAX_ATTEMPTS:
+            await run_in_threadpool(queue.finish, job["batch_id"], FAILED, {"status": "failed", "detail": str(e)})
+        else:
+            await run_in_threadpool(queue.retry, job["batch_id"])
+    finally:
+        heartbeat.cancel()
+
+
+async def worker_loop() -> None:
+    queue = get_queue()
+    while True:
+        try:
+            job = await run_in_threadpool(queue.claim)
+            if job is None:
+                await asyncio.sleep(settings.SYNC_JOB_POLL_SECONDS)
+                continue
+            await process(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Worker de sync en échec")
+            await asyncio.sleep(settings.SYNC_JOB_POLL_SECONDS)
+
+
+_workers: List[asyncio.Task] = []
+
+
+def pending_jobs() -> bool:
+    """Jobs laissés en file par un arrêt précédent ? Sans fichier, rien à reprendre (et rien n'est créé)."""
+    return os.path.exists(settings.SYNC_JOBS_DB_PATH) and get_queue().depth() > 0
+
+
+def ensure_workers() -> None:
+    """
+    Démarre les SYNC_JOB_WORKERS tâches de ce processus si ce n'est pas déjà fait.
+    Appelé au démarrage quand la file sert (SYNC_ASYNC_JOBS ou jobs en attente),
+    sinon au premier batch mis en file ("Prefer: respond-async").
+    """
+    if _workers:
+        return
+    for _ in range(settings.SYNC_JOB_WORKERS):
+        _workers.append(asyncio.create_task(worker_loop()))
+
+
+def stop_workers() -> None:
+    while _workers:
+        _workers.pop().cancel()
@@ -0,0 +1,71 @@
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import DbRunner
+from app.models.user import User
+from app.schemas.transaction import TransactionBatchRequest
+from app.services import key_index, signatures, sync_engine, wire_format
+
+# Étapes communes au traitement inline (POST /transactions/sync) et aux workers de la file de jobs
+
+
+def decode_body(content_type: str, body: bytes, report: dict) -> TransactionBatchRequest:
+    """
+    Deux formats de corps complets :
+    - application/json (par défaut, app Flutter actuelle)
+    - application/vnd.rema.batch : enregistrements binaires fixes + CRC32 (voir wire_format)
+    """
+    if content_type == wire_format.CONTENT_TYPE:
+        try:
+            batch, rejected = wire_format.decode_batch(body)
+        except (wire_format.WireFormatError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Batch binaire invalide : {e}")
+        report["failed"] += len(rejected)
+        report["errors"].extend(rejected)
+        return batch
+
+    try:
+        return TransactionBatchRequest.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+
+def find_merchant(db: Session, merchant_pk: str) -> User:
+    merchant = key_index.find_user(db, merchant_pk)
+    if not merchant:
+        raise HTTPException(status_code=404, detail="Marchand introuvable")
+    return merchant
+
+
+def ingest(db: Session, merchant: User, transactions, report: dict) -> dict:
+    # Ingestion ensembliste : lookups groupés + INSERT unique + UPDATE agrégés,
+    # le tout dans UNE transaction (un seul commit / fsync par batch)
+    with metrics.stage("apply"):
+        sync_engine.apply_transactions(db, merchant, transactions, report)
+    with metrics.stage("commit"):
+        db.commit()
+    return report
+
+
+async def run_batch(runner: DbRunner, batch: TransactionBatchRequest, report: dict, source: str = "inline") -> dict:
+    """lookup marchand -> vérification Ed25519 -> ingestion -> rapport"""
+    metrics.BATCH_SIZE.observe(len(batch.transactions), source)
+    with metrics.stage("lookup"):
+        merchant = await runner.run(find_merchant, batch.merchant_pk)
+
+    transactions = batch.transactions
+    if settings.SYNC_VERIFY_SIGNATURES:
+        # Vérification Ed25519 groupée (pool de threads) AVANT toute écriture,
+        # hors de l'event loop : c'est du CPU pur
+        with metrics.stage("verify"):
+            transactions = await run_in_threadpool(
+                signatures.filter_valid, transactions, signatures.merchant_tag(merchant.phone_number), report
+            )
+
+    await runner.run(ingest, merchant, transactions, report)
+    return sync_engine.finalize_report(report)
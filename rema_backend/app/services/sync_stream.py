@@ -0,0 +1,137 @@
+import json
+from typing import AsyncIterator, List, Tuple
+
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.config import settings
+from app.models.sync_checkpoint import SyncCheckpoint
+from app.models.user import User
+from app.schemas.transaction import SingleTransaction, TransactionBatchHeader
+from app.services import sync_engine
+
+CONTENT_TYPE = "application/x-ndjson"
+
+
+# --- 1. PIPELINE DE GÉNÉRATEURS (mémoire bornée) ---
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Découpe le corps reçu morceau par morceau en lignes NDJSON, sans jamais le charger en entier.
+    Les lignes d'un morceau sont lues par décalage ; le reste n'est recopié qu'une fois par morceau.
+    """
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = bytes(buffer[start:end]).strip()
+            start = end + 1
+            if line:
+                yield line
+        del buffer[:start]
+        if len(buffer) > settings.SYNC_STREAM_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail="Ligne NDJSON trop longue")
+    if buffer.strip():
+        yield bytes(buffer).strip()
+
+
+async def iter_chunks(
+    lines: AsyncIterator[bytes], skip: int, size: int
+) -> AsyncIterator[Tuple[int, List[SingleTransaction]]]:
+    """
+    Valide les transactions par paquets de `size`. Les `skip` premières lignes
+    (déjà commitées lors d'un envoi précédent) sont sautées sans être parsées.
+    Produit (nb total de lignes vues, paquet validé).
+    """
+    seen = 0
+    chunk: List[SingleTransaction] = []
+    async for line in lines:
+        seen += 1
+        if seen <= skip:
+            continue
+        try:
+            chunk.append(SingleTransaction.model_validate_json(line))
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        if len(chunk) >= size:
+            yield seen, chunk
+            chunk = []
+    if chunk:
+        yield seen, chunk
+
+
+async def read_header(lines: AsyncIterator[bytes]) -> TransactionBatchHeader:
+    try:
+        first = await lines.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=400, detail="Flux NDJSON vide")
+    try:
+        return TransactionBatchHeader.model_validate_json(first)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+
+# --- 2. CHECKPOINTS PAR batch_id ---
+class ConcurrentUpload(Exception):
+    """Un autre upload du même batch_id a créé le checkpoint en premier : `report` est le sien."""
+
+    def __init__(self, report: dict):
+        super().__init__("batch_id déjà en cours de traitement")
+        self.report = report
+
+
+def load_checkpoint(db: Session, header: TransactionBatchHeader) -> Tuple[int, dict, bool]:
+    """Renvoie (lignes déjà traitées, rapport partiel, batch déjà terminé ?)."""
+    checkpoint = db.get(SyncCheckpoint, header.batch_id)
+    if checkpoint is None:
+        return 0, sync_engine.new_report(), False
+    if checkpoint.merchant_pk != header.merchant_pk:
+        raise HTTPException(status_code=409, detail="batch_id déjà utilisé par un autre marchand")
+    return checkpoint.rows_done, json.loads(checkpoint.report_json), checkpoint.status == "COMPLETED"
+
+
+def save_checkpoint(db: Session, header: TransactionBatchHeader, rows_done: int, report: dict, completed: bool):
+    checkpoint = db.get(SyncCheckpoint, header.batch_id)
+    created = checkpoint is None
+    if created:
+        checkpoint = SyncCheckpoint(batch_id=header.batch_id, merchant_pk=header.merchant_pk)
+        db.add(checkpoint)
+    checkpoint.rows_done = rows_done
+    checkpoint.report_json = json.dumps(report)
+    checkpoint.status = "COMPLETED" if completed else "IN_PROGRESS"
+    if created:
+        # Deux uploads simultanés d'un batch_id neuf : le second perd sur la clé primaire,
+        # son paquet est annulé et il renvoie la progression du premier
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            raise ConcurrentUpload(load_checkpoint(db, header)[1])
+
+
+def ingest_chunk(
+    db: Session, merchant: User, header: TransactionBatchHeader,
+    chunk: List[SingleTransaction], rows_done: int, report: dict,
+) -> dict:
+    """Paquet + checkpoint dans UNE transaction : jamais de paquet commité sans sa progression."""
+    with metrics.stage("apply"):
+        sync_engine.apply_transactions(db, merchant, chunk, report)
+    del report["errors"][settings.SYNC_STREAM_MAX_ERRORS:]
+    save_checkpoint(db, header, rows_done, report, completed=False)
+    with metrics.stage("commit"):
+        db.commit()
+    return report
+
+
+def complete(db: Session, header: TransactionBatchHeader, rows_done: int, report: dict) -> dict:
+    report = sync_engine.finalize_report(report)
+    save_checkpoint(db, header, rows_done, report, completed=True)
+    db.commit()
+    return report
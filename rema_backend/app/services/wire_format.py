@@ -0,0 +1,160 @@
+"""
+Format binaire compact des batches offline (Content-Type: application/vnd.rema.batch).
+
+Tout est en little-endian. Un batch = un en-tête + `count` enregistrements de taille fixe.
+
+EN-TÊTE (44 octets + 3 chaînes courtes)
+    magic        4s   b"RMB1"
+    version      B    2
+    flags        B    0 (réservé)
+    record_size  H    211 (permet de rejeter un client qui n'a pas le même format)
+    count        I    nombre d'enregistrements
+    merchant_pk  32s  clé publique Ed25519 brute du marchand
+    puis batch_id, device_id, sync_timestamp : 1 octet de longueur + UTF-8
+
+ENREGISTREMENT (211 octets) — [Doc Section 8.1]
+    protocol_ver B, uuid 36s, nonce 24s, sender_pk 32s, receiver_pk 32s,
+    amount Q (uint64), currency H (ISO 4217), timestamp Q (ms epoch),
+    signature 64s, crc32 I (CRC32 des 207 octets précédents)
+
+uuid et nonce voyagent TELS QUE générés par l'app (texte ASCII, complété par des
+octets NUL) : "<ms>-<rand>" et 24 caractères alphanumériques (rema_pay.dart).
+Ce sont ces chaînes que le payeur signe (voir signatures.canonical_message) et sur
+lesquelles portent les index uniques, le filtre anti-rejeu et l'archive : un paiement
+a donc la même identité qu'il arrive en JSON ou en binaire.
+Clés et signature sont des octets bruts, qui redeviennent de l'hex minuscule.
+"""
+import struct
+import zlib
+from typing import List, NamedTuple, Optional, Tuple
+
+from app.schemas.transaction import SingleTransaction, SyncError, TransactionBatchRequest
+
+CONTENT_TYPE = "application/vnd.rema.batch"
+MAGIC = b"RMB1"
+VERSION = 2
+
+HEADER = struct.Struct("<4sBBHI32s")
+RECORD = struct.Struct("<B36s24s32s32sQHQ64sI")
+CRC_OFFSET = RECORD.size - 4
+
+
+class WireFormatError(ValueError):
+    pass
+
+
+class WireTransaction(NamedTuple):
+    """
+    Même interface (attributs) que SingleTransaction, sans le coût d'un modèle pydantic
+    par ligne : les types sont déjà garantis par struct.
+    """
+    uuid: str
+    protocol_ver: int
+    nonce: str
+    timestamp: int
+    sender_pk: str
+    receiver_pk: str
+    amount: int
+    currency: int
+    signature: str
+    type: str = "OFFLINE_PAYMENT"
+    metadata: Optional[str] = "{}"
+    checksum: Optional[str] = None
+
+
+def _text(raw: bytes) -> str:
+    return raw.rstrip(b"\0").decode("ascii")
+
+
+def _pad(value: str, size: int, field: str) -> bytes:
+    raw = value.encode("ascii")
+    if len(raw) > size:
+        raise WireFormatError(f"{field} > {size} octets : {value!r}")
+    return raw  # struct complète avec des NUL
+
+
+def _read_short_str(buf: memoryview, offset: int) -> Tuple[str, int]:
+    if offset >= len(buf):
+        raise WireFormatError("En-tête tronqué")
+    length = buf[offset]
+    end = offset + 1 + length
+    if end > len(buf):
+        raise WireFormatError("En-tête tronqué")
+    return bytes(buf[offset + 1:end]).decode("utf-8"), end
+
+
+def decode_batch(body: bytes) -> Tuple[TransactionBatchRequest, List[SyncError]]:
+    """
+    Décode un batch binaire en UNE passe sur un memoryview (pas de copie du corps) :
+    struct.iter_unpack sur la zone des enregistrements + contrôle CRC32 au vol.
+    Renvoie le batch (transactions valides) et les enregistrements rejetés (uuid, motif).
+    """
+    buf = memoryview(body)
+    if len(buf) < HEADER.size:
+        raise WireFormatError("Corps trop court")
+
+    magic, version, _flags, record_size, count, merchant_pk = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise WireFormatError("Magic / version inconnus")
+    if record_size != RECORD.size:
+        raise WireFormatError(f"Taille d'enregistrement {record_size} != {RECORD.size}")
+
+    offset = HEADER.size
+    batch_id, offset = _read_short_str(buf, offset)
+    device_id, offset = _read_short_str(buf, offset)
+    sync_timestamp, offset = _read_short_str(buf, offset)
+
+    records = buf[offset:]
+    if len(records) != count * RECORD.size:
+        raise WireFormatError(f"{count} enregistrements annoncés, {len(records) / RECORD.size:g} reçus")
+
+    merchant_hex = merchant_pk.hex()
+    transactions: List[WireTransaction] = []
+    rejected: List[SyncError] = []
+    crc32 = zlib.crc32
+    position = 0
+    for ver, raw_uuid, raw_nonce, sender, receiver, amount, currency, ts, signature, crc in RECORD.iter_unpack(records):
+        if crc32(records[position:position + CRC_OFFSET]) != crc:
+            rejected.append({"uuid": raw_uuid.rstrip(b"\0").decode("ascii", "replace"), "msg": "Checksum CRC32 invalide"})
+        else:
+            try:
+                tx_uuid, nonce = _text(raw_uuid), _text(raw_nonce)
+            except UnicodeDecodeError:
+                rejected.append({"uuid": raw_uuid.rstrip(b"\0").decode("ascii", "replace"), "msg": "uuid / nonce non ASCII"})
+            else:
+                transactions.append(WireTransaction(
+                    tx_uuid, ver, nonce, ts, sender.hex(), receiver.hex(),
+                    amount, currency, signature.hex(), "OFFLINE_PAYMENT", "{}", f"{crc:08x}",
+                ))
+        position += RECORD.size
+
+    batch = TransactionBatchRequest.model_construct(
+        merchant_pk=merchant_hex, batch_id=batch_id, device_id=device_id,
+        count=count, sync_timestamp=sync_timestamp, transactions=transactions,
+    )
+    return batch, rejected
+
+
+def encode_record(tx: SingleTransaction) -> bytes:
+    """Inverse de decode_batch (clients de test, benchmarks). Clés et signature en hex."""
+    body = RECORD.pack(
+        tx.protocol_ver, _pad(tx.uuid, 36, "uuid"), _pad(tx.nonce, 24, "nonce"),
+        bytes.fromhex(tx.sender_pk), bytes.fromhex(tx.receiver_pk), tx.amount,
+        tx.currency, tx.timestamp, bytes.fromhex(tx.signature), 0,
+    )
+    return body[:CRC_OFFSET] + struct.pack("<I", zlib.crc32(body[:CRC_OFFSET]))
+
+
+def encode_batch(batch: TransactionBatchRequest) -> bytes:
+    def short_str(value: str) -> bytes:
+        raw = value.encode("utf-8")
+        if len(raw) > 255:
+            raise WireFormatError("Chaîne d'en-tête > 255 octets")
+        return bytes([len(raw)]) + raw
+
+    parts = [
+        HEADER.pack(MAGIC, VERSION, 0, RECORD.size, len(batch.transactions), bytes.fromhex(batch.merchant_pk)),
+        short_str(batch.batch_id), short_str(batch.device_id), short_str(batch.sync_timestamp),
+    ]
+    parts.extend(encode_record(tx) for tx in batch.transactions)
+    return b"".join(parts)
@@ -1,16 +1,10 @@
-from passlib.context import CryptContext
+from app.services import hashing
 
-# On configure le contexte pour être plus flexible
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Un seul contexte bcrypt pour toute l'app : voir app/services/hashing.py
+# (la troncature à 72 octets pour les clés Ed25519 y est faite aussi)
 
 def hash(password: str):
-    # 👇 LA CORRECTION : Si la clé est trop longue (Ed25519), 
-    # on prend les 72 premiers caractères pour ne pas faire crash Bcrypt
-    if len(password) > 71:
-        password = password[:71]
-    return pwd_context.hash(password)
+    return hashing.hash_sync(password)
 
 def verify(plain_password, hashed_password):
-    if len(plain_password) > 71:
-        plain_password = plain_password[:71]
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return hashing.verify_sync(plain_password, hashed_password)
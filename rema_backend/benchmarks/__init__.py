@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# Scripts de mesure : à lancer depuis rema_backend/ avec "python -m benchmarks.<script>"
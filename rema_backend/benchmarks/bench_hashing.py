@@ -0,0 +1,42 @@
+"""
+Débit de bcrypt sur la machine courante, pour régler BCRYPT_ROUNDS.
+
+    python -m benchmarks.bench_hashing                 # facteurs 8 à 13
+    python -m benchmarks.bench_hashing --target-ms 250 # recommande le facteur le plus fort sous 250 ms
+
+Chaque +1 sur le facteur double le coût. Le débit max du serveur en logins/s
+vaut environ hashes_per_sec x HASH_WORKERS (tant que HASH_WORKERS <= nb de coeurs).
+"""
+import argparse
+import os
+
+from app.core.config import settings
+from app.services import hashing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-rounds", type=int, default=8)
+    parser.add_argument("--max-rounds", type=int, default=13)
+    parser.add_argument("--duration", type=float, default=1.0, help="Secondes de mesure par facteur")
+    parser.add_argument("--target-ms", type=float, default=250.0, help="Latence max acceptée pour un login")
+    args = parser.parse_args()
+
+    print(f"CPU: {os.cpu_count()} | HASH_WORKERS={settings.HASH_WORKERS} | BCRYPT_ROUNDS actuel={settings.BCRYPT_ROUNDS}")
+    print(f"{'rounds':>6} {'ms/hash':>9} {'hash/s':>8} {'logins/s (pool)':>16}")
+    recommended = None
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        result = hashing.benchmark(rounds, args.duration)
+        pool_rate = result["hashes_per_sec"] * min(settings.HASH_WORKERS, os.cpu_count() or 1)
+        print(f"{rounds:>6} {result['ms_per_hash']:>9} {result['hashes_per_sec']:>8} {pool_rate:>16.1f}")
+        if result["ms_per_hash"] <= args.target_ms:
+            recommended = rounds
+
+    if recommended is None:
+        print(f"\nAucun facteur sous {args.target_ms} ms : machine trop lente, baisser --min-rounds")
+    else:
+        print(f"\n👉 BCRYPT_ROUNDS={recommended} (plus fort facteur sous {args.target_ms} ms)")
+
+
+if __name__ == "__main__":
+    main()
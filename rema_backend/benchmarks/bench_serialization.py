@@ -0,0 +1,117 @@
+"""
+BENCHMARK : coût CPU par requête de la couche réponse, avant / après le chemin rapide.
+
+  1. Rapport de sync (0 / 100 / 1000 erreurs)
+     avant : dict -> jsonable_encoder -> JSONResponse (json standard)
+     après : SYNC_REPORT_ADAPTER.dump_json (TypeAdapter précompilé, sans re-validation)
+  2. Solde
+     avant : dict -> jsonable_encoder -> JSONResponse
+     après : response_model BalanceResponse (pydantic -> octets) / FastJSONResponse (orjson)
+  3. Lecture du User pour le solde (SQLite mémoire)
+     avant : objet ORM complet      après : with_entities(id, full_name)
+
+Temps CPU du processus (time.process_time), moyenne par appel.
+
+Usage : python -m benchmarks.bench_serialization [--iterations 20000]
+"""
+import argparse
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.core.responses import FastJSONResponse, precompiled
+from app.models.user import User
+from app.schemas.transaction import SYNC_REPORT_ADAPTER
+from app.schemas.user import BalanceResponse
+
+BALANCE_ADAPTER = TypeAdapter(BalanceResponse)
+
+
+def cpu_per_call(iterations: int, fn, *args) -> float:
+    """Microsecondes CPU par appel."""
+    start = time.process_time()
+    for _ in range(iterations):
+        fn(*args)
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def make_report(errors: int) -> dict:
+    return {
+        "processed": 10_000 - errors, "failed": errors, "flagged": 12,
+        "errors": [{"uuid": f"7c1b2a0e-0000-4000-8000-{i:012d}", "msg": "Signature Ed25519 invalide"} for i in range(errors)],
+        "status": "partial_success" if errors else "success",
+    }
+
+
+def before_default(content) -> bytes:
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def after_report(report) -> bytes:
+    return precompiled(SYNC_REPORT_ADAPTER, report).body
+
+
+def after_balance_model(content) -> bytes:
+    # Ce que fait FastAPI pour une route à response_model : validation + dump_json
+    return BALANCE_ADAPTER.dump_json(BALANCE_ADAPTER.validate_python(content))
+
+
+def after_balance_orjson(content) -> bytes:
+    return FastJSONResponse(content).body
+
+
+def line(label: str, before: float, after: float):
+    print(f"{label:<32} | {before:>10.1f} | {after:>10.1f} | x{before / after:>5.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    n = args.iterations
+
+    print(f"{'µs CPU / requête':<32} | {'avant':>10} | {'après':>10} | gain")
+    print("-" * 66)
+    for errors in (0, 100, 1000):
+        report = make_report(errors)
+        iterations = max(n // max(errors, 1), 200)
+        assert before_default(report) and after_report(report)
+        line(f"rapport sync ({errors} erreurs)",
+             cpu_per_call(iterations, before_default, report), cpu_per_call(iterations, after_report, report))
+
+    balance = {"full_name": "Awa Kossou", "balance_atomic": 125_000, "offline_vault_atomic": 20_000}
+    before = cpu_per_call(n, before_default, balance)
+    line("solde (response_model)", before, cpu_per_call(n, after_balance_model, balance))
+    line("solde (dict + orjson)", before, cpu_per_call(n, after_balance_orjson, balance))
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add_all([
+            User(phone_number=f"229{i:08d}", full_name=f"Client {i}", pin_hash="x", public_key=f"{i:064x}")
+            for i in range(1000)
+        ])
+        db.commit()
+
+        def orm(phone):
+            user = db.query(User).filter(User.phone_number == phone).first()
+            db.expunge_all()
+            return user.id, user.full_name
+
+        def columns(phone):
+            row = db.query(User).filter(User.phone_number == phone).with_entities(User.id, User.full_name).first()
+            return row.id, row.full_name
+
+        iterations = max(n // 10, 200)
+        line("lecture User (SQLite mémoire)",
+             cpu_per_call(iterations, orm, "22900000500"), cpu_per_call(iterations, columns, "22900000500"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+BENCHMARK : Vérification Ed25519 des transactions synchronisées.
+
+Compare, pour 100 / 1k / 10k transactions :
+  - "naive"  : un VerifyKey(...) reconstruit par ligne, en série (ce qu'on aurait fait dans le handler)
+  - "cached" : VerifyKey en cache par sender_pk, en série
+  - "pool"   : VerifyKey en cache + vérification par paquets dans le pool de threads
+
+Usage : python -m benchmarks.bench_signatures [--senders 200] [--workers 4]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import nacl.signing
+
+from app.schemas.transaction import SingleTransaction
+from app.services import signatures
+
+MERCHANT_TAG = "22997000000"
+
+
+def make_transactions(count: int, senders: int):
+    keys = [nacl.signing.SigningKey.generate() for _ in range(senders)]
+    txs = []
+    for i in range(count):
+        key = keys[i % senders]
+        tx = SingleTransaction(
+            uuid=f"bench-{i}",
+            protocol_ver=1,
+            nonce=os.urandom(12).hex(),
+            timestamp=1_760_000_000_000 + i,
+            sender_pk=key.verify_key.encode().hex(),
+            receiver_pk="00" * 32,
+            amount=100 + i,
+            currency=952,
+            signature="",
+        )
+        tx.signature = key.sign(signatures.canonical_message(tx, MERCHANT_TAG)).signature.hex()
+        txs.append(tx)
+    return txs
+
+
+def run_naive(txs):
+    ok = 0
+    for tx in txs:
+        try:
+            key = nacl.signing.VerifyKey(bytes.fromhex(tx.sender_pk))
+            key.verify(signatures.canonical_message(tx, MERCHANT_TAG), bytes.fromhex(tx.signature))
+            ok += 1
+        except Exception:
+            pass
+    return ok
+
+
+def run_cached(txs):
+    jobs = [(tx.sender_pk, signatures.canonical_message(tx, MERCHANT_TAG), tx.signature) for tx in txs]
+    return sum(signatures.verify_chunk(jobs))
+
+
+def run_pool(txs, executor, chunk_size):
+    jobs = [(tx.sender_pk, signatures.canonical_message(tx, MERCHANT_TAG), tx.signature) for tx in txs]
+    return sum(signatures.verify_jobs(jobs, executor=executor, chunk_size=chunk_size))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--senders", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    args = parser.parse_args()
+
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    print(f"{'txs':>7} | {'naive (ms)':>11} | {'cached (ms)':>11} | {'pool (ms)':>10} | {'pool tx/s':>10}")
+    print("-" * 62)
+    for size in (int(s) for s in args.sizes.split(",")):
+        txs = make_transactions(size, args.senders)
+        signatures.get_verify_key.cache_clear()
+
+        naive_ok, naive_t = timed(run_naive, txs)
+        cached_ok, cached_t = timed(run_cached, txs)
+        pool_ok, pool_t = timed(run_pool, txs, executor, args.chunk_size)
+        assert naive_ok == cached_ok == pool_ok == size, "Verdicts incohérents"
+
+        print(f"{size:>7} | {naive_t * 1000:>11.1f} | {cached_t * 1000:>11.1f} | {pool_t * 1000:>10.1f} | {size / pool_t:>10.0f}")
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+BENCHMARK : format binaire (application/vnd.rema.batch) vs JSON pour /transactions/sync.
+
+Mesure, pour 100 / 1k / 10k transactions :
+  - la taille du corps (brut et gzip, ce que voit vraiment le réseau mobile)
+  - le coût de parsing côté serveur : pydantic model_validate_json vs wire_format.decode_batch
+    (CRC32 compris)
+
+Usage : python -m benchmarks.bench_wire_format [--sizes 100,1000,10000] [--repeat 5]
+"""
+import argparse
+import gzip
+import os
+import time
+import uuid
+
+from app.schemas.transaction import SingleTransaction, TransactionBatchRequest
+from app.services import wire_format
+
+
+def make_batch(count: int) -> TransactionBatchRequest:
+    merchant = os.urandom(32).hex()
+    senders = [os.urandom(32).hex() for _ in range(50)]
+    txs = [
+        SingleTransaction(
+            uuid=f"{1_760_000_000_000 + i}-{i % 9999}", protocol_ver=1, nonce=uuid.uuid4().hex[:24],
+            timestamp=1_760_000_000_000 + i, sender_pk=senders[i % 50], receiver_pk=merchant,
+            amount=500 + i, currency=952, signature=os.urandom(64).hex(),
+        )
+        for i in range(count)
+    ]
+    return TransactionBatchRequest(
+        merchant_pk=merchant, batch_id=str(int(time.time() * 1000)), device_id="22997000000",
+        count=count, sync_timestamp="2026-10-17T10:00:00", transactions=txs,
+    )
+
+
+def best_of(repeat: int, fn, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'txs':>6} | {'JSON (Ko)':>9} | {'bin (Ko)':>8} | {'JSON gz':>8} | {'bin gz':>7} | "
+          f"{'parse JSON (ms)':>15} | {'parse bin (ms)':>14}")
+    print("-" * 88)
+    for size in (int(s) for s in args.sizes.split(",")):
+        batch = make_batch(size)
+        as_json = batch.model_dump_json().encode()
+        as_bin = wire_format.encode_batch(batch)
+
+        decoded, bad = wire_format.decode_batch(as_bin)
+        assert not bad and len(decoded.transactions) == size
+
+        t_json = best_of(args.repeat, TransactionBatchRequest.model_validate_json, as_json)
+        t_bin = best_of(args.repeat, wire_format.decode_batch, as_bin)
+        print(f"{size:>6} | {len(as_json) / 1024:>9.1f} | {len(as_bin) / 1024:>8.1f} | "
+              f"{len(gzip.compress(as_json)) / 1024:>8.1f} | {len(gzip.compress(as_bin)) / 1024:>7.1f} | "
+              f"{t_json * 1000:>15.2f} | {t_bin * 1000:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,56 @@
-from fastapi import FastAPI, HTTPException
+# En premier : le chronomètre du démarrage part d'ici (python main.py --measure-startup)
+from app.core.startup import timeline
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.datastructures import Default
 from fastapi.middleware.cors import CORSMiddleware
-from app.core import database
-from app import models
+from starlette.concurrency import run_in_threadpool
+timeline.mark("fastapi")
+from app.core import admission, database, metrics, startup
+from app.core.config import settings
+from app.core.lazy import is_loaded, lazy_import
+from app.core.responses import FastJSONResponse
+timeline.mark("config + moteurs SQLAlchemy")
+from app import models, oauth2
 # Assure-toi que tes routers sont bien importés ici
-from app.routers import auth, users, transactions 
-import uvicorn
-import os
+from app.routers import auth, users, transactions, merchants
+from app.services import balances, blacklist, hashing, key_index, ledger, sync_jobs
+replay_filter = lazy_import("app.services.replay_filter")   # NumPy : chargé par la chauffe ou le 1er batch
+timeline.mark("modèles, routers, services")
+
+# Aucune requête SQL à l'import : le schéma est géré par python -m app.core.migrations
+# (ou dans le lifespan si STARTUP_MIGRATE), cf. app/core/startup.py
 
-# Création initiale des tables (si elles n'existent pas)
-database.Base.metadata.create_all(bind=database.engine)
+# Tâches de fond démarrées avec le serveur (et arrêtées proprement avec lui)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Migrations puis chauffe (pool, caches, filtre) AVANT d'accepter la 1re requête
+    await startup.start()
+    background = [asyncio.create_task(ledger.snapshot_loop())]
+    if database.replica_pool is not None:
+        background.append(asyncio.create_task(database.health_loop()))
+    if balances.sharding_enabled():
+        background.append(asyncio.create_task(balances.fold_loop()))
+    # Workers de la file de sync : tout de suite si la file sert, sinon au 1er "Prefer: respond-async"
+    if settings.SYNC_ASYNC_JOBS or await run_in_threadpool(sync_jobs.pending_jobs):
+        sync_jobs.ensure_workers()
+    yield
+    for task in background:
+        task.cancel()
+    sync_jobs.stop_workers()
+    if is_loaded(replay_filter):
+        replay_filter.flush()
 
-app = FastAPI(title="REMA Backend Core", version="1.0.2")
+# Default(...) : orjson pour les routes qui renvoient des dicts, sans priver les routes
+# à response_model du rendu direct pydantic -> octets de FastAPI
+app = FastAPI(
+    title="REMA Backend Core", version="1.0.2", lifespan=lifespan,
+    default_response_class=Default(FastJSONResponse),
+)
+timeline.mark("application FastAPI")
 
 # Configuration CORS (Accepte tout pour le développement)
 app.add_middleware(
@@ -21,10 +61,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latence par route, SQL par requête, traces lentes (/metrics) ; X-SQL-Count pour benchmarks/load_suite.py
+if settings.METRICS_ENABLED or settings.SQL_COUNT_HEADER:
+    app.add_middleware(metrics.MetricsMiddleware, sql_count_header=settings.SQL_COUNT_HEADER)
+
 # Inclusion des routes
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(transactions.router) 
+app.include_router(merchants.router)
 
 @app.get("/")
 def root():
@@ -34,6 +79,33 @@ def root():
         "system": "Atomic Int + Ed25519 Security"
     }
 
+# 📊 STATISTIQUES DES CACHES (cache d'identité, tokens, filtre anti-rejeu)
+@app.get("/sys/cache-stats")
+def cache_stats():
+    stats = oauth2.cache_stats()
+    stats["replay_filter"] = replay_filter.stats() if is_loaded(replay_filter) else None
+    stats["hashing"] = hashing.stats()
+    stats["key_index"] = key_index.index.stats()
+    stats["blacklist"] = blacklist.stats()
+    stats["replicas"] = database.replica_pool.stats() if database.replica_pool else []
+    stats["admission"] = admission.stats()
+    return stats
+
+# 📈 MÉTRIQUES PROMETHEUS (par processus : un scrape par worker)
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+# 🐢 REQUÊTES LENTES RÉCENTES (texte SQL pour l'échantillon METRICS_TRACE_SAMPLE_RATE)
+@app.get("/sys/slow-traces")
+def slow_traces(clear: bool = False):
+    return {"threshold_seconds": settings.METRICS_SLOW_REQUEST_SECONDS, "traces": metrics.dump_traces(clear)}
+
+# ⏱️ DÉTAIL DU DERNIER DÉMARRAGE (import, migrations, chauffe)
+@app.get("/sys/startup")
+def startup_report():
+    return timeline.as_dict()
+
 # ⚠️ ROUTE DANGEREUSE : RÉINITIALISATION DB
 # À utiliser UNIQUEMENT pour nettoyer la base après le changement de type (Float -> Int)
 # URL: /sys/dangerous-reset-db?admin_key=REMA_MASTER_RESET_2026
@@ -50,6 +122,14 @@ def reset_database(admin_key: str):
         
         # 2. On recrée tout propre (Create All)
         database.Base.metadata.create_all(bind=database.engine)
+
+        # 3. Les ids vont être réutilisés : on vide les caches d'identité
+        oauth2.identity_cache.clear()
+        oauth2.token_cache.clear()
+        key_index.index.clear()
+        blacklist.reset()
+        with database.SessionLocal() as db:
+            replay_filter.rebuild(db)
         
         return {
             "status": "success", 
@@ -59,5 +139,10 @@ def reset_database(admin_key: str):
         return {"status": "error", "message": str(e)}
 
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 10000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    if "--measure-startup" in sys.argv:
+        startup.measure(app)
+    else:
+        import uvicorn
+
+        port = int(os.environ.get("PORT", 10000))
+        uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,64 @@
+"""
+Fixtures communes : une base SQLite temporaire pour toute la session, l'application servie
+par TestClient (lifespan compris). Chaque test crée ses propres comptes (numéros et clés
+uniques) : pas de remise à zéro entre les tests.
+
+    cd rema_backend && python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+_workdir = tempfile.mkdtemp(prefix="rema-tests-")
+# Avant tout import de l'application : settings et engine sont construits à l'import
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_workdir}/rema.db",
+    SYNC_JOBS_DB_PATH=os.path.join(_workdir, "jobs.db"),
+    SYNC_JOB_WORKERS="0",
+    REPLAY_FILTER_PATH="",
+    ARCHIVE_PATH=os.path.join(_workdir, "archive"),
+    BCRYPT_ROUNDS="4",
+    ADMISSION_KEY_LIMITS="false",
+    LEDGER_SNAPSHOT_INTERVAL_SECONDS="3600",
+    STARTUP_MIGRATE="true",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.core import database
+
+PIN = "1234"
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_user(client):
+    """Inscrit un compte neuf (bonus de 50 000) : renvoie (numéro, clé publique)."""
+    def _make(public_key: str = None):
+        phone = uuid.uuid4().hex[:12]
+        public_key = public_key or uuid.uuid4().hex * 2
+        response = client.post("/auth/signup", json={
+            "phone_number": phone, "pin_hash": PIN, "full_name": "test",
+            "public_key": public_key, "device_hardware_id": "device",
+        })
+        assert response.status_code == 201, response.text
+        return phone, public_key
+    return _make
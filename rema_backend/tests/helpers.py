@@ -0,0 +1,61 @@
+"""Constructeurs de requêtes partagés par les tests."""
+import random
+import string
+import time
+import uuid
+
+ALPHABET = string.ascii_letters + string.digits
+
+
+def mobile_ids() -> tuple:
+    """uuid "<ms>-<rand>" et nonce de 24 caractères, comme rema_pay.dart."""
+    return f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}", "".join(random.choices(ALPHABET, k=24))
+
+
+def offline_tx(sender_pk: str, amount: int = 1000, timestamp: int = None, **fields) -> dict:
+    tx_uuid, nonce = mobile_ids()
+    return {
+        "uuid": tx_uuid, "protocol_ver": 1, "nonce": nonce,
+        "timestamp": timestamp if timestamp is not None else int(time.time() * 1000),
+        "sender_pk": sender_pk, "receiver_pk": "-", "amount": amount, "currency": 952,
+        "signature": "ab" * 64, **fields,
+    }
+
+
+def batch(merchant_pk: str, transactions: list, batch_id: str = None) -> dict:
+    return {
+        "merchant_pk": merchant_pk, "batch_id": batch_id or uuid.uuid4().hex, "device_id": "device",
+        "count": len(transactions), "sync_timestamp": "t", "transactions": transactions,
+    }
+
+
+def balance(client, phone: str) -> dict:
+    response = client.get(f"/users/{phone}/balance")
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def signed_tx(signing_key, merchant_phone: str, amount: int = 1000, **fields) -> dict:
+    """Transaction signée comme par l'app : Ed25519 sur signatures.canonical_message."""
+    from app.schemas.transaction import SingleTransaction
+    from app.services import signatures
+
+    tx = offline_tx(signing_key.verify_key.encode().hex(), amount, **fields)
+    message = signatures.canonical_message(SingleTransaction.model_validate(tx), signatures.merchant_tag(merchant_phone))
+    tx["signature"] = signing_key.sign(message).signature.hex()
+    return tx
+
+
+def binary(payload: dict) -> dict:
+    """Arguments de client.post pour envoyer `payload` (un batch) au format binaire."""
+    from app.schemas.transaction import TransactionBatchRequest
+    from app.services import wire_format
+
+    body = wire_format.encode_batch(TransactionBatchRequest.model_validate(payload))
+    return {"content": body, "headers": {"Content-Type": wire_format.CONTENT_TYPE}}
+
+
+def auth(client, phone: str, pin: str = "1234") -> dict:
+    response = client.post("/auth/login", data={"username": phone, "password": pin})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,98 @@
+"""Contrôle d'admission : seau de jetons par clé, ordre de délestage des classes, 429 + Retry-After."""
+import pytest
+
+from app.core import admission, metrics
+
+settings = admission.settings
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_store_token_bucket_refills_at_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    store = admission.MemoryStore(100)
+
+    assert [store.take("device:a", rate=2.0, burst=3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert store.take("device:a", rate=2.0, burst=3) == pytest.approx(0.5)
+    # Seaux indépendants par clé
+    assert store.take("device:b", rate=2.0, burst=3) == 0.0
+
+    clock.now += 0.5
+    assert store.take("device:a", rate=2.0, burst=3) == 0.0
+    # Jamais plus que la rafale, même après une longue pause
+    clock.now += 3600
+    assert [store.take("device:a", rate=2.0, burst=3) for _ in range(4)][-1] > 0
+
+
+def test_memory_store_concurrency_slots():
+    store = admission.MemoryStore(100)
+    first = store.acquire("merchant:m", limit=2, ttl=60)
+    second = store.acquire("merchant:m", limit=2, ttl=60)
+    assert first and second and store.acquire("merchant:m", limit=2, ttl=60) is None
+    store.release("merchant:m", first)
+    assert store.acquire("merchant:m", limit=2, ttl=60) is not None
+
+
+def test_stores_must_implement_the_interface():
+    class Partial(admission.AdmissionStore):
+        def take(self, key, rate, burst):
+            return 0.0
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def shed(klass):
+    try:
+        admission.check_load(klass)
+    except admission.Rejected as e:
+        return e.reason
+    return None
+
+
+def test_check_load_sheds_bulk_first_and_reads_last(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_INFLIGHT", 10)
+    monkeypatch.setattr(settings, "ADMISSION_WRITE_SHARE", 0.8)
+    monkeypatch.setattr(settings, "ADMISSION_BULK_SHARE", 0.5)
+    monkeypatch.setattr(metrics.POOL_WAIT_RECENT, "value", lambda: 0.0)
+
+    def at_depth(depth):
+        monkeypatch.setattr(admission, "_inflight", {admission.CLASS_READ: depth, admission.CLASS_WRITE: 0, admission.CLASS_BULK: 0})
+        return [shed(klass) for klass in (admission.CLASS_BULK, admission.CLASS_WRITE, admission.CLASS_READ)]
+
+    assert at_depth(4) == [None, None, None]
+    assert at_depth(5) == ["queue_depth", None, None]
+    assert at_depth(8) == ["queue_depth", "queue_depth", None]
+    assert at_depth(10) == ["queue_depth", "queue_depth", "queue_depth"]
+
+    # Pool qui attend : la sync d'abord, puis les recharges ; les lectures passent toujours
+    at_depth(0)
+    monkeypatch.setattr(metrics.POOL_WAIT_RECENT, "value", lambda: settings.ADMISSION_BULK_MAX_POOL_WAIT * 2)
+    assert [shed(k) for k in (admission.CLASS_BULK, admission.CLASS_WRITE, admission.CLASS_READ)] == ["pool_wait", None, None]
+    monkeypatch.setattr(metrics.POOL_WAIT_RECENT, "value", lambda: settings.ADMISSION_WRITE_MAX_POOL_WAIT * 2)
+    assert [shed(k) for k in (admission.CLASS_BULK, admission.CLASS_WRITE, admission.CLASS_READ)] == ["pool_wait", "pool_wait", None]
+
+
+def test_per_phone_rate_limit_answers_429_with_retry_after(client, make_user, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_KEY_LIMITS", True)
+    monkeypatch.setattr(settings, "ADMISSION_PHONE_RATE", 0.1)
+    monkeypatch.setattr(settings, "ADMISSION_PHONE_BURST", 1)
+    monkeypatch.setattr(admission, "store", admission.MemoryStore(100))
+    phone, _ = make_user()
+
+    assert client.post("/users/recharge-offline", json={"phone": phone, "amount": 1}).status_code == 200
+    refused = client.post("/users/recharge-offline", json={"phone": phone, "amount": 1})
+    assert refused.status_code == 429
+    # 10 s d'attente de jeton, gigue de +/- 25 %
+    assert 7 <= int(refused.headers["Retry-After"]) <= 13
+    # Un autre numéro a son propre seau
+    other, _ = make_user()
+    assert client.post("/users/recharge-offline", json={"phone": other, "amount": 1}).status_code == 200
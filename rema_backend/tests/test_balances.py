@@ -0,0 +1,79 @@
+"""Soldes sous concurrence : recharges conditionnelles sans découvert, débits de vault sans mise à jour perdue."""
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+from app.core import database
+from app.models.user import User
+from app.services import balances
+
+THREADS = 16
+
+
+def accounts(phone: str):
+    with database.SessionLocal() as db:
+        return db.execute(
+            select(User.balance_atomic, User.offline_reserved_atomic).where(User.phone_number == phone)
+        ).one()
+
+
+def recharge(phone: str, amount: int) -> bool:
+    with database.SessionLocal() as db:
+        done = balances.move_to_vault(db, phone, amount) is not None
+        db.commit()
+        return done
+
+
+def test_concurrent_recharges_never_overdraw(make_user):
+    phone, _ = make_user()
+    # 80 demandes de 1 000 pour 50 000 en banque : exactement 50 doivent passer
+    with ThreadPoolExecutor(THREADS) as pool:
+        results = list(pool.map(lambda _: recharge(phone, 1000), range(80)))
+
+    assert results.count(True) == 50
+    assert tuple(accounts(phone)) == (0, 50000)
+
+
+def test_concurrent_sharded_credits_and_folds_keep_every_unit(make_user, monkeypatch):
+    monkeypatch.setattr(balances.settings, "BALANCE_MODE", "sharded")
+    phone, _ = make_user()
+    with database.SessionLocal() as db:
+        user_id = db.execute(select(User.id).where(User.phone_number == phone)).scalar()
+
+    def credit(_):
+        with database.SessionLocal() as db:
+            balances.credit(db, user_id, 1)
+            db.commit()
+        balances.fold_all()
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(credit, range(200)))
+    balances.fold_all()
+
+    assert tuple(accounts(phone)) == (50200, 0)
+
+    # Crédit resté en attente : la recharge replie les shards quand la banque seule ne suffit pas
+    with database.SessionLocal() as db:
+        balances.credit(db, user_id, 10)
+        db.commit()
+    assert recharge(phone, 50210)
+    assert tuple(accounts(phone)) == (0, 50210)
+
+
+def test_concurrent_vault_debits_lose_nothing_and_may_overdraw(make_user):
+    phone, _ = make_user()
+    assert recharge(phone, 1000)
+    with database.SessionLocal() as db:
+        user_id = db.execute(select(User.id).where(User.phone_number == phone)).scalar()
+
+    def debit(_):
+        with database.SessionLocal() as db:
+            balances.debit_vaults(db, {user_id: 30})
+            db.commit()
+
+    # 50 paiements hors-ligne de 30 déjà faits sur une réserve de 1 000 : tous sont débités
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(debit, range(50)))
+
+    # Découvert de 500 : c'est lui que le scoring anti-fraude signale (OVER_BUDGET)
+    assert tuple(accounts(phone)) == (49000, -500)
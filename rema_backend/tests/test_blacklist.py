@@ -0,0 +1,64 @@
+"""Blacklist servie aux terminaux : deltas ?since=, ETag / 304, format binaire."""
+import uuid
+
+from app.core.keys import fingerprint
+from app.services import blacklist
+
+URL = "/users/security/blacklist"
+
+
+def blacklist_keys(db, count: int):
+    keys = [uuid.uuid4().hex * 2 for _ in range(count)]
+    assert blacklist.add(db, {key: "DOUBLE_SPEND" for key in keys}) == count
+    db.commit()
+    return keys
+
+
+def test_since_returns_only_new_keys(client, db):
+    blacklist_keys(db, 2)
+    first = client.get(URL)
+    version = int(first.headers["X-Blacklist-Version"])
+
+    added = blacklist_keys(db, 3)
+    delta = client.get(URL, params={"since": version})
+    assert delta.status_code == 200
+    assert delta.json() == sorted(added)
+    assert int(delta.headers["X-Blacklist-Version"]) > version
+    assert set(added) <= set(client.get(URL).json())
+
+    latest = int(delta.headers["X-Blacklist-Version"])
+    assert client.get(URL, params={"since": latest}).json() == []
+
+
+def test_already_blacklisted_key_keeps_its_version(client, db):
+    key = blacklist_keys(db, 1)[0]
+    version = int(client.get(URL).headers["X-Blacklist-Version"])
+    assert blacklist.add(db, {key: "OVER_BUDGET"}) == 0
+    db.commit()
+    assert key not in client.get(URL, params={"since": version}).json()
+
+
+def test_etag_gives_304_until_the_list_changes(client, db):
+    blacklist_keys(db, 1)
+    first = client.get(URL)
+    etag = first.headers["ETag"]
+
+    cached = client.get(URL, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    blacklist_keys(db, 1)
+    changed = client.get(URL, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_binary_delta(client, db):
+    version = int(client.get(URL).headers["X-Blacklist-Version"])
+    added = blacklist_keys(db, 2)
+    response = client.get(URL, params={"since": version}, headers={"Accept": blacklist.BINARY_CONTENT_TYPE})
+    magic, flags, new_version, since, count = blacklist.HEADER.unpack_from(response.content)
+    assert (magic, flags, since, count) == (blacklist.MAGIC, blacklist.FLAG_DELTA, version, 2)
+    assert new_version == int(response.headers["X-Blacklist-Version"])
+    body = response.content[blacklist.HEADER.size:]
+    assert body == b"".join(fingerprint(key) for key in sorted(added))
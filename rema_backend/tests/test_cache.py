@@ -0,0 +1,37 @@
+"""Cache d'identité à deux niveaux : clear() doit aussi vider le backend partagé."""
+from app.core.cache import CacheBackend, TwoLevelCache
+
+
+class DictBackend(CacheBackend):
+    """Backend partagé en mémoire (même contrat que RedisBackend, sans expiration)."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ttl):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def clear(self, prefix):
+        for key in [k for k in self.data if k.startswith(prefix)]:
+            del self.data[key]
+
+
+def test_clear_drops_shared_entries_of_its_namespace_only():
+    shared = DictBackend()
+    identities = TwoLevelCache("identity", 100, 60, shared)
+    other = TwoLevelCache("other", 100, 60, shared)
+    identities.set(1, {"id": 1, "phone_number": "ancien"})
+    other.set(1, {"id": 1})
+
+    identities.clear()
+
+    # Un autre worker (L1 vide) ne doit plus relire l'ancienne identité depuis L2
+    assert TwoLevelCache("identity", 100, 60, shared).get(1) is None
+    assert identities.get(1) is None
+    assert other.get(1) == {"id": 1}
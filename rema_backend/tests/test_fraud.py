@@ -0,0 +1,67 @@
+"""Scoring anti-fraude à la sync : dépassement de réserve -> paiement marqué, payeur blacklisté."""
+import time
+
+from sqlalchemy import select
+
+from app.models.blacklist import BlacklistEntry
+from app.models.transaction import Transaction
+from app.services import blacklist
+from helpers import batch, offline_tx
+
+
+def sync(client, merchant_pk, txs):
+    response = client.post("/transactions/sync", json=batch(merchant_pk, txs))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def reason(db, public_key):
+    db.rollback()
+    return db.execute(select(BlacklistEntry.reason).where(BlacklistEntry.public_key == public_key)).scalar()
+
+
+def flagged(db, tx):
+    return db.execute(select(Transaction.is_flagged_suspicious).where(Transaction.transaction_uuid == tx["uuid"])).scalar()
+
+
+def test_payment_within_reserve_is_not_flagged(client, make_user, db):
+    _, merchant_pk = make_user()
+    payer_phone, payer_pk = make_user()
+    client.post("/users/recharge-offline", json={"phone": payer_phone, "amount": 1000})
+    version = blacklist.current_version(db)
+
+    report = sync(client, merchant_pk, [offline_tx(payer_pk, 600), offline_tx(payer_pk, 400)])
+    assert (report["processed"], report["flagged"]) == (2, 0)
+    assert reason(db, payer_pk) is None
+    assert blacklist.current_version(db) == version
+
+
+def test_over_budget_flags_and_blacklists_the_payer(client, make_user, db):
+    _, merchant_pk = make_user()
+    payer_phone, payer_pk = make_user()
+    client.post("/users/recharge-offline", json={"phone": payer_phone, "amount": 1000})
+    version = blacklist.current_version(db)
+    now = int(time.time() * 1000)
+    # Réserve consommée dans l'ordre des horodatages : seul le second paiement la dépasse
+    within, over = offline_tx(payer_pk, 800, now - 1000), offline_tx(payer_pk, 800, now)
+
+    report = sync(client, merchant_pk, [within, over])
+    assert (report["processed"], report["flagged"]) == (2, 1)
+    assert (flagged(db, within), flagged(db, over)) == (False, True)
+    assert reason(db, payer_pk) == "OVER_BUDGET"
+    assert blacklist.current_version(db) == version + 1
+    assert payer_pk in client.get("/users/security/blacklist", params={"since": version}).json()
+
+
+def test_reserve_spent_at_another_merchant_is_a_double_spend(client, make_user, db):
+    _, first_merchant = make_user()
+    _, second_merchant = make_user()
+    payer_phone, payer_pk = make_user()
+    client.post("/users/recharge-offline", json={"phone": payer_phone, "amount": 1000})
+    assert sync(client, first_merchant, [offline_tx(payer_pk, 1000)])["flagged"] == 0
+    version = blacklist.current_version(db)
+
+    report = sync(client, second_merchant, [offline_tx(payer_pk, 1000)])
+    assert (report["processed"], report["flagged"]) == (1, 1)
+    assert reason(db, payer_pk) == "DOUBLE_SPEND"
+    assert blacklist.current_version(db) == version + 1
@@ -0,0 +1,71 @@
+"""Historique paginé : même pages avant et après archivage, archive lue seulement quand il le faut."""
+import time
+
+from app.services import archive, partitions
+from helpers import batch, offline_tx
+
+DAY_MS = 86_400_000
+
+
+def login(client, phone: str) -> dict:
+    token = client.post("/auth/login", data={"username": phone, "password": "1234"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def all_pages(client, headers: dict, limit: int) -> list:
+    items, cursor = [], None
+    while True:
+        params = {"direction": "in", "limit": limit, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/transactions/history", params=params, headers=headers).json()
+        items += [(item["timestamp"], item["uuid"]) for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def test_pages_are_identical_once_old_months_are_archived(client, make_user, db, monkeypatch):
+    merchant_phone, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    now = int(time.time() * 1000)
+    txs = [offline_tx(payer_pk, amount=10, timestamp=now - i * 1000) for i in range(12)]
+    txs += [offline_tx(payer_pk, amount=10, timestamp=now - (200 + i * 20) * DAY_MS) for i in range(6)]
+    assert client.post("/transactions/sync", json=batch(merchant_pk, txs)).json()["processed"] == 18
+    headers = login(client, merchant_phone)
+    before = all_pages(client, headers, limit=5)
+    assert len(before) == 18
+
+    assert partitions.archive_old_partitions(db)
+    assert all_pages(client, headers, limit=5) == before
+
+    # 1re page remplie par le mois en cours : l'archive n'est pas lue
+    visited = []
+    history_rows = archive.history_rows
+    monkeypatch.setattr(archive, "history_rows", lambda *args: visited.append(args) or history_rows(*args))
+    page = client.get("/transactions/history", params={"direction": "in", "limit": 5}, headers=headers).json()
+    assert [(i["timestamp"], i["uuid"]) for i in page["items"]] == before[:5]
+    assert visited == []
+
+
+def test_segments_outside_the_page_are_skipped(client, make_user, db, monkeypatch):
+    merchant_phone, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    now = int(time.time() * 1000)
+    # Un mois archivé par paiement : un segment chacun
+    txs = [offline_tx(payer_pk, amount=10, timestamp=now - (120 + i * 31) * DAY_MS) for i in range(5)]
+    assert client.post("/transactions/sync", json=batch(merchant_pk, txs)).json()["processed"] == 5
+    partitions.archive_old_partitions(db)
+
+    scanned = []
+    segment_history = archive.Segment.history
+    monkeypatch.setattr(archive.Segment, "history", lambda self, *args: scanned.append(self.path) or segment_history(self, *args))
+    rows = archive.history_rows(db, "receiver_pubk_hash", merchant_pk, "in", "sender_pubk_hash", None, None, 2)
+    assert [row.timestamp for row in rows] == [txs[0]["timestamp"], txs[1]["timestamp"]]
+    # Page pleine : aucun segment plus ancien que sa dernière ligne n'est ouvert
+    assert not any(s.path in scanned for s in archive.store.segments if s.max_timestamp < txs[1]["timestamp"])
+
+    after = (txs[1]["timestamp"], rows[1].id)
+    scanned.clear()
+    rows = archive.history_rows(db, "receiver_pubk_hash", merchant_pk, "in", "sender_pubk_hash", None, after, 2)
+    assert [row.timestamp for row in rows] == [txs[2]["timestamp"], txs[3]["timestamp"]]
+    # Segments entièrement plus récents que le curseur : déjà servis
+    assert not any(s.path in scanned for s in archive.store.segments if s.min_timestamp > after[0])
@@ -0,0 +1,117 @@
+"""Journal : snapshot + queue == somme complète des entrées, même quand deux replis se croisent ; verify / repair."""
+from sqlalchemy import func, select
+
+from app.models.ledger import ACCOUNT_BANK, ACCOUNT_VAULT
+from app.models.user import User
+from app.services import ledger
+
+entries = ledger.entries_table
+snapshots = ledger.snapshots_table
+
+
+def full_sum(db, user_id: int, account: str, up_to: int = None) -> int:
+    query = select(func.coalesce(func.sum(entries.c.amount_atomic), 0)).where(
+        entries.c.user_id == user_id, entries.c.account == account
+    )
+    if up_to is not None:
+        query = query.where(entries.c.id <= up_to)
+    return db.execute(query).scalar()
+
+
+def assert_consistent(db, user_id: int):
+    for account in (ACCOUNT_BANK, ACCOUNT_VAULT):
+        assert ledger.read_balances(db, user_id)[account] == full_sum(db, user_id, account)
+        snap = db.execute(
+            select(snapshots.c.balance_atomic, snapshots.c.last_entry_id)
+            .where(snapshots.c.user_id == user_id, snapshots.c.account == account)
+        ).first()
+        if snap is not None:
+            assert snap.balance_atomic == full_sum(db, user_id, account, up_to=snap.last_entry_id)
+
+
+def racing(db):
+    """Fait passer un repli complet (autre worker) juste après la lecture des deltas par `db`."""
+    execute = db.execute
+    calls = []
+
+    def wrapped(*args, **kwargs):
+        result = execute(*args, **kwargs)
+        calls.append(1)
+        if len(calls) == 3:
+            # Lignes lues d'abord : le curseur ouvert garderait le verrou de lecture SQLite
+            result = result.freeze()()
+            ledger.snapshot_all()
+        return result
+
+    db.execute = wrapped
+    return db
+
+
+def test_snapshot_plus_tail_equals_full_sum(client, make_user, db, monkeypatch):
+    monkeypatch.setattr(ledger.settings, "LEDGER_SNAPSHOT_LAG_SECONDS", -60)
+    phone, _ = make_user()
+    user_id = db.execute(select(User.id).where(User.phone_number == phone)).scalar()
+    for amount in (100, 250, 1000):
+        assert client.post("/users/recharge-offline", json={"phone": phone, "amount": amount}).status_code == 200
+    assert_consistent(db, user_id)
+
+    ledger.snapshot_all()
+    db.rollback()
+    assert_consistent(db, user_id)
+
+    # Queue après le snapshot
+    assert client.post("/users/recharge-offline", json={"phone": phone, "amount": 7}).status_code == 200
+    db.rollback()
+    assert_consistent(db, user_id)
+    assert ledger.read_balances(db, user_id) == {ACCOUNT_BANK: 50000 - 1357, ACCOUNT_VAULT: 1357}
+
+
+def test_concurrent_folds_apply_the_tail_once(client, make_user, db, monkeypatch):
+    monkeypatch.setattr(ledger.settings, "LEDGER_SNAPSHOT_LAG_SECONDS", -60)
+    phone, _ = make_user()
+    user_id = db.execute(select(User.id).where(User.phone_number == phone)).scalar()
+    db.rollback()
+
+    # 1er repli du compte : les deux replis veulent créer la case
+    assert client.post("/users/recharge-offline", json={"phone": phone, "amount": 300}).status_code == 200
+    assert ledger.take_snapshot(racing(db)) == 0
+    db.commit()
+    assert_consistent(db, user_id)
+
+    # Case existante : le compare-and-set sur last_entry_id écarte le repli en retard
+    assert client.post("/users/recharge-offline", json={"phone": phone, "amount": 40}).status_code == 200
+    ledger.take_snapshot(db)
+    db.commit()
+    assert client.post("/users/recharge-offline", json={"phone": phone, "amount": 5}).status_code == 200
+    assert ledger.take_snapshot(racing(db)) == 0
+    db.commit()
+    assert_consistent(db, user_id)
+    assert ledger.read_balances(db, user_id) == {ACCOUNT_BANK: 50000 - 345, ACCOUNT_VAULT: 345}
+
+
+def test_entry_committed_under_the_watermark_is_detected_and_repaired(client, make_user, db, monkeypatch):
+    monkeypatch.setattr(ledger.settings, "LEDGER_SNAPSHOT_LAG_SECONDS", -60)
+    phone, _ = make_user()
+    user_id = db.execute(select(User.id).where(User.phone_number == phone)).scalar()
+    ledger.snapshot_all()
+
+    # Un id plus grand est commité et replié pendant qu'une transaction plus ancienne
+    # (id plus petit) est encore ouverte : c'est ce que safe_high_watermark empêche sur Postgres
+    late_id = db.execute(select(func.max(entries.c.id))).scalar() + 1
+    db.execute(entries.insert(), [
+        {"id": late_id + 10, "user_id": user_id, "account": ACCOUNT_BANK, "amount_atomic": -100, "kind": "RECHARGE"},
+        {"id": late_id + 11, "user_id": user_id, "account": ACCOUNT_VAULT, "amount_atomic": 100, "kind": "RECHARGE"},
+    ])
+    db.commit()
+    ledger.snapshot_all()
+    db.execute(entries.insert().values(id=late_id, user_id=user_id, account=ACCOUNT_BANK, amount_atomic=-7, kind="RECHARGE"))
+    db.commit()
+    assert ledger.read_balances(db, user_id)[ACCOUNT_BANK] != full_sum(db, user_id, ACCOUNT_BANK)
+
+    report = ledger.verify(db)
+    assert not report["ok"]
+    assert [(c["user_id"], c["account"]) for c in report["samples"]] == [(user_id, ACCOUNT_BANK)]
+
+    assert ledger.repair(db) == {"repaired": 1}
+    assert ledger.verify(db)["ok"]
+    assert_consistent(db, user_id)
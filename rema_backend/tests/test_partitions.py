@@ -0,0 +1,49 @@
+"""Partitions mensuelles : coût indépendant de l'écart entre horodatages, lignes hors bornes écartées."""
+from datetime import datetime, timezone
+
+from sqlalchemy import event, update
+
+from app.core import database
+from app.schemas.transaction import TIMESTAMP_MAX_MS
+from app.services import partitions
+from helpers import batch, offline_tx
+
+transactions = partitions.transactions
+
+
+def count_statements(fn, *args):
+    statements = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", listener)
+    try:
+        return fn(*args), len(statements)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", listener)
+
+
+def test_hot_partitions_is_one_query_whatever_the_timestamp_spread(client, make_user, db):
+    _, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    first, last = offline_tx(payer_pk, 10, 0), offline_tx(payer_pk, 10, TIMESTAMP_MAX_MS)
+    assert client.post("/transactions/sync", json=batch(merchant_pk, [first, last])).json()["processed"] == 2
+    try:
+        parts, statements = count_statements(partitions.hot_partitions, db)
+        assert statements == 1
+        keys = [part["partition"] for part in parts]
+        assert keys[0] == "1970-01" and keys[-1] == "9999-12" and keys == sorted(keys)
+        assert partitions.partition_bounds("9999-12") == (
+            int(datetime(9999, 12, 1, tzinfo=timezone.utc).timestamp() * 1000), TIMESTAMP_MAX_MS + 1,
+        )
+
+        # Ligne écrite avant la validation à l'ingestion : hors de tout mois, jamais archivée
+        db.execute(update(transactions).where(transactions.c.transaction_uuid == last["uuid"]).values(timestamp=10 ** 18))
+        db.commit()
+        assert partitions.out_of_range_rows(db) == 1
+        assert "9999-12" not in [part["partition"] for part in partitions.status(db)["hot"]]
+        assert all(part["partition"] != "9999-12" for part in partitions.archive_old_partitions(db, dry_run=True))
+    finally:
+        db.execute(update(transactions).where(transactions.c.transaction_uuid == last["uuid"]).values(timestamp=TIMESTAMP_MAX_MS))
+        db.commit()
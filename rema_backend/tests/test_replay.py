@@ -0,0 +1,80 @@
+"""Anti-rejeu : un paiement déjà synchronisé n'est jamais recrédité, qu'il soit dans la table ou archivé."""
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import database
+from app.services import partitions, replay_filter
+from helpers import balance, batch, offline_tx
+
+DAY_MS = 86_400_000
+
+
+def test_replay_of_hot_uuid_and_nonce_is_ignored(client, make_user):
+    merchant_phone, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    tx = offline_tx(payer_pk, amount=1000)
+
+    first = client.post("/transactions/sync", json=batch(merchant_pk, [tx])).json()
+    assert first["processed"] == 1
+
+    same_uuid = dict(tx, nonce=uuid.uuid4().hex)
+    same_nonce = dict(tx, uuid=str(uuid.uuid4()))
+    replay = client.post("/transactions/sync", json=batch(merchant_pk, [tx, same_uuid, same_nonce])).json()
+    assert replay["processed"] == 0
+    assert balance(client, merchant_phone)["balance_atomic"] == 51000
+
+
+def test_replay_of_archived_payment_is_ignored_even_when_filter_misses(client, make_user, db, monkeypatch):
+    merchant_phone, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    # Horodatage fourni par le client : 200 jours, le mois est archivable tout de suite
+    tx = offline_tx(payer_pk, amount=1000, timestamp=int(time.time() * 1000) - 200 * DAY_MS)
+    assert client.post("/transactions/sync", json=batch(merchant_pk, [tx])).json()["processed"] == 1
+
+    assert partitions.archive_old_partitions(db)
+
+    # Worker dont le filtre a été chargé avant la sync : il ne connaît ni l'uuid ni le nonce
+    stale = replay_filter.BloomFilter(1000, 0.001)
+    stale.watermark = 1 << 62
+    monkeypatch.setattr(replay_filter, "_filter", stale)
+
+    replay = client.post("/transactions/sync", json=batch(merchant_pk, [tx])).json()
+    assert replay["processed"] == 0
+    nonce_only = client.post("/transactions/sync", json=batch(merchant_pk, [dict(tx, uuid=str(uuid.uuid4()))])).json()
+    assert nonce_only["processed"] == 0
+    assert balance(client, merchant_phone)["balance_atomic"] == 51000
+
+
+def test_workers_starting_together_share_one_filter_file(client, make_user, monkeypatch, tmp_path):
+    _, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    tx = offline_tx(payer_pk)
+    assert client.post("/transactions/sync", json=batch(merchant_pk, [tx])).json()["processed"] == 1
+    path = str(tmp_path / "replay.bloom")
+    monkeypatch.setattr(replay_filter.settings, "REPLAY_FILTER_PATH", path)
+    monkeypatch.setattr(replay_filter.settings, "REPLAY_FILTER_CAPACITY", 100_000)
+
+    def start_worker(_):
+        with database.SessionLocal() as db:
+            return replay_filter._load(db)
+
+    with ThreadPoolExecutor(4) as pool:
+        filters = list(pool.map(start_worker, range(4)))
+
+    # Un seul worker a créé le fichier, les autres l'ont trouvé rempli
+    assert sorted(flt.loaded_from_disk for flt in filters) == [False, True, True, True]
+    keys = [replay_filter.uuid_key(tx["uuid"]), replay_filter.nonce_key(tx["nonce"])]
+    assert all(flt.might_contain_many(keys).all() for flt in filters)
+
+    # Bits partagés : une clé ajoutée par un worker est vue par les autres
+    filters[0].add_many(["u:ajoutée-ailleurs"])
+    assert filters[3].might_contain_many(["u:ajoutée-ailleurs"]).all()
+
+    # Un worker en retard ne fait jamais reculer le filigrane commun
+    watermark = filters[0].watermark
+    filters[1].watermark = 1
+    with replay_filter.file_lock(path):
+        filters[1].flush()
+    with open(path, "rb") as f:
+        assert replay_filter.FILE_HEADER.unpack(f.read(replay_filter.FILE_HEADER.size))[3] == watermark
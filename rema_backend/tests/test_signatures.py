@@ -0,0 +1,43 @@
+"""Vérification Ed25519 des paiements synchronisés (SYNC_VERIFY_SIGNATURES)."""
+import nacl.signing
+import pytest
+
+from app.core.config import settings
+from app.schemas.transaction import SingleTransaction
+from app.services import signatures
+from helpers import balance, batch, signed_tx
+
+
+@pytest.fixture
+def verifying(monkeypatch):
+    monkeypatch.setattr(settings, "SYNC_VERIFY_SIGNATURES", True)
+
+
+def test_valid_signature_is_ingested_and_tampered_one_rejected(client, make_user, verifying):
+    payer = nacl.signing.SigningKey.generate()
+    make_user(payer.verify_key.encode().hex())
+    merchant_phone, merchant_pk = make_user()
+
+    valid = signed_tx(payer, merchant_phone, 1000)
+    tampered = dict(signed_tx(payer, merchant_phone, 10), amount=10_000)   # montant modifié après signature
+    other_merchant = signed_tx(payer, "autre-marchand", 500)               # contrat signé pour un autre marchand
+
+    report = client.post("/transactions/sync", json=batch(merchant_pk, [valid, tampered, other_merchant])).json()
+    assert (report["processed"], report["failed"]) == (1, 2)
+    assert {e["uuid"]: e["msg"] for e in report["errors"]} == {
+        tampered["uuid"]: "Signature Ed25519 invalide", other_merchant["uuid"]: "Signature Ed25519 invalide",
+    }
+    assert balance(client, merchant_phone)["balance_atomic"] == 51000
+
+
+def test_pooled_verification_keeps_verdict_order(monkeypatch):
+    monkeypatch.setattr(settings, "SIGNATURE_VERIFY_CHUNK_SIZE", 3)
+    key = nacl.signing.SigningKey.generate()
+    txs = [SingleTransaction.model_validate(signed_tx(key, "m", amount)) for amount in range(1, 11)]
+    txs[4].signature = "00" * 64
+    txs[7].sender_pk = "pas-une-clé"
+
+    report = {"failed": 0, "errors": []}
+    valid = signatures.filter_valid(txs, signatures.merchant_tag("m"), report)
+    assert [tx.amount for tx in valid] == [1, 2, 3, 4, 6, 7, 9, 10]
+    assert [e["uuid"] for e in report["errors"]] == [txs[4].uuid, txs[7].uuid]
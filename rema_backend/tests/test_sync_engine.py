@@ -0,0 +1,72 @@
+"""
+Ingestion ensembliste (sync_engine.apply_transactions) : même rapport que l'ancienne boucle
+ligne à ligne — doublons ignorés sans erreur, payeur inconnu crédité au marchand seul,
+ligne en échec isolée (repli ligne par ligne) sans perdre les autres.
+"""
+from sqlalchemy import select
+
+from app.models.transaction import Transaction
+from app.services import sync_engine
+from helpers import balance, batch, offline_tx
+
+
+def sync(client, merchant_pk, txs):
+    response = client.post("/transactions/sync", json=batch(merchant_pk, txs))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_in_batch_duplicates_are_skipped_silently(client, make_user):
+    merchant_phone, merchant_pk = make_user()
+    payer_phone, payer_pk = make_user()
+    client.post("/users/recharge-offline", json={"phone": payer_phone, "amount": 5000})
+    first = offline_tx(payer_pk, 1000)
+    same_uuid = offline_tx(payer_pk, 1000, uuid=first["uuid"])
+    same_nonce = offline_tx(payer_pk, 1000, nonce=first["nonce"])
+
+    report = sync(client, merchant_pk, [first, same_uuid, same_nonce])
+    assert (report["processed"], report["failed"], report["errors"], report["status"]) == (1, 0, [], "success")
+    assert balance(client, merchant_phone)["balance_atomic"] == 51000
+    assert balance(client, payer_phone)["offline_vault_atomic"] == 4000
+
+
+def test_already_synced_rows_are_skipped_and_new_ones_kept(client, make_user):
+    merchant_phone, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    old = offline_tx(payer_pk, 1000)
+    sync(client, merchant_pk, [old])
+
+    report = sync(client, merchant_pk, [old, offline_tx(payer_pk, 300)])
+    assert (report["processed"], report["failed"]) == (1, 0)
+    assert balance(client, merchant_phone)["balance_atomic"] == 51300
+
+
+def test_unknown_sender_credits_the_merchant_only(client, make_user, db):
+    merchant_phone, merchant_pk = make_user()
+    tx = offline_tx("ff" * 32, 700)
+
+    report = sync(client, merchant_pk, [tx])
+    assert (report["processed"], report["failed"]) == (1, 0)
+    assert balance(client, merchant_phone)["balance_atomic"] == 50700
+    assert db.execute(select(Transaction.amount_atomic).where(Transaction.transaction_uuid == tx["uuid"])).scalar() == 700
+
+
+def test_failing_row_falls_back_to_one_by_one_inserts(client, make_user, monkeypatch):
+    merchant_phone, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    good, bad, other = offline_tx(payer_pk, 100), offline_tx(payer_pk, 200), offline_tx(payer_pk, 400)
+
+    to_row = sync_engine._to_row
+
+    def broken_row(tx, merchant, suspicious=False):
+        row = to_row(tx, merchant, suspicious)
+        if tx.uuid == bad["uuid"]:
+            row["receiver_pubk_hash"] = None   # NOT NULL : fait échouer l'INSERT groupé, pas un conflit
+        return row
+
+    monkeypatch.setattr(sync_engine, "_to_row", broken_row)
+    report = sync(client, merchant_pk, [good, bad, other])
+
+    assert (report["processed"], report["failed"], report["status"]) == (2, 1, "partial_success")
+    assert [e["uuid"] for e in report["errors"]] == [bad["uuid"]]
+    assert balance(client, merchant_phone)["balance_atomic"] == 50500
@@ -0,0 +1,137 @@
+"""File de jobs de sync : reprise des jobs abandonnés, plafond de tentatives."""
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.services import sync_jobs
+
+LEASE = 300
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(sync_jobs.settings, "SYNC_JOB_LEASE_SECONDS", LEASE)
+    monkeypatch.setattr(sync_jobs.settings, "SYNC_JOB_MAX_ATTEMPTS", 3)
+    return sync_jobs.JobQueue(str(tmp_path / "jobs.db"))
+
+
+def expire(queue, batch_id: str):
+    """Le worker qui tenait le job a disparu : son bail est dépassé."""
+    queue._conn().execute(
+        "UPDATE sync_jobs SET updated_at = ? WHERE batch_id = ?", (time.time() - LEASE - 1, batch_id)
+    )
+
+
+def test_submit_is_idempotent_per_batch_id(queue):
+    first, created = queue.submit("b1", "merchant", "application/json", b"{}")
+    again, created_again = queue.submit("b1", "other", "application/json", b"[]")
+    assert created and not created_again
+    assert again["job_id"] == first["job_id"] and again["merchant_pk"] == "merchant"
+
+
+def test_abandoned_job_is_reclaimed_until_the_attempt_cap(queue):
+    queue.submit("crash", "merchant", "application/json", b"{}")
+    for attempt in (1, 2, 3):
+        job = queue.claim()
+        assert (job["batch_id"], job["attempts"]) == ("crash", attempt)
+        # Un bail en cours n'est pas repris
+        assert queue.claim() is None
+        expire(queue, "crash")
+
+    # 3 workers tombés : le job n'est plus repris, il échoue
+    assert queue.claim() is None
+    row = queue.get("crash")
+    assert row["status"] == sync_jobs.FAILED
+    assert json.loads(row["report"])["status"] == "failed"
+    assert queue.depth() == 0
+
+
+def test_failed_attempts_are_retried_then_failed(queue, monkeypatch):
+    queue.submit("boom", "merchant", "application/json", b"not json")
+
+    def explode(*args):
+        raise RuntimeError("base indisponible")
+
+    monkeypatch.setattr(sync_jobs.sync_pipeline, "decode_body", explode)
+    monkeypatch.setattr(sync_jobs, "get_queue", lambda: queue)
+
+    for attempt in (1, 2, 3):
+        job = queue.claim()
+        assert job["attempts"] == attempt
+        asyncio.run(sync_jobs.process(job))
+    assert queue.get("boom")["status"] == sync_jobs.FAILED
+    assert queue.claim() is None
+
+
+def test_renew_only_extends_the_callers_attempt(queue):
+    queue.submit("long", "merchant", "application/json", b"{}")
+    job = queue.claim()
+    expire(queue, "long")
+    assert queue.renew("long", job["attempts"])
+    # Bail renouvelé : le job n'est pas repris par un autre worker
+    assert queue.claim() is None
+
+    expire(queue, "long")
+    stolen = queue.claim()
+    assert stolen["attempts"] == 2
+    # L'ancien worker a perdu son bail : il ne prolonge pas celui du nouveau
+    assert not queue.renew("long", job["attempts"])
+
+
+def test_long_job_keeps_its_lease_while_running(queue, monkeypatch):
+    monkeypatch.setattr(sync_jobs.settings, "SYNC_JOB_LEASE_SECONDS", 0.3)
+    monkeypatch.setattr(sync_jobs.settings, "SYNC_JOB_POLL_SECONDS", 0.05)
+    monkeypatch.setattr(sync_jobs, "get_queue", lambda: queue)
+    queue.submit("slow", "merchant", "application/json", b"{}")
+    job = queue.claim()
+    reclaimed = []
+
+    @asynccontextmanager
+    async def no_db():
+        yield None
+
+    async def slow_batch(runner, batch, report, source):
+        # Le batch dure 3 baux ; pendant ce temps un autre worker tente de prendre le job
+        for _ in range(9):
+            await asyncio.sleep(0.1)
+            reclaimed.append(queue.claim())
+        return report
+
+    monkeypatch.setattr(sync_jobs.sync_pipeline, "decode_body", lambda *args: None)
+    monkeypatch.setattr(sync_jobs.sync_pipeline, "run_batch", slow_batch)
+    monkeypatch.setattr(sync_jobs, "open_db_runner", no_db)
+    asyncio.run(sync_jobs.process(job))
+
+    assert reclaimed == [None] * 9
+    row = queue.get("slow")
+    assert (row["status"], row["attempts"]) == (sync_jobs.DONE, 1)
+
+
+def test_workers_start_on_demand(client, monkeypatch):
+    import main
+
+    started = []
+
+    async def idle_worker():
+        started.append(1)
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(sync_jobs.settings, "SYNC_JOB_WORKERS", 2)
+    monkeypatch.setattr(sync_jobs, "worker_loop", idle_worker)
+
+    async def scenario():
+        # Ni SYNC_ASYNC_JOBS ni job en attente : le démarrage ne lance aucun worker
+        async with main.lifespan(main.app):
+            assert not sync_jobs._workers
+            # 1er batch mis en file : les workers démarrent, une seule fois
+            sync_jobs.ensure_workers()
+            sync_jobs.ensure_workers()
+            await asyncio.sleep(0)
+            assert len(sync_jobs._workers) == 2
+        assert not sync_jobs._workers
+
+    asyncio.run(scenario())
+    assert started == [1, 1]
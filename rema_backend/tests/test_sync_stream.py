@@ -0,0 +1,74 @@
+"""Sync en streaming NDJSON : découpage des lignes, checkpoints par batch_id."""
+import asyncio
+import json
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.sync_checkpoint import SyncCheckpoint
+from app.schemas.transaction import TransactionBatchHeader
+from app.services import sync_stream
+from helpers import balance, offline_tx
+
+NDJSON = {"Content-Type": sync_stream.CONTENT_TYPE}
+
+
+def collect(chunks):
+    async def produce():
+        for chunk in chunks:
+            yield chunk
+
+    async def run():
+        return [line async for line in sync_stream.iter_lines(produce())]
+
+    return asyncio.run(run())
+
+
+def test_iter_lines_across_chunk_boundaries():
+    body = b"".join(b'{"n":%d}\n' % i for i in range(1000)) + b'{"n":"last"}'
+    chunks = [body[i:i + 37] for i in range(0, len(body), 37)]
+    assert collect(chunks) == body.split(b"\n")
+    # Plusieurs milliers de lignes dans un seul morceau, lignes vides ignorées
+    assert collect([b"a\n\n  b \r\n", b"c"]) == [b"a", b"b", b"c"]
+
+
+def test_iter_lines_rejects_an_oversized_line(monkeypatch):
+    monkeypatch.setattr(sync_stream.settings, "SYNC_STREAM_MAX_LINE_BYTES", 16)
+    with pytest.raises(HTTPException) as error:
+        collect([b"ok\n", b"x" * 10, b"x" * 10])
+    assert error.value.status_code == 413
+
+
+def test_stream_upload_is_resumable_and_idempotent(client, make_user):
+    merchant_phone, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    header = {"merchant_pk": merchant_pk, "batch_id": uuid.uuid4().hex, "device_id": "device", "count": 3,
+              "sync_timestamp": "t"}
+    lines = [json.dumps(header)] + [json.dumps(offline_tx(payer_pk, amount=100)) for _ in range(3)]
+    body = "\n".join(lines).encode()
+
+    first = client.post("/transactions/sync", content=body, headers=NDJSON).json()
+    assert (first["processed"], first["status"]) == (3, "success")
+    assert client.post("/transactions/sync", content=body, headers=NDJSON).json() == first
+    assert balance(client, merchant_phone)["balance_atomic"] == 50300
+
+
+def test_concurrent_first_checkpoint_returns_the_winner_progress(db, monkeypatch):
+    header = TransactionBatchHeader(merchant_pk="m" * 64, batch_id=uuid.uuid4().hex, device_id="d", count=1,
+                                    sync_timestamp="t")
+    # L'autre upload a commité son 1er paquet entre notre load_checkpoint et notre save_checkpoint
+    winner = sync_stream.sync_engine.new_report()
+    winner["processed"] = 7
+    db.add(SyncCheckpoint(batch_id=header.batch_id, merchant_pk=header.merchant_pk, rows_done=7,
+                          report_json=json.dumps(winner), status="IN_PROGRESS"))
+    db.commit()
+    db.expunge_all()
+    stale = [True]
+    get = db.get
+    monkeypatch.setattr(db, "get", lambda *args, **kwargs: None if stale and stale.pop() else get(*args, **kwargs))
+
+    with pytest.raises(sync_stream.ConcurrentUpload) as race:
+        sync_stream.save_checkpoint(db, header, 5, sync_stream.sync_engine.new_report(), completed=False)
+    assert race.value.report["processed"] == 7
+    assert db.get(SyncCheckpoint, header.batch_id).rows_done == 7
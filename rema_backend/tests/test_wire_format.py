@@ -0,0 +1,70 @@
+"""
+Format binaire : même identité (uuid, nonce) et même signature qu'en JSON ;
+seul le binaire (CRC32 vérifié) alimente integrity_checksum.
+"""
+import zlib
+
+import nacl.signing
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.models.transaction import Transaction
+from app.schemas.transaction import TransactionBatchRequest
+from app.services import wire_format
+from helpers import balance, batch, binary, offline_tx, signed_tx
+
+
+def stored_checksum(db, tx_uuid: str):
+    return db.execute(select(Transaction.integrity_checksum).where(Transaction.transaction_uuid == tx_uuid)).scalar_one()
+
+
+def test_json_checksum_is_not_trusted(client, make_user, db):
+    _, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    tx = offline_tx(payer_pk, checksum="deadbeef")
+
+    assert client.post("/transactions/sync", json=batch(merchant_pk, [tx])).json()["processed"] == 1
+    assert stored_checksum(db, tx["uuid"]) is None
+
+
+def test_binary_checksum_is_verified_then_stored(client, make_user, db):
+    _, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    good = offline_tx(payer_pk, receiver_pk=merchant_pk)
+    corrupted = offline_tx(payer_pk, receiver_pk=merchant_pk)
+    body = bytearray(wire_format.encode_batch(TransactionBatchRequest.model_validate(batch(merchant_pk, [good, corrupted]))))
+    body[-1] ^= 0xFF
+
+    report = client.post("/transactions/sync", content=bytes(body),
+                         headers={"Content-Type": wire_format.CONTENT_TYPE}).json()
+    assert report["processed"] == 1
+    assert [e["uuid"] for e in report["errors"]] == [corrupted["uuid"]]
+
+    record = wire_format.encode_record(TransactionBatchRequest.model_validate(batch(merchant_pk, [good])).transactions[0])
+    assert stored_checksum(db, good["uuid"]) == f"{zlib.crc32(record[:wire_format.CRC_OFFSET]):08x}"
+
+
+def test_same_payment_has_one_identity_in_both_formats(client, make_user):
+    merchant_phone, merchant_pk = make_user()
+    _, payer_pk = make_user()
+    json_first = offline_tx(payer_pk, receiver_pk=merchant_pk)
+    binary_first = offline_tx(payer_pk, receiver_pk=merchant_pk)
+
+    assert client.post("/transactions/sync", json=batch(merchant_pk, [json_first])).json()["processed"] == 1
+    assert client.post("/transactions/sync", **binary(batch(merchant_pk, [binary_first]))).json()["processed"] == 1
+
+    # Chaque paiement renvoyé dans l'autre format est reconnu comme doublon
+    assert client.post("/transactions/sync", **binary(batch(merchant_pk, [json_first]))).json()["processed"] == 0
+    assert client.post("/transactions/sync", json=batch(merchant_pk, [binary_first])).json()["processed"] == 0
+    assert balance(client, merchant_phone)["balance_atomic"] == 52000
+
+
+def test_binary_batch_keeps_mobile_signature_valid(client, make_user, monkeypatch):
+    monkeypatch.setattr(settings, "SYNC_VERIFY_SIGNATURES", True)
+    payer = nacl.signing.SigningKey.generate()
+    merchant_phone, merchant_pk = make_user()
+    make_user(payer.verify_key.encode().hex())
+
+    tx = signed_tx(payer, merchant_phone, receiver_pk=merchant_pk)
+    report = client.post("/transactions/sync", **binary(batch(merchant_pk, [tx]))).json()
+    assert (report["processed"], report["failed"]) == (1, 0)